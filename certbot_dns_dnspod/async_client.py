@@ -0,0 +1,512 @@
+# -*- coding: utf-8 -*-
+"""Asyncio DNSPod Client
+
+Requires Python 3 and aiohttp, install with `certbot-dns-dnspod[async]`.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+
+from certbot import errors
+
+from .dnspod_client import BaseDNSPodClient
+from .dnspod_client import DEFAULT_CONNECT_TIMEOUT
+from .dnspod_client import DEFAULT_POOL_SIZE
+from .dnspod_client import DEFAULT_READ_TIMEOUT
+from .dnspod_client import RECORD_LIST_PAGE_SIZE
+from .scheduler import RetryableError
+from .scheduler import UnavailableError
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+DEFAULT_ASYNC_MAX_CONCURRENCY = 100
+
+# aiohttp < 3.10 has no dedicated connect timeout error
+_CONNECT_TIMEOUT_ERRORS = tuple(
+    getattr(aiohttp, name) for name in ('ConnectionTimeoutError',)
+    if hasattr(aiohttp, name))
+
+
+class AsyncSingleFlight(SingleFlight):
+    """`SingleFlight` of coroutines running on one event loop
+
+    Callers of a key in flight await the future of the first one instead
+        of blocking the loop.
+    """
+
+    async def do(self, key, zone, func):
+        """
+        Run a read, unless an identical one is in flight or cached
+
+        :param key: hashable identity of the read.
+        :param str zone: zone the read depends on, None if any.
+        :param callable func: returns a coroutine running the read.
+        :returns: result of the coroutine, shared by the callers of key.
+        :raises Exception: the error the coroutine raised.
+        """
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > time.time():
+                return cached[1]
+
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = \
+                    asyncio.get_event_loop().create_future()
+                generation = self._generation(zone)
+            else:
+                generation = None
+
+        if generation is None:
+            return await asyncio.shield(call)
+
+        try:
+            result = await func()
+        except BaseException as e:
+            with self._lock:
+                del self._calls[key]
+            if isinstance(e, asyncio.CancelledError):
+                call.cancel()
+            else:
+                call.set_exception(e)
+                # followers get the error, it is not left unretrieved
+                call.exception()
+            raise
+
+        with self._lock:
+            del self._calls[key]
+            if self.ttl > 0 and self._generation(zone) == generation:
+                self._cache[key] = (time.time() + self.ttl, result, zone)
+        call.set_result(result)
+
+        return result
+
+
+class AsyncDNSPodClient(BaseDNSPodClient):
+    """Asyncio DNSPod client sharing a pooled aiohttp session
+
+    It builds requests and parses responses like `DNSPodClient`, so
+        add/del TXT semantics and errors are the same, while hundreds of
+        record operations can be in flight on one event loop.
+    """
+
+    def __init__(self, api_token, ttl, contact_email,
+                 pool_size=DEFAULT_POOL_SIZE, keep_alive=True,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT,
+                 max_concurrency=DEFAULT_ASYNC_MAX_CONCURRENCY,
+                 **kwargs):
+        """Init AsyncDNSPodClient
+
+        Parameters are the same as `DNSPodClient`, max_concurrency caps
+            the record operations in flight at the same time. Record
+            pools and batch jobs are not supported.
+
+        :raises errors.PluginError: if pool or batch is given.
+        """
+        super(AsyncDNSPodClient, self).__init__(
+            api_token, ttl, contact_email, pool_size=pool_size,
+            keep_alive=keep_alive, connect_timeout=connect_timeout,
+            read_timeout=read_timeout, max_concurrency=max_concurrency,
+            **kwargs)
+        if self.pool is not None or self.batch:
+            raise errors.PluginError(
+                '[DNSPod] Record pools and batch jobs are not supported '
+                'by the asyncio client')
+        self.reads = AsyncSingleFlight(self.reads.ttl)
+        self._semaphore = None
+        self._zone_index_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """Close pooled connections
+
+        The client can still be used afterwards, a new pool will be
+        created on the next API call.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def add_txt_record(self, full_domain, record_content):
+        """Add TXT record
+
+        :param str full_domain: Full domain.
+        :param str record_content: Value that the record should be set.
+        :raises errors.PluginError: if fails to create the record.
+        """
+        await self.add_txt_records([(full_domain, record_content)])
+
+    async def del_txt_record(self, full_domain, record_content):
+        """Delete TXT record if record value is match
+
+        :param str full_domain: Full domain.
+        :param str record_content: Value that the record should be match.
+        :raises errors.PluginError: if fails to delete the record.
+        """
+        await self.del_txt_records([(full_domain, record_content)])
+
+    async def add_txt_records(self, records):
+        """Add TXT records, listing existing records once per zone
+
+        See `DNSPodClient.add_txt_records`.
+
+        :param records: (full_domain, record_content) pairs.
+        :type records: Iterable[Tuple[str, str]]
+        :raises errors.PluginError: if fails to create any record, the
+            error lists every failed domain.
+        """
+        zones = await self._group_records_by_zone(records)
+        listings = await asyncio.gather(*[
+            self._list_txt_records(base_domain, names)
+            for base_domain, names in zones.items()])
+
+        tasks = []
+        for (base_domain, names), record_ids in zip(zones.items(), listings):
+            for full_domain, value in self._plan_additions(names, record_ids):
+                tasks.append((full_domain, value, self._create_txt_record,
+                              (full_domain, value, base_domain)))
+
+        succeeded, failures = await self._run_tasks(tasks)
+        if not failures:
+            return
+
+        created = [(task[0], task[1]) for task, _ in succeeded]
+        if created:
+            try:
+                await self.del_txt_records(created)
+            except errors.PluginError as e:
+                logger.error('[DNSPod] Rollback of created TXT records '
+                             'failed: {0}'.format(e))
+
+        raise self._failures_error('Add TXT records', failures, len(tasks))
+
+    async def del_txt_records(self, records):
+        """Delete TXT records whose value match, listing once per zone
+
+        See `DNSPodClient.del_txt_records`.
+
+        :param records: (full_domain, record_content) pairs.
+        :type records: Iterable[Tuple[str, str]]
+        :raises errors.PluginError: if fails to list records of a zone,
+            or removing records raises, the error lists every failed domain.
+        """
+        journaled, unjournaled = self._split_journaled(records)
+
+        tasks = [(full_domain, value, self._remove_record,
+                  (record_id, full_domain, zone))
+                 for full_domain, value, record_id, zone in journaled]
+
+        zones = await self._group_records_by_zone(unjournaled)
+        listings = await asyncio.gather(*[
+            self._list_txt_records(base_domain, names)
+            for base_domain, names in zones.items()])
+
+        for (base_domain, names), record_ids in zip(zones.items(), listings):
+            for full_domain, value, record_id in self._plan_removals(
+                    names, record_ids):
+                tasks.append((full_domain, value, self._remove_record,
+                              (record_id, full_domain, base_domain)))
+
+        succeeded, failures = await self._run_tasks(tasks)
+
+        self._journal_removed((task[0], task[1])
+                              for task, removed in succeeded if removed)
+
+        if failures:
+            raise self._failures_error(
+                'Delete TXT records', failures, len(tasks))
+
+    async def _run_tasks(self, tasks):
+        """
+        Run record API calls, at most `max_concurrency` at the same time
+
+        :param tasks: (full_domain, record_content, func, args) tuples,
+            func(*args) is a coroutine doing the API call.
+        :returns: (succeeded, failures), (task, result) pairs of succeeded
+            tasks and (full_domain, exception) pairs of failed tasks.
+        :rtype: Tuple[list, List[Tuple[str, Exception]]]
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(task):
+            async with self._semaphore:
+                return await task[2](*task[3])
+
+        results = await asyncio.gather(
+            *[run(task) for task in tasks], return_exceptions=True)
+
+        succeeded = []
+        failures = []
+        for task, result in zip(tasks, results):
+            if isinstance(result, Exception):
+                failures.append((task[0], result))
+            else:
+                succeeded.append((task, result))
+
+        return succeeded, failures
+
+    async def _group_records_by_zone(self, records):
+        """
+        Group records by the zone and the sub_domain they belong to
+
+        :param records: (full_domain, record_content) pairs.
+        :rtype: OrderedDict[str, OrderedDict[str, Tuple[str, List[str]]]]
+        """
+        records = list(records)
+        if not records:
+            return {}
+
+        return self._group_with_index(await self._get_zone_index(), records)
+
+    async def _create_txt_record(self, full_domain, record_content,
+                                 base_domain):
+        """Create TXT record, see `DNSPodClient._create_txt_record`"""
+        sub_domain, _ = self._split_with_index(self._zone_index, full_domain)
+
+        data = self._create_txt_record_data(sub_domain, base_domain,
+                                            record_content)
+
+        with self._span('create', domain=full_domain):
+            result = await self._do_post(self._get_url('Record.Create'), data)
+
+        return self._parse_create_txt_record(result, full_domain,
+                                             record_content, base_domain)
+
+    async def iter_records(self, base_domain, sub_domain=None,
+                           record_type=None, keyword=None,
+                           page_size=RECORD_LIST_PAGE_SIZE):
+        """Iterate records of a zone, see `DNSPodClient.iter_records`"""
+        offset = 0
+        has_more = True
+
+        while has_more:
+            data = self._list_records_data(base_domain, offset, page_size,
+                                           sub_domain, record_type, keyword)
+            with self._span('list', zone=base_domain, offset=offset):
+                result = await self._do_post(self._get_url('Record.List'),
+                                             data)
+
+            records, has_more = self._parse_list_records(result, data)
+            offset += len(records)
+            for record in records:
+                yield record
+
+    async def _list_txt_records(self, base_domain, sub_domains):
+        """List TXT records, see `DNSPodClient._list_txt_records`"""
+        records = [record async for record in self.iter_records(
+            base_domain, record_type='TXT',
+            **self._list_txt_records_filters(sub_domains))]
+
+        return self._index_records(records, sub_domains)
+
+    async def _remove_record(self, record_id, full_domain, base_domain):
+        """Remove DNS record, see `DNSPodClient._remove_record`"""
+        data = self._remove_record_data(record_id, base_domain)
+
+        with self._span('remove', domain=full_domain):
+            result = await self._do_post(self._get_url('Record.Remove'), data)
+
+        return self._parse_remove_record(result, full_domain)
+
+    async def _get_zone_index(self):
+        """
+        Get the index of zones in the account, fetching it when expired
+
+        :rtype: ZoneIndex
+        """
+        if self._zone_index_lock is None:
+            self._zone_index_lock = asyncio.Lock()
+
+        async with self._zone_index_lock:
+            if self._zone_index_expired():
+                with self._span('zone_resolution'):
+                    domains = {}
+                    has_more = True
+                    while has_more:
+                        result = await self._do_post(
+                            self._get_url('Domain.List'),
+                            self._list_domains_data(len(domains)))
+                        has_more = self._parse_list_domains(result, domains)
+
+                return self._set_zone_index(domains)
+
+            return self._zone_index
+
+    def _get_session(self):
+        """
+        Get the HTTP session shared by all API calls
+
+        :rtype: aiohttp.ClientSession
+        """
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=max(self.pool_size, self.max_concurrency),
+                force_close=not self.keep_alive)
+            timeout = aiohttp.ClientTimeout(sock_connect=self.timeout[0],
+                                            sock_read=self.timeout[1])
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=timeout,
+                headers={'User-Agent': self.user_agent})
+
+        return self._session
+
+    async def _do_post(self, url, data):
+        """
+        Do request DNSPod API
+
+        Identical concurrent reads are sent once, see `AsyncSingleFlight`.
+
+        :param str url: URL for DNSPod API.
+        :param Dict[str, Any] data: request parameters
+        :returns: API response
+        :rtype: Dict[str, Any]
+        """
+        data = dict(data or {}, **self._common_data())
+        # aiohttp only encodes str values in forms
+        data = dict((key, str(value)) for key, value in data.items())
+
+        action = self._get_action(url)
+        zone = self._request_zone(data)
+        if action in self.READ_ACTIONS:
+            key = (action, json.dumps(data, sort_keys=True))
+            return await self.reads.do(
+                key, zone, lambda: self._post(url, action, data))
+
+        try:
+            return await self._post(url, action, data)
+        finally:
+            # the action may have changed records of the zone
+            self.reads.invalidate(zone)
+
+    async def _post(self, url, action, data):
+        """
+        Send a request under the rate limit, retrying failures
+
+        See `DNSPodClient._post`, the scheduler is not run in a thread
+            so waits don't block the event loop.
+
+        :param str url: URL for DNSPod API.
+        :param str action: action of the URL.
+        :param Dict[str, str] data: request parameters, common ones
+            included.
+        :returns: API response
+        :rtype: Dict[str, Any]
+        """
+        started_at = time.time()
+        deadline = self.scheduler.get_deadline()
+        attempt = 0
+
+        with self._span(action) as span:
+            try:
+                while True:
+                    wait = self.scheduler.reserve()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+
+                    try:
+                        return await self._send(action, data)
+                    except Exception as e:  # pylint: disable=broad-except
+                        delay = self.scheduler.get_retry_delay(
+                            e, attempt, deadline,
+                            lambda e: self._is_retryable(e, action))
+                        if delay is None:
+                            raise
+
+                        attempt += 1
+                        await asyncio.sleep(delay)
+            finally:
+                self._observe_call(url, started_at, attempt + 1)
+                if span is not None:
+                    span['attrs']['attempts'] = attempt + 1
+
+    async def _send(self, action, data):
+        """
+        Send one attempt of a request to the endpoint preferred now
+
+        :param str action: action of the request.
+        :param Dict[str, str] data: request parameters
+        :returns: API response
+        :rtype: Dict[str, Any]
+        """
+        # a retry fails over from an endpoint that just failed
+        base_url = self.endpoints.choose()
+        sent_at = time.time()
+        try:
+            result = await self._send_post(self._get_url(action, base_url),
+                                           data)
+        except Exception as e:
+            if self._is_endpoint_failure(e):
+                self.endpoints.failure(base_url)
+            raise
+
+        self.endpoints.success(base_url, time.time() - sent_at)
+        return result
+
+    async def _send_post(self, url, data):
+        """
+        Send one request to DNSPod API
+
+        :param str url: URL for DNSPod API.
+        :param Dict[str, str] data: request parameters
+        :returns: API response
+        :rtype: Dict[str, Any]
+        :raises RetryableError: If the request failed transiently.
+        """
+        try:
+            async with self._get_session().post(url, data=data) as resp:
+                content = await resp.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self._observe_request(url, 'error')
+            raise
+
+        return self._parse_response(url, resp.status, content,
+                                    len(urlencode(data)))
+
+    def _is_retryable(self, e, action=None):
+        """
+        Tell whether a failed request may be sent again
+
+        Requests that never reached the API and rate limited ones are
+            retried, requests that may have been applied only for
+            `READ_ACTIONS`, see `DNSPodClient._is_retryable`.
+
+        :param Exception e: error raised by `_send_post`.
+        :param str action: action of the request.
+        :rtype: bool
+        """
+        if _CONNECT_TIMEOUT_ERRORS and isinstance(e, _CONNECT_TIMEOUT_ERRORS):
+            return True
+        if isinstance(e, aiohttp.ClientConnectorError):
+            return True
+
+        if isinstance(e, (UnavailableError,
+                          aiohttp.ServerDisconnectedError)):
+            return action in self.READ_ACTIONS
+
+        return isinstance(e, RetryableError)
+
+    @staticmethod
+    def _is_endpoint_failure(e):
+        """
+        Tell whether a failed request counts against its endpoint
+
+        :param Exception e: error raised by `_send_post`.
+        :rtype: bool
+        """
+        return isinstance(e, (UnavailableError,
+                              aiohttp.ClientConnectionError,
+                              asyncio.TimeoutError))
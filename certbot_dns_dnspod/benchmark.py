@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the Authenticator against a FakeDNSPodServer
+
+Runs perform and cleanup for certificates of 1 to 500 SANs and reports
+the API calls per action, per-call latency and wall time:
+
+    python -m certbot_dns_dnspod.benchmark --output results.json \\
+        --baseline baseline.json
+
+With --baseline, it exits with status 1 when a scenario makes more API
+calls than the baseline, so extra `_do_post` calls show up in review.
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import josepy as jose
+from acme import challenges
+from acme import messages
+from certbot import achallenges
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from .dns_dnspod import Authenticator
+from .dnspod_client import DNSPodClient
+from .fake_server import FakeDNSPodServer
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+SANS = (1, 10, 100, 500)
+SHAPES = ('single-zone', 'many-zones', 'wildcard-apex')
+
+DEFAULT_LATENCY = 0.02
+DEFAULT_JITTER = 0.01
+DEFAULT_MAX_CONCURRENCY = 4
+
+API_TOKEN = '10000,benchmark'
+CONTACT_EMAIL = 'benchmark@example.com'
+
+
+class _Config(object):
+    """Stand-in for certbot's configuration namespace
+
+    Options of the Authenticator take their defaults, unless overridden.
+    """
+
+    def __init__(self, work_dir, **kwargs):
+        self.work_dir = work_dir
+
+        def add(name, default=None, **_):
+            setattr(self, 'dnspod_' + name.replace('-', '_'), default)
+
+        Authenticator.add_parser_arguments(add)
+
+        for name, value in kwargs.items():
+            setattr(self, 'dnspod_' + name, value)
+
+
+def get_domains(shape, sans):
+    """
+    Get the SANs of a certificate
+
+    :param str shape: 'single-zone' for SANs of one zone, 'many-zones' for
+        a zone per SAN, 'wildcard-apex' for (*.name, name) pairs, whose
+        validations share a TXT name.
+    :param int sans: number of SANs.
+    :returns: (zones, domains)
+    :rtype: Tuple[List[str], List[str]]
+    """
+    if shape == 'single-zone':
+        return (['example.com'],
+                ['san{0}.example.com'.format(i) for i in range(sans)])
+
+    if shape == 'many-zones':
+        zones = ['example{0}.com'.format(i) for i in range(sans)]
+        return zones, list(zones)
+
+    if shape == 'wildcard-apex':
+        domains = []
+        for i in range((sans + 1) // 2):
+            name = 'san{0}.example.com'.format(i)
+            domains.extend([name, '*.' + name])
+        return ['example.com'], domains[:sans]
+
+    raise ValueError('Unknown shape: {0}'.format(shape))
+
+
+def get_achalls(domains, account_key):
+    """
+    Get dns-01 challenges of domains
+
+    :param List[str] domains: domains to validate.
+    :param jose.JWK account_key: key of the ACME account.
+    :rtype: List[achallenges.KeyAuthorizationAnnotatedChallenge]
+    """
+    achalls = []
+
+    for domain in domains:
+        # ACME authorizes the base name of a wildcard
+        if domain.startswith('*.'):
+            domain = domain[2:]
+        challb = messages.ChallengeBody(
+            chall=challenges.DNS01(token=os.urandom(16)),
+            uri='https://acme.invalid/chall',
+            status=messages.STATUS_PENDING)
+        achalls.append(achallenges.KeyAuthorizationAnnotatedChallenge(
+            challb=challb, domain=domain,
+            account_key=account_key))
+
+    return achalls
+
+
+def percentile(samples, percent):
+    """
+    Get a percentile of samples, nearest rank
+
+    :param List[float] samples: sorted samples.
+    :param float percent: percentile like 99.
+    :rtype: float
+    """
+    if not samples:
+        return 0
+
+    rank = int(math.ceil(percent / 100.0 * len(samples)))
+
+    return samples[min(len(samples), max(1, rank)) - 1]
+
+
+@contextmanager
+def record_calls(samples):
+    """
+    Record the action and duration of every `_do_post` call
+
+    :param list samples: (action, seconds) pairs appended by the calls.
+    """
+    do_post = DNSPodClient._do_post
+
+    def timed_do_post(client, url, data):
+        started_at = time.time()
+        try:
+            return do_post(client, url, data)
+        finally:
+            samples.append((url.rsplit('/', 1)[-1],
+                            time.time() - started_at))
+
+    DNSPodClient._do_post = timed_do_post
+    try:
+        yield
+    finally:
+        DNSPodClient._do_post = do_post
+
+
+def summarize_latency(samples):
+    """
+    Get p50 and p99 latency, per action and over all calls
+
+    :param samples: (action, seconds) pairs.
+    :rtype: Dict[str, Dict[str, float]]
+    """
+    by_action = OrderedDict([('all', [])])
+    for action, seconds in samples:
+        by_action.setdefault(action, []).append(seconds)
+        by_action['all'].append(seconds)
+
+    summary = OrderedDict()
+    for action, seconds in sorted(by_action.items()):
+        seconds.sort()
+        summary[action] = OrderedDict([
+            ('p50', round(percentile(seconds, 50), 6)),
+            ('p99', round(percentile(seconds, 99), 6)),
+        ])
+
+    return summary
+
+
+def run_scenario(shape, sans, account_key, latency=DEFAULT_LATENCY,
+                 jitter=DEFAULT_JITTER,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, rate_limit=0):
+    """
+    Run perform and cleanup of a certificate against a fake API
+
+    :param str shape: see `get_domains`.
+    :param int sans: number of SANs.
+    :param jose.JWK account_key: key of the ACME account.
+    :param float latency: Seconds every API request takes at least.
+    :param float jitter: Max random seconds added to the latency.
+    :param int max_concurrency: max-concurrency of the Authenticator.
+    :param float rate_limit: rate-limit of the Authenticator.
+    :returns: result of the scenario.
+    :rtype: Dict[str, Any]
+    """
+    zones, domains = get_domains(shape, sans)
+    achalls = get_achalls(domains, account_key)
+    work_dir = tempfile.mkdtemp(prefix='dnspod-benchmark-')
+
+    try:
+        with FakeDNSPodServer(zones=zones, latency=latency, jitter=jitter,
+                              api_token=API_TOKEN, seed=0) as server:
+            credentials = os.path.join(work_dir, 'credentials.ini')
+            with open(credentials, 'w') as f:
+                f.write('dnspod_api_token = "{0}"\n'
+                        'dnspod_dns_ttl = 600\n'
+                        'dnspod_contact_email = "{1}"\n'
+                        'dnspod_api_url = "{2}"\n'.format(
+                            API_TOKEN, CONTACT_EMAIL, server.base_url))
+            os.chmod(credentials, 0o600)
+
+            config = _Config(
+                work_dir, credentials=credentials, propagation_seconds=0,
+                max_concurrency=max_concurrency, rate_limit=rate_limit)
+            authenticator = Authenticator(config, 'dnspod')
+
+            phases = OrderedDict()
+            samples = []
+            for phase, func in (('perform', authenticator.perform),
+                                ('cleanup', authenticator.cleanup)):
+                phase_samples = []
+                started_at = time.time()
+                with record_calls(phase_samples):
+                    func(achalls)
+                phases[phase] = OrderedDict([
+                    ('wall_time', round(time.time() - started_at, 6)),
+                    ('calls', OrderedDict(sorted(Counter(
+                        action for action, _ in phase_samples).items()))),
+                ])
+                samples.extend(phase_samples)
+
+            leftover = sum(len(server.records(zone)) for zone in zones)
+            requests = OrderedDict(sorted(server.calls.items()))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return OrderedDict([
+        ('name', '{0}/{1}'.format(shape, sans)),
+        ('shape', shape),
+        ('sans', sans),
+        ('zones', len(zones)),
+        ('wall_time', round(sum(p['wall_time'] for p in phases.values()), 6)),
+        ('calls', OrderedDict(sorted(Counter(
+            action for action, _ in samples).items()))),
+        ('requests', requests),
+        ('latency', summarize_latency(samples)),
+        ('phases', phases),
+        ('leftover_records', leftover),
+    ])
+
+
+def compare(results, baseline):
+    """
+    Find scenarios making more API calls than the baseline
+
+    :param results: results of `run_scenario`.
+    :param baseline: results of a previous run.
+    :returns: messages describing each regression.
+    :rtype: List[str]
+    """
+    previous = dict((result['name'], result) for result in baseline)
+    regressions = []
+
+    for result in results:
+        if result['name'] not in previous:
+            continue
+        calls = previous[result['name']]['calls']
+        for action, count in result['calls'].items():
+            if count > calls.get(action, 0):
+                regressions.append('{0}: {1} calls of {2}, was {3}'.format(
+                    result['name'], count, action, calls.get(action, 0)))
+
+    return regressions
+
+
+def _format_row(result):
+    calls = ', '.join('{0}={1}'.format(action, count)
+                      for action, count in result['calls'].items())
+    latency = result['latency']['all']
+    return '{0:<20} {1:>9.3f}s  p50={2:.4f}s p99={3:.4f}s  {4}'.format(
+        result['name'], result['wall_time'], latency['p50'], latency['p99'],
+        calls)
+
+
+def main(argv=None):
+    """Run the benchmark from the command line"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark the DNSPod authenticator against a local '
+        'fake DNSPod API.')
+    parser.add_argument('--sans', default=','.join(str(n) for n in SANS),
+                        help='Comma separated numbers of SANs.')
+    parser.add_argument('--shapes', default=','.join(SHAPES),
+                        help='Comma separated certificate shapes, '
+                        'of: {0}.'.format(', '.join(SHAPES)))
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY,
+                        help='Seconds every API request takes at least.')
+    parser.add_argument('--jitter', type=float, default=DEFAULT_JITTER,
+                        help='Max random seconds added to the latency.')
+    parser.add_argument('--max-concurrency', type=int,
+                        default=DEFAULT_MAX_CONCURRENCY,
+                        help='max-concurrency of the authenticator.')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='rate-limit of the authenticator, '
+                        '0 for unlimited.')
+    parser.add_argument('--output', help='Write results as JSON to a file.')
+    parser.add_argument('--baseline',
+                        help='JSON results of a previous run, exit with 1 '
+                        'if API calls increased.')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    account_key = jose.JWKRSA(key=rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend()))
+
+    results = []
+    for shape in args.shapes.split(','):
+        for sans in args.sans.split(','):
+            result = run_scenario(
+                shape.strip(), int(sans), account_key, latency=args.latency,
+                jitter=args.jitter, max_concurrency=args.max_concurrency,
+                rate_limit=args.rate_limit)
+            print(_format_row(result))
+            results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'settings': OrderedDict([
+                    ('latency', args.latency),
+                    ('jitter', args.jitter),
+                    ('max_concurrency', args.max_concurrency),
+                    ('rate_limit', args.rate_limit),
+                ]),
+                'results': results,
+            }, f, indent=2)
+            f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'])
+        for regression in regressions:
+            print('API calls regressed, {0}'.format(regression))
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Deferred cleanup of challenge records, flushed in the background"""
+
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from certbot import errors
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+DEFAULT_FLUSH_DELAY = 5
+MAX_FLUSH_WORKERS = 4
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_cleanup_queue():
+    """
+    Get the cleanup queue of the process, flushed at exit
+
+    :rtype: CleanupQueue
+    """
+    global _queue  # pylint: disable=global-statement
+
+    with _queue_lock:
+        if _queue is None:
+            _queue = CleanupQueue()
+            atexit.register(_queue.flush, at_exit=True)
+
+        return _queue
+
+
+class CleanupQueue(object):
+    """Records to remove once validations are done, off the critical path
+
+    Cleanups queued within flush_delay of the first one are flushed
+        together by a background thread: the records a client queued are
+        removed with one `del_txt_records`, which lists each zone once
+        and removes concurrently, and clients are flushed in parallel.
+        Queued records stay journaled until removed, so the stale record
+        cleanup of a later run removes them if the process dies first,
+        and stay queued until removed, so a background flush cut short
+        by the interpreter exiting leaves them to the atexit flush.
+    """
+
+    def __init__(self, flush_delay=DEFAULT_FLUSH_DELAY):
+        """Init CleanupQueue
+
+        :param float flush_delay: seconds from the first queued cleanup
+            to the flush.
+        """
+        self.flush_delay = flush_delay
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        # (client, records) being removed by a flush
+        self._flushing = []
+        self._timer = None
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(records) for _, records
+                       in self._pending + self._flushing)
+
+    def put(self, client, records):
+        """Queue records for removal
+
+        The client is closed once its records are flushed.
+
+        :param DNSPodClient client: client removing the records.
+        :param records: (full_domain, record_content) pairs.
+        :type records: Iterable[Tuple[str, str]]
+        """
+        with self._lock:
+            for queued_client, queued in self._pending:
+                if queued_client is client:
+                    queued.extend(records)
+                    break
+            else:
+                self._pending.append((client, list(records)))
+
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self, at_exit=False):
+        """Remove all queued records now, errors are logged only
+
+        :param bool at_exit: whether the interpreter is exiting. Thread
+            pools refuse new work by the time atexit handlers run, so
+            clients are then flushed one after the other, each removing
+            its records sequentially. A background flush finds the
+            interpreter exiting too late to do so, and leaves the
+            records to the atexit flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                timer, self._timer = self._timer, None
+                if not at_exit and _interpreter_exiting():
+                    pending = []
+                else:
+                    pending, self._pending = self._pending, []
+                    self._flushing.extend(pending)
+
+            if timer is not None:
+                timer.cancel()
+            if not pending:
+                return
+
+            if at_exit:
+                for client, records in pending:
+                    # `_run_tasks` runs the calls in this thread then
+                    client.max_concurrency = 1
+                    self._remove(client, records, at_exit=True)
+                return
+
+            workers = min(len(pending), MAX_FLUSH_WORKERS)
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    list(executor.map(lambda item: self._remove(*item),
+                                      pending))
+            except RuntimeError:
+                # the interpreter started exiting meanwhile
+                with self._lock:
+                    for item in pending:
+                        if item in self._flushing:
+                            self._flushing.remove(item)
+                            self._pending.append(item)
+
+    def _remove(self, client, records, at_exit=False):
+        """
+        Remove the records queued by a client and close it
+
+        Records are queued again if the removal is interrupted otherwise
+            than by an API error, e.g. by thread pools refusing work
+            once the interpreter exits, for the atexit flush to remove.
+
+        :param DNSPodClient client: client removing the records.
+        :param records: (full_domain, record_content) pairs.
+        :type records: List[Tuple[str, str]]
+        :param bool at_exit: whether this is the atexit flush, the last
+            chance to remove the records.
+        """
+        requeue = False
+        try:
+            client.del_txt_records(records)
+        except errors.PluginError as e:
+            logger.warning('Deferred cleanup of DNSPod records failed, '
+                           'they are left journaled: %s', e)
+        except Exception as e:  # pylint: disable=broad-except
+            if at_exit:
+                logger.warning('Deferred cleanup of DNSPod records failed, '
+                               'they are left journaled: %s', e)
+            else:
+                logger.debug('Deferred cleanup of DNSPod records '
+                             'interrupted, queued again: %s', e)
+                requeue = True
+        finally:
+            client.close()
+            with self._lock:
+                self._flushing.remove((client, records))
+                if requeue:
+                    self._pending.append((client, records))
+
+
+def _interpreter_exiting():
+    """
+    Tell whether the interpreter started exiting
+
+    The main thread is stopped before thread pools are shut down and
+        atexit handlers run.
+
+    :rtype: bool
+    """
+    main_thread = getattr(threading, 'main_thread', None)
+    return main_thread is not None and not main_thread().is_alive()
@@ -2,15 +2,114 @@
 """DNSPod Certbot plugin.
 """
 import logging
+import time
+from contextlib import contextmanager
+
+import zope.component
 import zope.interface
 
+from certbot import errors
 from certbot import interfaces
+from certbot import util
+from certbot.compat import os
 from certbot.plugins import dns_common
 
+from .cleanup_queue import get_cleanup_queue
+from .dnspod_client import DEFAULT_BASE_URL
 from .dnspod_client import DNSPodClient
+from .history import PropagationHistory
+from .journal import RecordJournal
+from .metrics import JSONLinesSink
+from .metrics import Metrics
+from .metrics import PrometheusTextfileSink
+from .pool import RecordPool
+from .propagation import PropagationChecker
+from .propagation import parse_nameservers
+from .shared_cache import SharedCache
+from .shared_cache import account_key
+from .tencentcloud_client import TENCENTCLOUD_BASE_URL
+from .tencentcloud_client import TencentCloudDNSPodClient
+from .tracing import SamplingProfiler
+from .tracing import Tracer
 
 logger = logging.getLogger(__name__)  # pylint: disable=C0103
 
+# Journaled records older than this are left over by crashed runs
+STALE_RECORD_SECONDS = 3600
+
+# Values of the credentials' backend, the legacy dnsapi.cn token API is
+# the default
+BACKEND_DNSPOD = 'dnspod'
+BACKEND_TENCENTCLOUD = 'tencentcloud'
+BACKENDS = (BACKEND_DNSPOD, BACKEND_TENCENTCLOUD)
+
+
+def validate_credentials(credentials):
+    """Check the credentials of the selected backend are set
+
+    :param dns_common.CredentialsConfiguration credentials: parsed
+        credentials INI file.
+    :raises errors.PluginError: If the backend is unknown, or its
+        credentials are missing.
+    """
+    backend = credentials.conf('backend') or BACKEND_DNSPOD
+    if backend not in BACKENDS:
+        raise errors.PluginError(
+            'Unknown DNSPod backend {0}, should be one of: {1}'.format(
+                backend, ', '.join(BACKENDS)))
+
+    if backend == BACKEND_TENCENTCLOUD:
+        credentials.require({
+            'secret_id': 'SecretId of a Tencent Cloud API key',
+            'secret_key': 'SecretKey of a Tencent Cloud API key',
+        })
+    else:
+        credentials.require({'api_token': 'API token for DNSPod API'})
+
+
+def parse_api_urls(value):
+    """
+    Parse the api_url credential into the URLs of the API endpoints
+
+    :param value: comma separated URLs, or the list configobj makes of
+        an unquoted value.
+    :type value: Union[str, List[str], None]
+    :rtype: List[str]
+    """
+    if not value:
+        return []
+    if not isinstance(value, (list, tuple)):
+        value = value.split(',')
+
+    return [url.strip() for url in value if url.strip()]
+
+
+def create_client(credentials, **kwargs):
+    """
+    Create a client of the credentials' backend
+
+    :param dns_common.CredentialsConfiguration credentials: validated
+        credentials INI file.
+    :param kwargs: options of the client, like max_concurrency.
+    :rtype: DNSPodClient
+    """
+    api_url = parse_api_urls(credentials.conf('api_url'))
+
+    if credentials.conf('backend') == BACKEND_TENCENTCLOUD:
+        return TencentCloudDNSPodClient(
+            credentials.conf('secret_id'),
+            credentials.conf('secret_key'),
+            credentials.conf('dns_ttl'),
+            credentials.conf('contact_email'),
+            region=credentials.conf('region'),
+            base_url=api_url or TENCENTCLOUD_BASE_URL, **kwargs)
+
+    return DNSPodClient(
+        credentials.conf('api_token'),
+        credentials.conf('dns_ttl'),
+        credentials.conf('contact_email'),
+        base_url=api_url or DEFAULT_BASE_URL, **kwargs)
+
 
 @zope.interface.implementer(interfaces.IAuthenticator)
 @zope.interface.provider(interfaces.IPluginFactory)
@@ -19,12 +118,73 @@ class Authenticator(dns_common.DNSAuthenticator):
 
     description = "DNSPod Authenticator plugin"
 
+    def __init__(self, *args, **kwargs):
+        super(Authenticator, self).__init__(*args, **kwargs)
+        self._dnspod_client = None
+        self._metrics = None
+        self._tracer = None
+        self._profiler = None
+
     @classmethod
     def add_parser_arguments(cls, add, default_propagation_seconds=10):
         super(Authenticator, cls).add_parser_arguments(
             add, default_propagation_seconds)
 
         add('credentials', help='DNSPod credentials INI file.')
+        add('max-concurrency', type=int, default=4,
+            help='Max number of DNSPod record API calls running '
+            'at the same time.')
+        add('rate-limit', type=float, default=10,
+            help='Max DNSPod API requests per second, 0 for unlimited.')
+        add('batch', action='store_true', default=False,
+            help='Create the TXT records of a run with DNSPod batch jobs '
+            'instead of one API call per record.')
+        add('reuse-records', action='store_true', default=False,
+            help='Park challenge records with a placeholder value at '
+            'cleanup instead of removing them, and reuse them with one '
+            'modify at the next perform.')
+        add('shared-cache', action='store_true', default=False,
+            help='Share zone ids, challenge record ids and the rate-limit '
+            'budget with other certbot processes using the same DNSPod '
+            'account, through a SQLite file in certbot\'s config dir.')
+        add('deferred-cleanup', action='store_true', default=False,
+            help='Queue the removal of challenge records and flush it in '
+            'the background, or at exit, so certbot does not wait for it.')
+        add('reconcile', action='store_true', default=False,
+            help='Make the challenge names hold exactly the values of this '
+            'run, reusing stale records with a modify instead of adding '
+            'records alongside them.')
+        add('reconcile-dry-run', action='store_true', default=False,
+            help='Print the plan and API calls of reconcile, then stop '
+            'before any record is changed.')
+        add('propagation-check', action='store_true', default=False,
+            help='Poll authoritative nameservers until the TXT records are '
+            'visible instead of waiting propagation-seconds.')
+        add('propagation-timeout', type=int, default=120,
+            help='Max seconds to poll nameservers with propagation-check.')
+        add('propagation-percentile', type=float, default=0,
+            help='Wait this percentile, e.g. 95, of the propagation delays '
+            'propagation-check observed for the zones, instead of '
+            'propagation-seconds, which is still waited for zones without '
+            'enough history and is the max wait. With propagation-check, '
+            'it is waited before polling starts.')
+        add('nameservers',
+            help='Comma separated host[:port] of nameservers polled by '
+            'propagation-check instead of the authoritative ones.')
+        add('metrics-textfile',
+            help='Write metrics of DNSPod API calls to this file in '
+            'Prometheus text format, for node_exporter\'s textfile '
+            'collector.')
+        add('metrics-jsonl',
+            help='Append DNSPod API calls and phase durations to this file '
+            'as JSON lines.')
+        add('trace-file',
+            help='Write spans of the run, like zone resolution, listing, '
+            'record changes and propagation wait, to this file in Chrome '
+            'trace event format.')
+        add('profile-file',
+            help='Sample stacks of the plugin phases and write them to this '
+            'file in folded flame graph format.')
 
     def more_info(self):
         return (
@@ -45,13 +205,183 @@ class Authenticator(dns_common.DNSAuthenticator):
             'credentials',
             'DNSPod credentials INI file',
             {
-                'api_token': 'API token for DNSPod API',
                 'dns_ttl': 'TTL value for DNS records, the minimum ttl '
                 'for different VIP types is different',
                 'contact_email': 'Contact email used to request DNSPod API'
             },
+            validate_credentials,
         )
 
+    def perform(self, achalls):
+        """
+        Configures DNS TXT records of all challenges
+
+        Records are handed to the client at once, so it lists existing
+            records once per zone instead of once per challenge.
+
+        :param list achalls: challenges to perform.
+        :returns: challenge responses, in the order of `achalls`.
+        :rtype: list
+        :raises errors.PluginError: If the chanllenges can not be performed.
+        """
+        self._setup_credentials()
+
+        self._attempt_cleanup = True
+
+        records = self._get_validation_records(achalls)
+        with self._phase('perform', records=len(records)):
+            self._add_records(records)
+        added_at = time.time()
+
+        with self._phase('propagation'):
+            self._wait_for_propagation(records, added_at)
+
+        return [achall.response(achall.account_key) for achall in achalls]
+
+    def _add_records(self, records):
+        """
+        Add the TXT records of a run, or reconcile the names to them
+
+        :param records: (validation_name, validation) pairs.
+        :type records: List[Tuple[str, str]]
+        :raises errors.PluginError: If the records can not be added, or
+            with reconcile-dry-run, once the plan is printed.
+        """
+        client = self._get_dnspod_client()
+        dry_run = self.conf('reconcile-dry-run')
+
+        if not (self.conf('reconcile') or dry_run):
+            client.add_txt_records(records)
+            return
+
+        plan = client.reconcile(records, dry_run=dry_run)
+        if not dry_run:
+            logger.info('%s', plan.format())
+            return
+
+        # nothing was changed, so there is nothing to clean up
+        self._attempt_cleanup = False
+        zope.component.getUtility(interfaces.IDisplay).notification(
+            plan.format(), pause=False)
+        raise errors.PluginError(
+            '[DNSPod] Dry run of reconcile, no record was changed')
+
+    def _wait_for_propagation(self, records, added_at):
+        """
+        Wait for DNS changes to propagate
+
+        With propagation-check, authoritative nameservers are polled
+            until the records are visible, and the delays of the zones
+            are added to their history. With propagation-percentile too,
+            `_get_propagation_seconds` is slept before polling starts, so
+            history keeps being measured while it is used. Zones already
+            visible on the first poll after that head start are not
+            added, as their records may have been visible earlier.
+            Otherwise, or if nameservers can not be found, it sleeps
+            `_get_propagation_seconds`.
+
+        :param records: (validation_name, validation) pairs.
+        :type records: List[Tuple[str, str]]
+        :param float added_at: time the records were added.
+        """
+        slept = 0
+        if self.conf('propagation-check'):
+            client = self._get_dnspod_client()
+            timeout = self.conf('propagation-timeout')
+            try:
+                checker = PropagationChecker(self._get_nameservers())
+                head_start = 0
+                if self._get_learned_seconds(records) is not None:
+                    head_start = min(self._get_propagation_seconds(records),
+                                     timeout)
+                if head_start:
+                    logger.info('Waiting %d seconds, the learned '
+                                'propagation delay, before polling',
+                                head_start)
+                    time.sleep(head_start)
+                    slept = head_start
+
+                logger.info('Waiting up to %d seconds for DNS changes to '
+                            'propagate', timeout - slept)
+                checker.wait(
+                    [(name, value, client.get_zone(name))
+                     for name, value in records],
+                    timeout - slept)
+                history = self._get_history()
+                for zone, visible_at in sorted(checker.visible_at.items()):
+                    if slept and zone in checker.visible_on_first_round:
+                        continue
+                    history.observe(zone, max(0, visible_at - added_at))
+                return
+            except errors.PluginError as e:
+                logger.warning('Unable to check DNS propagation: %s', e)
+
+        seconds = max(0, self._get_propagation_seconds(records) - slept)
+        logger.info('Waiting %d seconds for DNS changes to propagate',
+                    seconds)
+        time.sleep(seconds)
+
+    def _get_propagation_seconds(self, records):
+        """
+        Get the seconds to wait for records to propagate
+
+        With propagation-percentile, it is the learned delay of the
+            records' zones, capped by propagation-seconds, which is also
+            used when a zone has too little history.
+
+        :param records: (validation_name, validation) pairs.
+        :type records: List[Tuple[str, str]]
+        :rtype: float
+        """
+        fixed = self.conf('propagation-seconds')
+        learned = self._get_learned_seconds(records)
+        if learned is None:
+            return fixed
+
+        return min(learned, fixed)
+
+    def _get_learned_seconds(self, records):
+        """
+        Get the propagation-percentile of the delays of records' zones
+
+        :param records: (validation_name, validation) pairs.
+        :type records: List[Tuple[str, str]]
+        :returns: slowest percentile of the zones, None without
+            propagation-percentile or if a zone has too little history.
+        :rtype: Optional[float]
+        """
+        percent = self.conf('propagation-percentile')
+        if not percent:
+            return None
+
+        client = self._get_dnspod_client()
+        history = self._get_history()
+        seconds = 0
+        for zone in set(client.get_zone(name) for name, _ in records):
+            learned = history.percentile(zone, percent)
+            if learned is None:
+                return None
+            seconds = max(seconds, learned)
+
+        return seconds
+
+    def _get_history(self):
+        """
+        Get the history of propagation delays kept between runs
+
+        :rtype: PropagationHistory
+        """
+        return PropagationHistory(self._get_state_path('propagation.json'))
+
+    def _get_nameservers(self):
+        """
+        Get nameservers polled instead of the authoritative ones
+
+        :rtype: Optional[List[Tuple[str, int]]]
+        """
+        if self.conf('nameservers'):
+            return parse_nameservers(self.conf('nameservers'))
+
     def _perform(self, domain, validation_name, validation):
         """
         Configures a DNS TXT record
@@ -65,6 +395,34 @@ class Authenticator(dns_common.DNSAuthenticator):
             validation_name, validation
         )
 
+    def cleanup(self, achalls):
+        """
+        Deletes the DNS TXT records and disposes the DNSPod client
+
+        With deferred-cleanup, the records and the client are handed to
+            the process' cleanup queue instead, which removes them in the
+            background. Metrics, traces and profiles of the run are
+            written out at last.
+
+        :param list achalls: challenges performed by `perform`.
+        """
+        try:
+            if self._attempt_cleanup:
+                with self._phase('cleanup', records=len(achalls)):
+                    client = self._get_dnspod_client()
+                    records = self._get_validation_records(achalls)
+                    if self.conf('deferred-cleanup'):
+                        self._del_stale_records(client)
+                        get_cleanup_queue().put(client, records)
+                        # the queue closes the client once flushed
+                        self._dnspod_client = None
+                    else:
+                        client.del_txt_records(records)
+                        self._del_stale_records(client)
+        finally:
+            self._close_dnspod_client()
+            self._flush_diagnostics()
+
     def _cleanup(self, domain, validation_name, validation):
         """
         Deletes the DNS TXT record which would have been created by `_perform`
@@ -77,8 +435,162 @@ class Authenticator(dns_common.DNSAuthenticator):
             validation_name, validation
         )
 
-    def _get_dnspod_client(self):  # pylint: disable=missing-docstring
-        return DNSPodClient(
-            self.credentials.conf('api_token'),
-            self.credentials.conf('dns_ttl'),
-            self.credentials.conf('contact_email'))
+    @staticmethod
+    def _del_stale_records(client):
+        """Delete journaled records left over by crashed runs
+
+        :param DNSPodClient client: client holding the journal.
+        """
+        try:
+            client.del_journaled_records(older_than=STALE_RECORD_SECONDS)
+        except errors.PluginError as e:
+            logger.warning('Unable to delete stale DNSPod records: %s', e)
+
+    @staticmethod
+    def _get_validation_records(achalls):
+        """
+        Get the TXT records needed by challenges
+
+        :param list achalls: challenges.
+        :returns: (validation_name, validation) pairs.
+        :rtype: List[Tuple[str, str]]
+        """
+        return [
+            (achall.validation_domain_name(achall.domain),
+             achall.validation(achall.account_key))
+            for achall in achalls
+        ]
+
+    def _get_dnspod_client(self):
+        """
+        Get the DNSPod client shared by all challenges of this run
+
+        The client is created on first use, so connections and lookups
+            cached by it are reused until `cleanup` disposes it.
+
+        :rtype: DNSPodClient
+        """
+        if self._dnspod_client is None:
+            kwargs = dict(
+                max_concurrency=self.conf('max-concurrency'),
+                rate_limit=self.conf('rate-limit') or None,
+                journal=RecordJournal(self._get_state_path('journal.json')),
+                metrics=self._get_metrics(), tracer=self._get_tracer(),
+                batch=self.conf('batch'), pool=self._get_pool(),
+                shared_cache=self._get_shared_cache())
+            self._dnspod_client = create_client(self.credentials, **kwargs)
+
+        return self._dnspod_client
+
+    def _get_pool(self):
+        """
+        Get the pool of parked records, if reuse-records is set
+
+        :rtype: Optional[RecordPool]
+        """
+        if self.conf('reuse-records'):
+            return RecordPool(self._get_state_path('pool.json'))
+
+        return None
+
+    def _get_shared_cache(self):
+        """
+        Get the cache shared with other processes, if shared-cache is set
+
+        :rtype: Optional[SharedCache]
+        """
+        if not self.conf('shared-cache'):
+            return None
+
+        secret = self.credentials.conf('api_token')
+        if self.credentials.conf('backend') == BACKEND_TENCENTCLOUD:
+            secret = self.credentials.conf('secret_id')
+
+        return SharedCache(
+            self._get_state_path('cache.sqlite', self.config.config_dir),
+            account_key(secret))
+
+    def _get_metrics(self):
+        """
+        Get the metrics of this run
+
+        :rtype: Metrics
+        """
+        if self._metrics is None:
+            sinks = []
+            if self.conf('metrics-textfile'):
+                sinks.append(PrometheusTextfileSink(
+                    self.conf('metrics-textfile')))
+            if self.conf('metrics-jsonl'):
+                sinks.append(JSONLinesSink(self.conf('metrics-jsonl')))
+            self._metrics = Metrics(sinks)
+
+        return self._metrics
+
+    def _get_tracer(self):
+        """
+        Get the tracer of this run
+
+        :rtype: Tracer
+        """
+        if self._tracer is None:
+            self._tracer = Tracer(self.conf('trace-file'))
+
+        return self._tracer
+
+    def _get_profiler(self):
+        """
+        Get the profiler of this run
+
+        :returns: None if profiling is off.
+        :rtype: Optional[SamplingProfiler]
+        """
+        if self._profiler is None and self.conf('profile-file'):
+            self._profiler = SamplingProfiler(self.conf('profile-file'))
+
+        return self._profiler
+
+    @contextmanager
+    def _phase(self, name, **attrs):
+        """Time, trace and, if enabled, profile a phase of the run
+
+        :param str name: phase like perform, propagation or cleanup.
+        :param attrs: attributes of the phase's span.
+        """
+        profiler = self._get_profiler()
+
+        with self._get_metrics().phase(name), \
+                self._get_tracer().span(name, **attrs):
+            if profiler is None:
+                yield
+            else:
+                with profiler.phase(name):
+                    yield
+
+    def _flush_diagnostics(self):
+        """Write out metrics, trace and profile of the run"""
+        self._get_metrics().flush()
+        self._get_tracer().flush()
+        if self._get_profiler() is not None:
+            self._get_profiler().flush()
+
+    def _get_state_path(self, name, root=None):
+        """
+        Get the path of a state file kept between runs
+
+        :param str name: file name.
+        :param str root: directory of certbot holding the plugin's
+            directory, defaults to the work dir.
+        :returns: path under the plugin's directory in certbot's work dir.
+        :rtype: str
+        """
+        state_dir = os.path.join(root or self.config.work_dir, 'dns-dnspod')
+        util.make_or_verify_dir(state_dir, 0o700)
+
+        return os.path.join(state_dir, name)
+
+    def _close_dnspod_client(self):
+        """Close the shared DNSPod client if it has been created"""
+        if self._dnspod_client is not None:
+            self._dnspod_client.close()
+            self._dnspod_client = None
@@ -1,206 +1,1775 @@
 # -*- coding: utf-8 -*-
 """DNSPod Client"""
 
+import calendar
+import json
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# from acme.magic_typing import Dict
+# from acme.magic_typing import Any
+
+from certbot import errors
+
+from . import __version__
+from .endpoints import EndpointSelector
+from .pool import PARKED_VALUE
+from .reconcile import ReconcilePlan
+from .scheduler import DEFAULT_MAX_RETRIES
+from .scheduler import DEFAULT_TIME_BUDGET
+from .scheduler import RequestScheduler
+from .scheduler import RetryableError
+from .scheduler import UnavailableError
+from .singleflight import SingleFlight
+from .tracing import null_span
+from .zone_index import ZoneIndex
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+NO_RECORD_CODE = '10'
+
+# HTTP status and DNSPod error codes worth sending a request again for,
+# '-2' is returned when the API usage limit is exceeded
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Of those, codes of requests rejected without being applied
+THROTTLED_STATUS_CODES = (429,)
+RETRY_ERR_CODES = ('-2',)
+
+# DNSPod error codes of a record id that doesn't exist, e.g. removed by hand
+GONE_ERR_CODES = ('8',)
+
+DEFAULT_BASE_URL = 'https://dnsapi.cn/'
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_ZONE_CACHE_TTL = 300
+DEFAULT_MAX_CONCURRENCY = 1
+DEFAULT_READ_CACHE_TTL = 2
+
+DOMAIN_LIST_PAGE_SIZE = 500
+RECORD_LIST_PAGE_SIZE = 500
+
+# Max records submitted in one batch job
+BATCH_CHUNK_SIZE = 100
+BATCH_POLL_INTERVAL = 0.5
+BATCH_MAX_POLL_INTERVAL = 5
+BATCH_TIMEOUT = 120
+BATCH_PENDING_STATUSES = ('waiting', 'running')
+
+# First label of the TXT records of dns-01 challenges
+CHALLENGE_LABEL = '_acme-challenge'
+
+# Reasons `find_stale_records` gives for stale records
+STALE_UNJOURNALED = 'unjournaled'
+STALE_EXPIRED = 'expired'
+
+# Times of records are reported like 2021-03-28 11:27:09, in China
+# Standard Time
+API_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+API_UTC_OFFSET = 8 * 3600
+
+
+def parse_api_time(value):
+    """
+    Parse a time reported by DNSPod API
+
+    :param str value: time like 2021-03-28 11:27:09
+    :returns: seconds since the epoch, None if value isn't a time.
+    :rtype: Optional[float]
+    """
+    try:
+        parsed = time.strptime(value, API_TIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+    return calendar.timegm(parsed) - API_UTC_OFFSET
+
+
+class RecordGoneError(errors.PluginError):
+    """Error of a request about a record that doesn't exist anymore"""
+
+
+class Record(object):
+    """DNS record listed from DNSPod
+
+    Slotted, so listing zones of tens of thousands of records stays small.
+    """
+
+    __slots__ = ('id', 'name', 'type', 'value', 'updated_on')
+
+    def __init__(self, record_id, name, record_type, value, updated_on=None):
+        """Init Record
+
+        :param str record_id: DNS record ID in DNSPod.
+        :param str name: sub_domain of the record, '@' for the apex.
+        :param str record_type: record type like TXT.
+        :param str value: value of the record.
+        :param float updated_on: seconds since the epoch the record was
+            last changed, None if unknown.
+        """
+        self.id = record_id  # pylint: disable=invalid-name
+        self.name = name
+        self.type = record_type
+        self.value = value
+        self.updated_on = updated_on
+
+    def __eq__(self, other):
+        return isinstance(other, Record) and all(
+            getattr(self, name) == getattr(other, name)
+            for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Record(id={0!r}, name={1!r}, type={2!r}, value={3!r})'.format(
+            self.id, self.name, self.type, self.value)
+
+
+class BaseDNSPodClient(object):
+    """Request building and response parsing shared by DNSPod clients
+
+    Subclasses only provide the transport, so the blocking and the
+        asyncio clients build the same requests and map responses to
+        the same results and errors.
+    """
+
+    USER_AGENT_FMT = 'certbot-dns-dnspod/{version}({email})'
+    RETRY_ERR_CODES = RETRY_ERR_CODES
+    GONE_ERR_CODES = GONE_ERR_CODES
+    # Actions that don't change anything, coalesced by `_do_post`
+    READ_ACTIONS = ('Domain.List', 'Record.List')
+
+    def __init__(self, api_token, ttl, contact_email,
+                 pool_size=DEFAULT_POOL_SIZE, keep_alive=True,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT,
+                 zone_cache_ttl=DEFAULT_ZONE_CACHE_TTL,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 journal=None, rate_limit=None,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 time_budget=DEFAULT_TIME_BUDGET,
+                 base_url=DEFAULT_BASE_URL, metrics=None, tracer=None,
+                 batch=False, pool=None, shared_cache=None,
+                 read_cache_ttl=DEFAULT_READ_CACHE_TTL):
+        """Init DNSPod client
+
+        :param str api_token: API token used for authentication,
+            see: https://support.dnspod.cn/Kb/showarticle/tsid/227/
+        :param int ttl: DNS ttl, DNSPod limits ttl ranges for different
+            VIP types, If you are free user,
+            the ttl must not be less than 600.
+        :param str contact_email: Contact email used to request DNSPod API
+        :param int pool_size: Max number of pooled connections kept
+            to the API host.
+        :param bool keep_alive: Whether connections are kept open between
+            API calls.
+        :param float connect_timeout: Seconds to wait for a connection.
+        :param float read_timeout: Seconds to wait for a response.
+        :param float zone_cache_ttl: Seconds the zone index fetched with
+            Domain.List is reused before being fetched again.
+        :param int max_concurrency: Max number of record create, modify
+            and remove calls running at the same time.
+        :param RecordJournal journal: Journal of created and modified
+            records, cleanup removes journaled records by id without
+            listing them.
+        :param float rate_limit: Max API requests per second, unlimited
+            if None.
+        :param int max_retries: Max number of retries of a failed request.
+        :param float time_budget: Max seconds spent on an API request,
+            including retries.
+        :param base_url: URL the API actions are relative to, e.g. the
+            address of a local `FakeDNSPodServer`, or a list of URLs
+            serving the same API, see `EndpointSelector`.
+        :type base_url: Union[str, List[str]]
+        :param Metrics metrics: Metrics API calls are recorded to.
+        :param Tracer tracer: Tracer API calls are recorded as spans to.
+        :param bool batch: Whether records are created with batch jobs
+            instead of one call per record.
+        :param RecordPool pool: Pool records are parked in by cleanup
+            instead of being removed, and taken from by perform instead
+            of being created.
+        :param SharedCache shared_cache: Cache of zones and record ids
+            shared with other processes, which also hold the rate limit
+            tokens of the account if rate_limit is set.
+        :param float read_cache_ttl: Seconds results of list actions are
+            reused, unless records of their zone change, 0 to only share
+            results of identical lists in flight.
+        """
+        self.api_token = api_token
+        self.ttl = ttl
+        if not isinstance(base_url, (list, tuple)):
+            base_url = [base_url]
+        self.endpoints = EndpointSelector(base_url)
+        self.base_url = self.endpoints.base_urls[0]
+        self.contact_email = contact_email
+        self.user_agent = self.USER_AGENT_FMT.format(
+            version=__version__,
+            email=contact_email)
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+        self._session = None
+        self.zone_cache_ttl = zone_cache_ttl
+        self._zone_index = None
+        self._zone_index_expires_at = 0
+        self.max_concurrency = max(1, max_concurrency)
+        self.journal = journal
+        self.shared_cache = shared_cache
+        bucket = None
+        if shared_cache is not None and rate_limit:
+            bucket = shared_cache.token_bucket(rate_limit)
+        self.scheduler = RequestScheduler(rate_limit, max_retries,
+                                          time_budget, bucket=bucket)
+        self.metrics = metrics
+        self.tracer = tracer
+        self.batch = batch
+        self.pool = pool
+        self.reads = SingleFlight(read_cache_ttl)
+
+    def _common_data(self):
+        """
+        Get parameters sent with every request
+
+        :rtype: Dict[str, str]
+        """
+        return {
+            'login_token': self.api_token,
+            'format': 'json',
+            'error_on_empty': 'no',
+            'lang': 'en'
+        }
+
+    def _get_url(self, action, base_url=None):
+        """
+        Get API URL from action
+
+        :param str action: action
+        :param str base_url: endpoint of the URL, the one currently
+            preferred if None, without sending it a trial request.
+        :returns: full URL of API
+        :rtype: str
+        """
+        return '{0}{1}'.format(
+            base_url or self.endpoints.choose(trial=False),
+            action
+        )
+
+    @staticmethod
+    def _get_action(url):
+        """
+        Get action from API URL
+
+        :param str url: URL for DNSPod API.
+        :rtype: str
+        """
+        return url.rsplit('/', 1)[-1]
+
+    @staticmethod
+    def _get_base_url(url):
+        """
+        Get the endpoint of an API URL
+
+        :param str url: URL for DNSPod API.
+        :rtype: str
+        """
+        return url.rsplit('/', 1)[0] + '/'
+
+    def _span(self, name, **attrs):
+        """Trace the block as a span, see `Tracer.span`"""
+        if self.tracer is None:
+            return null_span()
+
+        return self.tracer.span(name, **attrs)
+
+    def _observe_request(self, url, code, sent_bytes=0, received_bytes=0):
+        """Record an HTTP request sent to DNSPod API, see `Metrics`"""
+        if self.metrics is not None:
+            self.metrics.observe_request(self._get_action(url), code,
+                                         sent_bytes, received_bytes)
+
+    def _observe_call(self, url, started_at, attempts):
+        """Record a DNSPod API call, see `Metrics`"""
+        if self.metrics is not None:
+            self.metrics.observe_call(self._get_action(url),
+                                      time.time() - started_at, attempts)
+
+    def _parse_response(self, url, status_code, content, sent_bytes=0):
+        """
+        Parse a response of DNSPod API
+
+        :param str url: URL for DNSPod API.
+        :param int status_code: HTTP status code.
+        :param bytes content: response body.
+        :param int sent_bytes: size of the request body, for metrics.
+        :returns: API response
+        :rtype: Dict[str, Any]
+        :raises RetryableError: If the request failed transiently.
+        :raises errors.PluginError: If the request failed.
+        """
+        if status_code != 200:
+            self._observe_request(url, 'http_{0}'.format(status_code),
+                                  sent_bytes, len(content))
+            error_cls = errors.PluginError
+            if status_code in THROTTLED_STATUS_CODES:
+                error_cls = RetryableError
+            elif status_code in RETRY_STATUS_CODES:
+                error_cls = UnavailableError
+            raise error_cls(
+                '[DNSPod] HTTP Error, status_code: {0}, url: {1}'
+                .format(status_code, url))
+
+        try:
+            result = json.loads(content.decode('utf-8'))
+        except Exception:
+            self._observe_request(url, 'invalid', sent_bytes, len(content))
+            raise errors.PluginError(
+                '[DNSPod] API response with non JSON, url: {0}, content: {1}'
+                .format(url, content))
+
+        code, message = self._result_status(result)
+        self._observe_request(url, code, sent_bytes, len(content))
+        if code in self.RETRY_ERR_CODES:
+            raise RetryableError(
+                '[DNSPod] API rate limited, url: {0}, err_code: {1}, '
+                'err_msg: {2}'.format(url, code, message))
+
+        return result
+
+    @staticmethod
+    def _request_zone(data):
+        """
+        Get the zone a request reads or changes
+
+        :param Dict[str, Any] data: request parameters
+        :returns: zone name, None if the request is not about one zone.
+        :rtype: Optional[str]
+        """
+        zone = data.get('domain')
+
+        return zone.lower() if zone else None
+
+    @staticmethod
+    def _result_status(result):
+        """
+        Get the status of an API response
+
+        :param Dict[str, Any] result: API response.
+        :returns: (status code, status message)
+        :rtype: Tuple[str, str]
+        """
+        status = result.get('status') or {}
+
+        return status.get('code'), status.get('message')
+
+    def _zone_index_expired(self):
+        """
+        Tell whether the zone index has to be fetched again
+
+        :rtype: bool
+        """
+        if self._zone_index is None:
+            return True
+
+        return time.time() >= self._zone_index_expires_at
+
+    def _set_zone_index(self, domains):
+        """
+        Replace the zone index
+
+        :param Dict[str, str] domains: domain names mapped to their ids.
+        :rtype: ZoneIndex
+        """
+        self._zone_index = ZoneIndex(domains)
+        self._zone_index_expires_at = time.time() + self.zone_cache_ttl
+
+        return self._zone_index
+
+    @staticmethod
+    def _list_domains_data(offset):
+        """
+        Get parameters of a Domain.List page
+
+        :param int offset: number of domains already listed.
+        :rtype: Dict[str, Any]
+        """
+        return {
+            'type': 'all',
+            'offset': offset,
+            'length': DOMAIN_LIST_PAGE_SIZE
+        }
+
+    @staticmethod
+    def _parse_list_domains(result, domains):
+        """
+        Parse a Domain.List page
+
+        :param Dict[str, Any] result: API response.
+        :param Dict[str, str] domains: domain names mapped to their ids,
+            updated with the domains of the page.
+        :returns: whether more pages have to be listed.
+        :rtype: bool
+        :raises errors.PluginError: If the API returns error.
+        """
+        err_code = result['status']['code']
+        if err_code != '1':
+            raise errors.PluginError(
+                '[DNSPod] List domains failed, '
+                'err_code: {0}, err_msg: {1}'.format(
+                    err_code, result['status']['message']))
+
+        page = result.get('domains') or []
+        for domain in page:
+            name = domain.get('punycode') or domain['name']
+            domains[name] = domain['id']
+
+        total = int((result.get('info') or {}).get('domain_total', 0))
+
+        return bool(page) and len(domains) < total
+
+    @staticmethod
+    def _split_with_index(zone_index, full_domain):
+        """
+        Split full domain into sub_domain and base_domain
+
+        The base_domain is the longest zone of the account containing
+            the domain, e.g. 'abc.example.com.cn' will be splitted into
+            ('abc', 'example.com.cn') when example.com.cn is a zone.
+
+        :param ZoneIndex zone_index: zones of the account.
+        :param str full_domain: domain like abc.example.com
+        :returns: (sub_domain, base_domain) splitted domain parts,
+            'abc.example.com' will be splitted into ('abc', 'example.com')
+        :rtype: Tuple[str, str]
+        :raises errors.PluginError: If no zone contains the domain.
+        """
+        parts = zone_index.split(full_domain)
+
+        if parts is None:
+            raise errors.PluginError(
+                '[DNSPod] Unable to find a zone for full domain: {0}'
+                .format(full_domain))
+
+        return parts
+
+    def _group_with_index(self, zone_index, records):
+        """
+        Group records by the zone and the sub_domain they belong to
+
+        :param ZoneIndex zone_index: zones of the account.
+        :param records: (full_domain, record_content) pairs.
+        :type records: Iterable[Tuple[str, str]]
+        :returns: zone => sub_domain => (full_domain, values), in the order
+            the records were given.
+        :rtype: OrderedDict[str, OrderedDict[str, Tuple[str, List[str]]]]
+        """
+        zones = OrderedDict()
+
+        for full_domain, record_content in records:
+            sub_domain, base_domain = self._split_with_index(zone_index,
+                                                             full_domain)
+            names = zones.setdefault(base_domain, OrderedDict())
+            _, values = names.setdefault(sub_domain, (full_domain, []))
+            if record_content not in values:
+                values.append(record_content)
+
+        return zones
+
+    @staticmethod
+    def _plan_additions(names, record_ids):
+        """
+        Get the values of a zone that have to be created
+
+        New values are added alongside the values a name already has,
+            so e.g. the validations of a wildcard and its apex can coexist.
+
+        :param names: sub_domain => (full_domain, values) of the zone.
+        :param record_ids: lower cased sub_domain => value => record id
+            of the existing records.
+        :returns: (full_domain, record_content) pairs.
+        :rtype: List[Tuple[str, str]]
+        """
+        additions = []
+
+        for sub_domain, (full_domain, values) in names.items():
+            name_record_ids = record_ids.get(sub_domain.lower(), {})
+            additions.extend((full_domain, value) for value in values
+                             if value not in name_record_ids)
+
+        return additions
+
+    @staticmethod
+    def _plan_removals(names, record_ids):
+        """
+        Get the records of a zone whose value match
+
+        :param names: sub_domain => (full_domain, values) of the zone.
+        :param record_ids: lower cased sub_domain => value => record id
+            of the existing records.
+        :returns: (full_domain, record_content, record_id) tuples.
+        :rtype: List[Tuple[str, str, str]]
+        """
+        removals = []
+
+        for sub_domain, (full_domain, values) in names.items():
+            name_record_ids = record_ids.get(sub_domain.lower(), {})
+            removals.extend((full_domain, value, name_record_ids[value])
+                            for value in values if value in name_record_ids)
+
+        return removals
+
+    def _split_journaled(self, records):
+        """
+        Split records into journaled ones and the others
+
+        :param records: (full_domain, record_content) pairs.
+        :returns: ((full_domain, record_content, record_id, zone) tuples
+            of journaled records, (full_domain, record_content) pairs of
+            the others).
+        :rtype: Tuple[list, list]
+        """
+        journaled = []
+        unjournaled = []
+
+        for full_domain, value in OrderedDict.fromkeys(records):
+            entry = None
+            if self.journal is not None:
+                entry = self.journal.get(full_domain, value)
+            if not entry and self.shared_cache is not None:
+                entry = self.shared_cache.get_record(full_domain, value)
+            if entry:
+                journaled.append((full_domain, value, entry['record_id'],
+                                  entry['zone']))
+            else:
+                unjournaled.append((full_domain, value))
+
+        return journaled, unjournaled
+
+    def _journal_removed(self, removed):
+        """
+        Forget removed records
+
+        :param removed: (full_domain, record_content) pairs.
+        """
+        for full_domain, value in removed:
+            if self.journal is not None:
+                self.journal.remove(full_domain, value)
+            if self.shared_cache is not None:
+                self.shared_cache.remove_record(full_domain, value)
+
+    def _journal_record(self, full_domain, record_content, record_id,
+                        base_domain):
+        """
+        Journal a created or modified record
+
+        Parked records are kept by the pool, not the journal, so stale
+            record cleanup leaves them alone.
+        """
+        if not record_id or record_content == PARKED_VALUE:
+            return
+
+        if self.journal is not None:
+            self.journal.add(full_domain, record_content, record_id,
+                             base_domain)
+        if self.shared_cache is not None:
+            self.shared_cache.add_record(full_domain, record_content,
+                                         record_id, base_domain)
+
+    @staticmethod
+    def _failures_error(operation, failures, total):
+        """
+        Build one error out of failed record API calls
+
+        :param str operation: what was being done.
+        :param failures: (full_domain, exception) pairs.
+        :param int total: number of API calls tried.
+        :rtype: errors.PluginError
+        """
+        return errors.PluginError(
+            '[DNSPod] {0} failed for {1} of {2} records, {3}'.format(
+                operation, len(failures), total,
+                '; '.join('domain: {0}, error: {1}'.format(domain, e)
+                          for domain, e in failures)))
+
+    def _create_txt_record_data(self, sub_domain, base_domain,
+                                record_content):
+        """
+        Get parameters of Record.Create
+
+        :param str sub_domain: sub_domain of the record.
+        :param str base_domain: Zone of the record.
+        :param str record_content: Value that the record should be set.
+        :rtype: Dict[str, Any]
+        """
+        return {
+            'domain': base_domain,
+            'sub_domain': sub_domain,
+            'record_type': 'TXT',
+            'record_line': '默认',
+            'value': record_content,
+            'ttl': self.ttl
+        }
+
+    def _parse_create_txt_record(self, result, full_domain, record_content,
+                                 base_domain):
+        """
+        Parse a Record.Create response and journal the record
+
+        :param Dict[str, Any] result: API response.
+        :param str full_domain: Full domain.
+        :param str record_content: Value of the record.
+        :param str base_domain: Zone of the record.
+        :returns: DNS record ID of the created record.
+        :rtype: str
+        :raises errors.PluginError: If fails to create record.
+        """
+        err_code = result['status']['code']
+        if err_code != '1':
+            raise errors.PluginError(
+                '[DNSPod] Create TXT record failed,'
+                'domain: {0}, err_code: {1}, err_msg: {2}'.format(
+                    full_domain, err_code, result['status']['message']))
+
+        record_id = (result.get('record') or {}).get('id')
+        self._journal_record(full_domain, record_content, record_id,
+                             base_domain)
+
+        return record_id
+
+    @staticmethod
+    def _modify_txt_record_data(record_id, sub_domain, base_domain,
+                                record_content):
+        """
+        Get parameters of Record.Modify
+
+        :param str record_id: DNS record ID in DNSPod.
+        :param str sub_domain: sub_domain of the record.
+        :param str base_domain: Zone of the record.
+        :param str record_content: Value that the record should be set.
+        :rtype: Dict[str, Any]
+        """
+        return {
+            'domain': base_domain,
+            'record_id': record_id,
+            'sub_domain': sub_domain,
+            'record_type': 'TXT',
+            'record_line': '默认',
+            'value': record_content
+        }
+
+    def _parse_modify_txt_record(self, result, record_id, full_domain,
+                                 record_content, base_domain):
+        """
+        Parse a Record.Modify response and journal the record
+
+        :param Dict[str, Any] result: API response.
+        :param str record_id: DNS record ID in DNSPod.
+        :param str full_domain: Full domain.
+        :param str record_content: Value of the record.
+        :param str base_domain: Zone of the record.
+        :raises RecordGoneError: If the record doesn't exist.
+        :raises errors.PluginError: If fails to modify the record.
+        """
+        err_code = result['status']['code']
+        if err_code != '1':
+            error = errors.PluginError
+            if err_code in self.GONE_ERR_CODES:
+                error = RecordGoneError
+            raise error(
+                '[DNSPod] Modify TXT record failed, domain:'
+                ' {0}, err_code: {1}, err_msg: {2}'.format(
+                    full_domain, err_code, result['status']['message']))
+
+        self._journal_record(full_domain, record_content, record_id,
+                             base_domain)
+
+    @staticmethod
+    def _list_records_data(base_domain, offset, length, sub_domain=None,
+                           record_type=None, keyword=None):
+        """
+        Get parameters of a Record.List page
+
+        :param str base_domain: Zone of the records.
+        :param int offset: number of records already listed.
+        :param int length: max number of records of the page.
+        :param str sub_domain: only list records of this sub_domain.
+        :param str record_type: only list records of this type.
+        :param str keyword: only list records whose sub_domain or value
+            contains it.
+        :rtype: Dict[str, Any]
+        """
+        data = {
+            'domain': base_domain,
+            'offset': offset,
+            'length': length
+        }
+
+        if sub_domain:
+            data['sub_domain'] = sub_domain
+        if record_type:
+            data['record_type'] = record_type
+        if keyword:
+            data['keyword'] = keyword
+
+        return data
+
+    @staticmethod
+    def _parse_list_records(result, data):
+        """
+        Parse a Record.List page
+
+        :param Dict[str, Any] result: API response.
+        :param Dict[str, Any] data: parameters of the request.
+        :returns: (records of the page, whether more pages have to be
+            listed).
+        :rtype: Tuple[List[Record], bool]
+        :raises errors.PluginError: If the API returns error.
+        """
+        err_code = result['status']['code']
+        if err_code == NO_RECORD_CODE:
+            return [], False
+        elif err_code != '1':
+            full_domain = data['domain']
+            if 'sub_domain' in data:
+                full_domain = '{0}.{1}'.format(data['sub_domain'],
+                                               full_domain)
+            raise errors.PluginError(
+                '[DNSPod] Get {0} record info failed, domain: {1},'
+                ' err_code: {2}, err_msg: {3}'.format(
+                    data.get('record_type', 'DNS'), full_domain, err_code,
+                    result['status']['message']))
+
+        records = [Record(record['id'], record['name'], record['type'],
+                          record['value'],
+                          parse_api_time(record.get('updated_on')))
+                   for record in result.get('records') or []]
+
+        if len(records) < data['length']:
+            return records, False
+
+        total = (result.get('info') or {}).get('record_total')
+        if total is None:
+            return records, True
+
+        return records, data['offset'] + len(records) < int(total)
+
+    @staticmethod
+    def _list_txt_records_filters(sub_domains):
+        """
+        Get Record.List filters narrowing a listing to some sub_domains
+
+        The listing is narrowed to the sub_domain when there is only one,
+            otherwise to the records containing the sub_domains' common
+            prefix, e.g. `_acme-challenge`.
+
+        :param Collection[str] sub_domains: sub_domains the caller needs.
+        :rtype: Dict[str, str]
+        """
+        if len(sub_domains) == 1:
+            return {'sub_domain': next(iter(sub_domains))}
+
+        prefix = os.path.commonprefix([name.lower() for name in sub_domains])
+        if prefix and prefix != '@':
+            return {'keyword': prefix}
+
+        return {}
+
+    @staticmethod
+    def _index_records(records, sub_domains):
+        """
+        Index listed records of some sub_domains by name and value
+
+        :param Iterable[Record] records: listed records.
+        :param Collection[str] sub_domains: sub_domains the caller needs.
+        :returns: lower cased sub_domain => record value => record id,
+            a name can hold several values.
+        :rtype: Dict[str, Dict[str, str]]
+        """
+        names = set(name.lower() for name in sub_domains)
+        record_ids = {}
+
+        for record in records:
+            name = record.name.lower()
+            if name in names:
+                record_ids.setdefault(name, {})[record.value] = record.id
+
+        return record_ids
+
+    @staticmethod
+    def _remove_record_data(record_id, base_domain):
+        """
+        Get parameters of Record.Remove
+
+        :param str record_id: DNS record ID in DNSPod
+        :param str base_domain: Zone of the record.
+        :rtype: Dict[str, Any]
+        """
+        return {
+            'domain': base_domain,
+            'record_id': record_id
+        }
+
+    @classmethod
+    def _parse_remove_record(cls, result, full_domain):
+        """
+        Parse a Record.Remove response
+
+        A record that doesn't exist anymore counts as removed, so it is
+            forgotten instead of being removed again by every cleanup.
+
+        :param Dict[str, Any] result: API response.
+        :param str full_domain: Full domain.
+        :returns: whether the operation is success
+        :rtype: bool
+        """
+        err_code = result['status']['code']
+        if err_code in cls.GONE_ERR_CODES:
+            logger.info('[DNSPod] Record of {0} is already removed, '
+                        'err_msg: {1}'.format(full_domain,
+                                              result['status']['message']))
+        elif err_code != '1':
+            logger.error(
+                '[DNSPod] Remove record failed, domain: {0}, '
+                'err_code: {1}, err_msg: {2}'.format(
+                    full_domain, err_code, result['status']['message']
+                ))
+            return False
+
+        return True
+
+    def _batch_create_txt_data(self, zone_id, entries):
+        """
+        Get parameters of Batch.Record.Create
+
+        :param str zone_id: domain id of the zone.
+        :param entries: (sub_domain, record_content) pairs.
+        :rtype: Dict[str, Any]
+        """
+        return {
+            'domain_id': zone_id,
+            'records': json.dumps([{
+                'sub_domain': sub_domain,
+                'record_type': 'TXT',
+                'record_line': '默认',
+                'value': value,
+                'ttl': self.ttl
+            } for sub_domain, value in entries])
+        }
+
+    @staticmethod
+    def _batch_modify_value_data(record_ids, record_content):
+        """
+        Get parameters of Batch.Record.Modify setting records to a value
+
+        :param List[str] record_ids: DNS record IDs in DNSPod.
+        :param str record_content: Value the records should be set.
+        :rtype: Dict[str, Any]
+        """
+        return {
+            'record_id': ','.join(record_ids),
+            'change': 'value',
+            'change_to': record_content
+        }
+
+    @staticmethod
+    def _batch_detail_data(job_id):
+        """
+        Get parameters of Batch.Detail
+
+        :param str job_id: id of the batch job.
+        :rtype: Dict[str, Any]
+        """
+        return {'job_id': job_id}
+
+    @staticmethod
+    def _parse_batch_job(result, operation):
+        """
+        Parse the response of a batch submission
+
+        :param Dict[str, Any] result: API response.
+        :param str operation: what was submitted.
+        :returns: id of the job, polled with Batch.Detail
+        :rtype: str
+        :raises errors.PluginError: If the API returns error.
+        """
+        err_code = result['status']['code']
+        if err_code != '1':
+            raise errors.PluginError(
+                '[DNSPod] {0} batch job failed, err_code: {1}, '
+                'err_msg: {2}'.format(operation, err_code,
+                                      result['status']['message']))
+
+        return result['job_id']
+
+    @staticmethod
+    def _parse_batch_detail(result):
+        """
+        Parse a Batch.Detail response
+
+        :param Dict[str, Any] result: API response.
+        :returns: (whether the job is still running, record results with
+            sub_domain, value, record_id, status and error).
+        :rtype: Tuple[bool, List[Dict[str, Any]]]
+        :raises errors.PluginError: If the API returns error.
+        """
+        err_code = result['status']['code']
+        if err_code != '1':
+            raise errors.PluginError(
+                '[DNSPod] Get batch job detail failed, err_code: {0}, '
+                'err_msg: {1}'.format(err_code, result['status']['message']))
+
+        records = []
+        for domain in result.get('detail') or []:
+            for record in domain.get('records') or []:
+                records.append(dict(record, domain=domain.get('domain')))
+
+        pending = any(record.get('status') in BATCH_PENDING_STATUSES
+                      for record in records)
+
+        return pending, records
+
+    @staticmethod
+    def _batch_record_error(record):
+        """
+        Get the error of a record of a finished batch job
+
+        :param Dict[str, Any] record: record result of Batch.Detail.
+        :returns: None if the record succeeded.
+        :rtype: Optional[str]
+        """
+        if record.get('status') == 'ok' and record.get('record_id'):
+            return None
+
+        return record.get('error') or 'status: {0}'.format(
+            record.get('status'))
+
+
+class DNSPodClient(BaseDNSPodClient):
+    """Blocking DNSPod client sharing a pooled HTTP session"""
+
+    def __init__(self, *args, **kwargs):
+        super(DNSPodClient, self).__init__(*args, **kwargs)
+        self._zone_index_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close pooled connections
+
+        The client can still be used afterwards, a new pool will be
+        created on the next API call.
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def add_txt_record(self, full_domain, record_content):
+        """Add TXT record
+
+        :param str full_domain: Full domain.
+        :param str record_content: Value that the record should be set.
+        :raises errors.PluginError: if fails to create the record.
+        """
+        self.add_txt_records([(full_domain, record_content)])
+
+    def del_txt_record(self, full_domain, record_content):
+        """Delete TXT record if record value is match
+
+        :param str full_domain: Full domain.
+        :param str record_content: Value that the record should be match.
+        :raises errors.PluginError: if fails to delete the record.
+        """
+        self.del_txt_records([(full_domain, record_content)])
+
+    def get_zone(self, full_domain):
+        """Get the zone a full domain belongs to
+
+        :param str full_domain: Full domain.
+        :returns: zone name like example.com
+        :rtype: str
+        :raises errors.PluginError: If no zone contains the domain.
+        """
+        return self._split_full_domain(full_domain)[1]
+
+    def get_zones(self):
+        """Get the zones of the account
+
+        :returns: zone names like example.com, sorted.
+        :rtype: List[str]
+        """
+        return sorted(self._get_zone_index().zone_ids)
+
+    def add_txt_records(self, records):
+        """Add TXT records, listing existing records once per zone
+
+        New values are added alongside the values a name already has,
+            so e.g. the validations of a wildcard and its apex can coexist.
+            If any call fails, records created by this call are removed
+            again. With a pool, parked records of the names are modified
+            first, without listing.
+
+        :param records: (full_domain, record_content) pairs.
+        :type records: Iterable[Tuple[str, str]]
+        :raises errors.PluginError: if fails to create any record, the
+            error lists every failed domain.
+        """
+        reused = []
+        if self.pool is not None:
+            reused, records = self._take_parked_records(
+                OrderedDict.fromkeys(records))
+
+        zones = self._group_records_by_zone(records)
+
+        tasks = []
+        for base_domain, names in zones.items():
+            record_ids = self._list_txt_records(base_domain, names)
+            for full_domain, value in self._plan_additions(names, record_ids):
+                tasks.append((full_domain, value, self._create_txt_record,
+                              (full_domain, value)))
+
+        if self.batch and len(tasks) > 1:
+            created, failures = self._batch_create_tasks(tasks)
+        else:
+            succeeded, failures = self._run_tasks(tasks)
+            created = [(task[0], task[1]) for task, _ in succeeded
+                       if task[2] == self._create_txt_record]
+
+        if not failures:
+            return
+
+        created = reused + created
+        if created:
+            try:
+                self.del_txt_records(created)
+            except errors.PluginError as e:
+                logger.error('[DNSPod] Rollback of created TXT records '
+                             'failed: {0}'.format(e))
+
+        raise self._failures_error('Add TXT records', failures,
+                                   len(reused) + len(tasks))
+
+    def del_txt_records(self, records):
+        """Delete TXT records whose value match, listing once per zone
+
+        Journaled records are removed by id directly, only the others
+            need their zone to be listed. With a pool, records are parked
+            instead of removed.
+
+        :param records: (full_domain, record_content) pairs.
+        :type records: Iterable[Tuple[str, str]]
+        :raises errors.PluginError: if fails to list records of a zone,
+            or removing records raises, the error lists every failed domain.
+        """
+        journaled, unjournaled = self._split_journaled(records)
+
+        remove = self._remove_record
+        if self.pool is not None:
+            remove = self._park_record
+
+        tasks = [(full_domain, value, remove,
+                  (record_id, full_domain, zone))
+                 for full_domain, value, record_id, zone in journaled]
+
+        zones = self._group_records_by_zone(unjournaled)
+        for base_domain, names in zones.items():
+            record_ids = self._list_txt_records(base_domain, names)
+            for full_domain, value, record_id in self._plan_removals(
+                    names, record_ids):
+                tasks.append((full_domain, value, remove,
+                              (record_id, full_domain, base_domain)))
+
+        if self.batch and self.pool is None and len(tasks) > 1:
+            succeeded, failures = self._batch_remove_tasks(tasks)
+        else:
+            succeeded, failures = self._run_tasks(tasks)
+
+        self._journal_removed((task[0], task[1])
+                              for task, removed in succeeded if removed)
+
+        if failures:
+            raise self._failures_error(
+                'Delete TXT records', failures, len(tasks))
+
+    def del_journaled_records(self, older_than=None):
+        """Delete journaled records, e.g. left over by a crashed run
+
+        :param float older_than: Only delete records journaled more than
+            this many seconds ago.
+        :raises errors.PluginError: if removing records raises.
+        """
+        if self.journal is None:
+            return
+
+        self.del_txt_records([(entry['domain'], entry['value'])
+                              for entry in self.journal.entries(older_than)])
+
+    def find_stale_records(self, older_than):
+        """Find challenge TXT records left over by aborted runs
+
+        The TXT records of every zone in the account are listed, at most
+            `max_concurrency` zones at the same time. A challenge record is
+            stale if the journal journaled it more than older_than seconds
+            ago, or doesn't know it and the record was last changed more
+            than older_than seconds ago, so validations in flight of other
+            hosts sharing the account are kept. Unjournaled records of
+            unknown age, and records parked in the pool, are kept.
+
+        :param float older_than: age of journaled records to collect.
+        :returns: (stale, failures), (full_domain, zone, Record, reason)
+            tuples sorted by domain, reason being `STALE_UNJOURNALED` or
+            `STALE_EXPIRED`, and (zone, exception) pairs of zones that
+            couldn't be listed.
+        :rtype: Tuple[list, List[Tuple[str, Exception]]]
+        """
+        tasks = [(zone, None, self._list_challenge_records, (zone,))
+                 for zone in self.get_zones()]
+        succeeded, failures = self._run_tasks(tasks)
+
+        parked = set()
+        if self.pool is not None:
+            parked = set(e['record_id'] for e in self.pool.entries())
+        deadline = time.time() - older_than
+
+        stale = []
+        for task, records in succeeded:
+            for record in records:
+                if record.id in parked:
+                    continue
+
+                full_domain = '{0}.{1}'.format(record.name, task[0])
+                entry = None
+                if self.journal is not None:
+                    entry = self.journal.get(full_domain, record.value)
+
+                if entry is None:
+                    updated_on = record.updated_on
+                    if updated_on is not None and updated_on < deadline:
+                        stale.append((full_domain, task[0], record,
+                                      STALE_UNJOURNALED))
+                elif entry['created_at'] < deadline:
+                    stale.append((full_domain, task[0], record,
+                                  STALE_EXPIRED))
+
+        stale.sort(key=lambda s: (s[0], s[2].value, s[2].id))
+
+        return stale, failures
+
+    def remove_stale_records(self, stale):
+        """Remove records found by `find_stale_records`
+
+        Records are removed at most `max_concurrency` at the same time,
+            under the rate limit, and forgotten by the journal.
+
+        :param stale: (full_domain, zone, Record, reason) tuples.
+        :returns: (removed, failures), the stale tuples removed and
+            (full_domain, exception) pairs of the records that weren't.
+        :rtype: Tuple[list, List[Tuple[str, Exception]]]
+        """
+        tasks = [(item, None, self._remove_record,
+                  (item[2].id, item[0], item[1])) for item in stale]
+        succeeded, failures = self._run_tasks(tasks)
+
+        removed = []
+        for task, result in succeeded:
+            if result:
+                removed.append(task[0])
+            else:
+                failures.append((task[0], errors.PluginError(
+                    '[DNSPod] Remove record {0} failed'.format(
+                        task[0][2].id))))
+
+        self._journal_removed((full_domain, record.value)
+                              for full_domain, _, record, _ in removed)
+
+        return removed, [(item[0], e) for item, e in failures]
+
+    def reconcile(self, records, dry_run=False):
+        """Make the TXT records of some names hold exactly these values
+
+        Existing records of the names are listed once per zone, and a
+            minimal plan is made, see `ReconcilePlan`. Names not in
+            records are left alone.
+
+        :param records: (full_domain, record_content) pairs of the
+            desired values.
+        :type records: Iterable[Tuple[str, str]]
+        :param bool dry_run: Only plan, no record is changed.
+        :returns: the plan, executed unless dry_run.
+        :rtype: ReconcilePlan
+        :raises errors.PluginError: if fails to list the records, or to
+            apply any operation, the error lists every failed domain.
+        """
+        zones = self._group_records_by_zone(records)
+
+        plan = ReconcilePlan()
+        for base_domain, names in zones.items():
+            plan.add_zone(names, self._list_txt_records(base_domain, names))
+            plan.lists += 1
+
+        if dry_run or not plan.changes:
+            return plan
+
+        tasks = [(full_domain, value, self._create_txt_record,
+                  (full_domain, value))
+                 for full_domain, value in plan.creates]
+        # created values are desired, so they are kept if others fail
+        if self.batch and len(tasks) > 1:
+            _, failures = self._batch_create_tasks(tasks)
+        else:
+            _, failures = self._run_tasks(tasks)
+
+        tasks = [(full_domain, value, self._modify_txt_record,
+                  (record_id, full_domain, value))
+                 for full_domain, value, record_id, _ in plan.modifies]
+        tasks.extend((full_domain, value, self._remove_record,
+                      (record_id, full_domain))
+                     for full_domain, value, record_id in plan.removes)
+        succeeded, other_failures = self._run_tasks(tasks)
+        failures.extend(other_failures)
+
+        self._journal_removed((task[0], task[1]) for task, removed
+                              in succeeded
+                              if task[2] == self._remove_record and removed)
+
+        if failures:
+            raise self._failures_error('Reconcile TXT records', failures,
+                                       plan.changes)
+
+        return plan
+
+    def batch_create_txt_records(self, records):
+        """
+        Create TXT records with Batch.Record.Create jobs
+
+        Records are submitted in chunks of `BATCH_CHUNK_SIZE` per zone,
+            and the jobs are polled until they finish.
+
+        :param records: (base_domain, sub_domain, record_content) tuples.
+        :type records: Iterable[Tuple[str, str, str]]
+        :returns: (created, failures), (record, record_id) pairs of created
+            records and (record, error message) pairs of the others.
+        :rtype: Tuple[list, list]
+        :raises errors.PluginError: If the zones can not be listed.
+        """
+        zone_ids = self._get_zone_index().zone_ids
+        zones = OrderedDict()
+        for record in OrderedDict.fromkeys(records):
+            zones.setdefault(record[0].lower(), []).append(record)
+
+        jobs = []
+        failures = []
+        for base_domain, zone_records in zones.items():
+            if base_domain not in zone_ids:
+                failures.extend((record, 'zone not found')
+                                for record in zone_records)
+                continue
+
+            for chunk in self._chunks(zone_records, BATCH_CHUNK_SIZE):
+                data = self._batch_create_txt_data(
+                    zone_ids[base_domain],
+                    [(sub_domain, value) for _, sub_domain, value in chunk])
+                with self._span('batch_create', zone=base_domain,
+                                records=len(chunk)):
+                    jobs.append(self._submit_batch_job(
+                        'Batch.Record.Create', data, 'Create', chunk))
+
+        created, job_failures = self._wait_batch_jobs(
+            jobs, lambda record: (record[1].lower(), record[2]))
+
+        for record, record_id in created:
+            self._journal_batch_record(record[0], record[1], record[2],
+                                       record_id)
 
-# from acme.magic_typing import Dict
-# from acme.magic_typing import Any
+        return created, failures + job_failures
 
-from certbot import errors
+    def batch_modify_txt_records(self, records):
+        """
+        Modify TXT records with Batch.Record.Modify jobs
 
-from . import __version__
+        A job sets one value, so records are submitted per value, in
+            chunks of `BATCH_CHUNK_SIZE`.
 
-logger = logging.getLogger(__name__)  # pylint: disable=C0103
+        :param records: (base_domain, sub_domain, record_id, record_content)
+            tuples.
+        :type records: Iterable[Tuple[str, str, str, str]]
+        :returns: (modified, failures), (record, record_id) pairs of
+            modified records and (record, error message) pairs of the
+            others.
+        :rtype: Tuple[list, list]
+        """
+        values = OrderedDict()
+        for record in OrderedDict.fromkeys(records):
+            values.setdefault(record[3], []).append(record)
 
+        jobs = []
+        for value, value_records in values.items():
+            for chunk in self._chunks(value_records, BATCH_CHUNK_SIZE):
+                data = self._batch_modify_value_data(
+                    [record[2] for record in chunk], value)
+                with self._span('batch_modify', records=len(chunk)):
+                    jobs.append(self._submit_batch_job(
+                        'Batch.Record.Modify', data, 'Modify', chunk))
 
-NO_RECORD_CODE = '10'
+        modified, failures = self._wait_batch_jobs(
+            jobs, lambda record: (record[2], record[3]))
 
+        for record, _ in modified:
+            self._journal_batch_record(record[0], record[1], record[3],
+                                       record[2])
 
-class DNSPodClient(object):
+        return modified, failures
 
-    USER_AGENT_FMT = 'certbot-dns-dnspod/{version}({email})'
+    def _batch_create_tasks(self, tasks):
+        """
+        Run record create tasks as batch jobs
 
-    def __init__(self, api_token, ttl, contact_email):
-        """Init DNSPodClient
+        :param tasks: (full_domain, record_content, func, args) tuples.
+        :returns: (created, failures), (full_domain, record_content) pairs
+            of created records and (full_domain, exception) pairs.
+        :rtype: Tuple[list, List[Tuple[str, Exception]]]
+        """
+        full_domains = OrderedDict()
+        for full_domain, value, _, _ in tasks:
+            sub_domain, base_domain = self._split_full_domain(full_domain)
+            full_domains[(base_domain, sub_domain, value)] = full_domain
 
-        :param str api_token: API token used for authentication,
-            see: https://support.dnspod.cn/Kb/showarticle/tsid/227/
-        :param int ttl: DNS ttl, DNSPod limits ttl ranges for different
-            VIP types, If you are free user,
-            the ttl must not be less than 600.
-        :param str contact_email: Contact email used to request DNSPod API
+        created, failures = self.batch_create_txt_records(full_domains)
+
+        return (
+            [(full_domains[record], record[2]) for record, _ in created],
+            [(full_domains[record], errors.PluginError(
+                '[DNSPod] Create TXT record failed, {0}'.format(error)))
+             for record, error in failures])
+
+    def _batch_remove_tasks(self, tasks):
         """
-        self.api_token = api_token
-        self.ttl = ttl
-        self.contact_email = contact_email
-        self.user_agent = self.USER_AGENT_FMT.format(
-            version=__version__,
-            email=contact_email)
+        Run record remove tasks as batch jobs
 
-    def add_txt_record(self, full_domain, record_content):
-        """Add TXT record
+        The legacy API has no batch remove, so the records are removed
+            one by one, backends with one override this.
 
-        :param str full_domain: Full domain.
-        :param str record_content: Value that the record should be set.
-        :raises errors.PluginError: if fails to create the record.
+        :param tasks: (full_domain, record_content, func, args) tuples.
+        :returns: see `_run_tasks`.
+        :rtype: Tuple[list, List[Tuple[str, Exception]]]
         """
-        org_record = self._get_txt_record_info_if_exists(full_domain)
+        return self._run_tasks(tasks)
 
-        if org_record:
-            if org_record['value'] != record_content:
-                self._modify_txt_record(org_record['id'],
-                                        full_domain,
-                                        record_content)
-        else:
-            self._create_txt_record(full_domain, record_content)
+    def _submit_batch_job(self, action, data, operation, records):
+        """
+        Submit a batch job
 
-    def del_txt_record(self, full_domain, record_content):
-        """Delete TXT record if record value is match
+        :returns: (job_id, records, error), job_id is None and error tells
+            why if the submission failed.
+        :rtype: Tuple[Optional[str], list, Optional[str]]
+        """
+        try:
+            result = self._do_post(self._get_url(action), data)
+            return self._parse_batch_job(result, operation), records, None
+        except errors.PluginError as e:
+            return None, records, str(e)
 
-        :param str full_domain: Full domain.
-        :param str record_content: Value that the record should be match.
-        :raises errors.PluginError: if fails to delete the record.
+    def _wait_batch_jobs(self, jobs, get_key):
+        """
+        Poll batch jobs until they finish and match records to results
+
+        :param jobs: (job_id, records, error) of `_submit_batch_job`.
+        :param callable get_key: gets the (sub_domain lower cased, value)
+            key of a create record, the (record_id, value) key of a modify
+            record or the (record_id,) key of a remove record, matched
+            against job results.
+        :returns: (succeeded, failures), (record, record_id) pairs and
+            (record, error message) pairs.
+        :rtype: Tuple[list, list]
+        """
+        succeeded = []
+        failures = []
+        pending = []
+
+        for job_id, records, error in jobs:
+            if job_id is None:
+                failures.extend((record, error) for record in records)
+            else:
+                pending.append((job_id, records))
+
+        deadline = time.time() + BATCH_TIMEOUT
+        interval = BATCH_POLL_INTERVAL
+        while pending:
+            still_pending = []
+            for job_id, records in pending:
+                try:
+                    with self._span('batch_detail', job_id=job_id):
+                        result = self._do_post(
+                            self._get_url('Batch.Detail'),
+                            self._batch_detail_data(job_id))
+                    running, results = self._parse_batch_detail(result)
+                except errors.PluginError as e:
+                    failures.extend((record, str(e)) for record in records)
+                    continue
+
+                if running:
+                    still_pending.append((job_id, records))
+                    continue
+
+                done, job_failures = self._match_batch_results(
+                    records, results, get_key)
+                succeeded.extend(done)
+                failures.extend(job_failures)
+
+            pending = still_pending
+            if not pending:
+                break
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                for job_id, records in pending:
+                    failures.extend(
+                        (record, 'batch job {0} timed out'.format(job_id))
+                        for record in records)
+                break
+
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, BATCH_MAX_POLL_INTERVAL)
+
+        return succeeded, failures
+
+    def _match_batch_results(self, records, results, get_key):
+        """
+        Map the results of a finished job back to its records
+
+        :returns: (succeeded, failures), see `_wait_batch_jobs`.
+        :rtype: Tuple[list, list]
+        """
+        by_key = {}
+        for result in results:
+            for key in ((result.get('sub_domain', '').lower(),
+                         result.get('value')),
+                        (result.get('record_id'), result.get('value')),
+                        (result.get('record_id'),)):
+                by_key.setdefault(key, result)
+
+        succeeded = []
+        failures = []
+        for record in records:
+            result = by_key.get(get_key(record))
+            if result is None:
+                failures.append((record, 'missing from batch job result'))
+                continue
+
+            error = self._batch_record_error(result)
+            if error is None:
+                succeeded.append((record, result['record_id']))
+            else:
+                failures.append((record, error))
+
+        return succeeded, failures
+
+    def _journal_batch_record(self, base_domain, sub_domain, record_content,
+                              record_id):
+        """Journal a record created or modified by a batch job"""
+        full_domain = base_domain
+        if sub_domain != '@':
+            full_domain = '{0}.{1}'.format(sub_domain, base_domain)
+
+        self._journal_record(full_domain, record_content, record_id,
+                             base_domain)
+
+    @staticmethod
+    def _chunks(items, size):
+        for i in range(0, len(items), size):
+            yield items[i:i + size]
+
+    def _run_tasks(self, tasks):
+        """
+        Run record API calls, at most `max_concurrency` at the same time
+
+        :param tasks: (full_domain, record_content, func, args) tuples,
+            func(*args) does the API call.
+        :returns: (succeeded, failures), (task, result) pairs of succeeded
+            tasks and (full_domain, exception) pairs of failed tasks.
+        :rtype: Tuple[list, List[Tuple[str, Exception]]]
+        """
+        succeeded = []
+        failures = []
+
+        if self.max_concurrency == 1 or len(tasks) <= 1:
+            for task in tasks:
+                try:
+                    result = task[2](*task[3])
+                except Exception as e:  # pylint: disable=broad-except
+                    failures.append((task[0], e))
+                else:
+                    succeeded.append((task, result))
+            return succeeded, failures
+
+        workers = min(self.max_concurrency, len(tasks))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # tasks run in the pool keep the caller's span as parent
+            bind = self.tracer.bind if self.tracer is not None else None
+            futures = [(task, executor.submit(
+                bind(task[2]) if bind else task[2], *task[3]))
+                for task in tasks]
+            for task, future in futures:
+                try:
+                    result = future.result()
+                except Exception as e:  # pylint: disable=broad-except
+                    failures.append((task[0], e))
+                else:
+                    succeeded.append((task, result))
+
+        return succeeded, failures
+
+    def _group_records_by_zone(self, records):
+        """
+        Group records by the zone and the sub_domain they belong to
+
+        :param records: (full_domain, record_content) pairs.
+        :type records: Iterable[Tuple[str, str]]
+        :returns: zone => sub_domain => (full_domain, values), in the order
+            the records were given.
+        :rtype: OrderedDict[str, OrderedDict[str, Tuple[str, List[str]]]]
         """
-        org_record = self._get_txt_record_info_if_exists(full_domain)
+        records = list(records)
+        if not records:
+            return OrderedDict()
 
-        if org_record:
-            if org_record['value'] == record_content:
-                self._remove_record(org_record['id'], full_domain)
+        return self._group_with_index(self._get_zone_index(), records)
 
     def _create_txt_record(self, full_domain, record_content):
         """Create TXT record
 
-        :param str record_id: DNS record ID in DNSPod.
         :param str full_domain: Full domain.
         :param str record_content: Value that the record should be set.
+        :returns: DNS record ID of the created record.
+        :rtype: str
         :raises errors.PluginError: If fails to create record.
         """
         sub_domain, base_domain = self._split_full_domain(full_domain)
 
-        data = {
-            'domain': base_domain,
-            'sub_domain': sub_domain,
-            'record_type': 'TXT',
-            'record_line': '默认',
-            'value': record_content,
-            'ttl': self.ttl
-        }
-
-        result = self._do_post(self._get_url('Record.Create'), data)
+        data = self._create_txt_record_data(sub_domain, base_domain,
+                                            record_content)
 
-        err_code = result['status']['code']
-        if err_code != '1':
-            raise errors.PluginError(
-                '[DNSPod] Create TXT record failed,'
-                'domain: {0}, err_code: {1}, err_msg: {2}'.format(
-                    full_domain, err_code, result['status']['message']))
+        with self._span('create', domain=full_domain):
+            result = self._do_post(self._get_url('Record.Create'), data)
 
-        return True
+        return self._parse_create_txt_record(result, full_domain,
+                                             record_content, base_domain)
 
-    def _modify_txt_record(self, record_id, full_domain, record_content):
+    def _modify_txt_record(self, record_id, full_domain, record_content,
+                           base_domain=None):
         """Modify TXT record
 
         :param str record_id: DNS record ID in DNSPod.
         :param str full_domain: Full domain.
         :param str record_content: Value that the record should be set.
+        :param str base_domain: Zone of the record, found from full_domain
+            if not given.
         :raises errors.PluginError: If fails to modify the record.
         """
-        sub_domain, base_domain = self._split_full_domain(full_domain)
+        if base_domain is None:
+            sub_domain, base_domain = self._split_full_domain(full_domain)
+        else:
+            sub_domain = self._sub_domain(full_domain, base_domain)
 
-        data = {
-            'domain': base_domain,
-            'record_id': record_id,
-            'sub_domain': sub_domain,
-            'record_type': 'TXT',
-            'record_line': '默认',
-            'value': record_content
-        }
+        data = self._modify_txt_record_data(record_id, sub_domain,
+                                            base_domain, record_content)
 
-        result = self._do_post(self._get_url('Record.Modify'), data)
+        with self._span('modify', domain=full_domain):
+            result = self._do_post(self._get_url('Record.Modify'), data)
 
-        err_code = result['status']['code']
-        if err_code != '1':
-            raise errors.PluginError(
-                '[DNSPod] Modify TXT record failed, domain:'
-                ' {0}, err_code: {1}, err_msg: {2}'.format(
-                    full_domain, err_code, result['status']['message']))
+        self._parse_modify_txt_record(result, record_id, full_domain,
+                                      record_content, base_domain)
 
-    def _get_txt_record_info_if_exists(self, full_domain):
+    def _park_record(self, record_id, full_domain, base_domain=None):
         """
-        Get TXT record info by full domain
+        Park a record in the pool instead of removing it
 
+        :param str record_id: DNS record ID in DNSPod
         :param str full_domain: Full domain.
-        :returns: record of the domain, None if not exists.
-        :rtype: Optional[Dict[str, Any]]
-        :raises errors.PluginError: If the API returns error.
+        :param str base_domain: Zone of the record, found from full_domain
+            if not given.
+        :returns: True, like `_remove_record` when the record is gone,
+            also if it was already removed, then it isn't parked.
+        :rtype: bool
+        :raises errors.PluginError: If fails to modify the record.
+        """
+        if base_domain is None:
+            _, base_domain = self._split_full_domain(full_domain)
+
+        try:
+            self._modify_txt_record(record_id, full_domain, PARKED_VALUE,
+                                    base_domain)
+        except RecordGoneError as e:
+            logger.info('[DNSPod] Record of {0} is already removed, not '
+                        'parking it: {1}'.format(full_domain, e))
+            return True
+
+        self.pool.park(full_domain, record_id, base_domain)
+
+        return True
+
+    def _take_parked_records(self, records):
+        """
+        Set values on records parked in the pool
+
+        A parked record that can't be modified, e.g. removed by hand, is
+            dropped from the pool and its value is created as usual.
+
+        :param records: (full_domain, record_content) pairs.
+        :returns: ((full_domain, record_content) pairs set on parked
+            records, pairs left to create).
+        :rtype: Tuple[list, list]
         """
+        tasks = []
+        rest = []
+        for full_domain, value in records:
+            entry = self.pool.take(full_domain)
+            if entry is None:
+                rest.append((full_domain, value))
+            else:
+                tasks.append((full_domain, value, self._modify_txt_record,
+                              (entry['record_id'], full_domain, value,
+                               entry['zone'])))
 
+        succeeded, failures = self._run_tasks(tasks)
+        for full_domain, e in failures:
+            logger.warning('[DNSPod] Unable to reuse parked record of '
+                           '{0}, creating it: {1}'.format(full_domain, e))
+
+        reused = [(task[0], task[1]) for task, _ in succeeded]
+        rest.extend((task[0], task[1]) for task in tasks
+                    if (task[0], task[1]) not in reused)
+
+        return reused, rest
+
+    def _get_txt_record_ids(self, full_domain):
+        """
+        Get all TXT values of a full domain
+
+        :param str full_domain: Full domain.
+        :returns: record values mapped to their record ids.
+        :rtype: Dict[str, str]
+        :raises errors.PluginError: If the API returns error.
+        """
         sub_domain, base_domain = self._split_full_domain(full_domain)
 
-        data = {
-            'domain': base_domain,
-            'sub_domain': sub_domain,
-            'record_type': 'TXT'
-        }
+        record_ids = self._list_txt_records(base_domain, [sub_domain])
 
-        result = self._do_post(self._get_url('Record.List'), data)
+        return record_ids.get(sub_domain.lower(), {})
 
-        err_code = result['status']['code']
-        if err_code == NO_RECORD_CODE:
-            return None
-        elif err_code != '1':
-            full_domain = '{0}.{1}'.format(sub_domain, base_domain)
-            raise errors.PluginError(
-                '[DNSPod] Get TXT record info failed, domain: {0},'
-                ' err_code: {1}, err_msg: {2}'.format(
-                    full_domain, err_code, result['status']['message']))
+    def iter_records(self, base_domain, sub_domain=None, record_type=None,
+                     keyword=None, page_size=RECORD_LIST_PAGE_SIZE):
+        """
+        Iterate records of a zone, fetching pages lazily
+
+        :param str base_domain: Zone of the records.
+        :param str sub_domain: only list records of this sub_domain.
+        :param str record_type: only list records of this type.
+        :param str keyword: only list records whose sub_domain or value
+            contains it.
+        :param int page_size: max number of records fetched per call.
+        :rtype: Iterator[Record]
+        :raises errors.PluginError: If the API returns error.
+        """
+        offset = 0
+        has_more = True
+
+        while has_more:
+            data = self._list_records_data(base_domain, offset, page_size,
+                                           sub_domain, record_type, keyword)
+            with self._span('list', zone=base_domain, offset=offset):
+                result = self._do_post(self._get_url('Record.List'), data)
 
-        records = result.get('records') or []
-        if records:
-            return records[0]
+            records, has_more = self._parse_list_records(result, data)
+            offset += len(records)
+            for record in records:
+                yield record
 
-    def _remove_record(self, record_id, full_domain):
+    def _list_challenge_records(self, base_domain):
+        """
+        List the challenge TXT records of a zone
+
+        :param str base_domain: Zone of the records.
+        :rtype: List[Record]
+        :raises errors.PluginError: If the API returns error.
+        """
+        return [record for record in self.iter_records(
+            base_domain, record_type='TXT', keyword=CHALLENGE_LABEL)
+            if record.name.lower().split('.')[0] == CHALLENGE_LABEL]
+
+    def _list_txt_records(self, base_domain, sub_domains):
+        """
+        List TXT records of some sub_domains of a zone
+
+        One call is enough unless the zone has more matching records
+            than a page holds.
+
+        :param str base_domain: Zone of the records.
+        :param Collection[str] sub_domains: sub_domains the caller needs.
+        :returns: lower cased sub_domain => record value => record id,
+            a name can hold several values.
+        :rtype: Dict[str, Dict[str, str]]
+        :raises errors.PluginError: If the API returns error.
+        """
+        records = self.iter_records(
+            base_domain, record_type='TXT',
+            **self._list_txt_records_filters(sub_domains))
+
+        return self._index_records(records, sub_domains)
+
+    def _remove_record(self, record_id, full_domain, base_domain=None):
         """
         Remove DNS record
 
         :param str record_id: DNS record ID in DNSPod
         :param str full_domain: Full domain.
+        :param str base_domain: Zone of the record, found from full_domain
+            if not given.
         :returns: whether the operation is success
         :rtype: bool
         """
-        _, base_domain = self._split_full_domain(full_domain)
-
-        data = {
-            'domain': base_domain,
-            'record_id': record_id
-        }
+        if base_domain is None:
+            _, base_domain = self._split_full_domain(full_domain)
 
-        result = self._do_post(self._get_url('Record.Remove'), data)
+        data = self._remove_record_data(record_id, base_domain)
 
-        err_code = result['status']['code']
-        if err_code != '1':
-            logger.error(
-                '[DNSPod] Remove record failed, domain: {0}, '
-                'err_code: {1}, err_msg: {2}'.format(
-                    full_domain, err_code, result['status']['message']
-                ))
-            return False
+        with self._span('remove', domain=full_domain):
+            result = self._do_post(self._get_url('Record.Remove'), data)
 
-        return True
+        return self._parse_remove_record(result, full_domain)
 
-    @staticmethod
-    def _get_url(action):
+    def _get_session(self):
         """
-        Get API URL from action
+        Get the HTTP session shared by all API calls
 
-        :param str action: action
-        :returns: full URL of API
-        :rtype: str
+        :returns: session with a connection pool mounted for the API
+        :rtype: requests.Session
         """
-        return 'https://dnsapi.cn/{0}'.format(
-            action
-        )
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=len(self.endpoints.base_urls),
+                pool_maxsize=max(self.pool_size, self.max_concurrency))
+            for base_url in self.endpoints.base_urls:
+                session.mount(base_url, adapter)
+            session.headers['User-Agent'] = self.user_agent
+            if not self.keep_alive:
+                session.headers['Connection'] = 'close'
+            self._session = session
+
+        return self._session
 
     def _do_post(self, url, data):
         """
@@ -214,36 +1783,150 @@ class DNSPodClient(object):
         if not data:
             data = {}
 
-        common_data = {
-            'login_token': self.api_token,
-            'format': 'json',
-            'error_on_empty': 'no',
-            'lang': 'en'
-        }
+        data.update(self._common_data())
 
-        data.update(common_data)
+        action = self._get_action(url)
+        zone = self._request_zone(data)
+        if action in self.READ_ACTIONS:
+            key = (action, json.dumps(data, sort_keys=True))
+            return self.reads.do(key, zone,
+                                 lambda: self._post(url, action, data))
 
-        headers = {
-            'User-Agent': self.user_agent
-        }
+        try:
+            return self._post(url, action, data)
+        finally:
+            # the action may have changed records of the zone
+            self.reads.invalidate(zone)
 
-        resp = requests.post(url, data=data, headers=headers)
-        if resp.status_code != 200:
-            raise errors.PluginError(
-                '[DNSPod] HTTP Error, status_code: {0}, url: {1}'
-                .format(resp.status_code, url))
+    def _post(self, url, action, data):
+        """
+        Send a request under the rate limit, retrying failures
+
+        :param str url: URL for DNSPod API.
+        :param str action: action of the URL.
+        :param Dict[str, Any] data: request parameters, common ones
+            included.
+        :returns: API response
+        :rtype: Dict[str, Any]
+        """
+        attempts = [0]
+
+        def send():
+            # every attempt goes to the endpoint preferred at the time,
+            # so a retry fails over from an endpoint that just failed
+            attempts[0] += 1
+            base_url = self.endpoints.choose()
+            target = self._get_url(action, base_url)
+            sent_at = time.time()
+            try:
+                result = self._send_post(target, data)
+            except Exception as e:
+                if self._is_endpoint_failure(e):
+                    self.endpoints.failure(base_url)
+                raise
+
+            self.endpoints.success(base_url, time.time() - sent_at)
+            return result
+
+        started_at = time.time()
+        with self._span(action) as span:
+            try:
+                return self.scheduler.run(
+                    send, lambda e: self._is_retryable(e, action))
+            finally:
+                self._observe_call(url, started_at, attempts[0])
+                if span is not None:
+                    span['attrs']['attempts'] = attempts[0]
 
+    def _send_post(self, url, data):
+        """
+        Send one request to DNSPod API
+
+        :param str url: URL for DNSPod API.
+        :param Dict[str, Any] data: request parameters
+        :returns: API response
+        :rtype: Dict[str, Any]
+        :raises RetryableError: If the request failed transiently.
+        """
         try:
-            result = resp.json()
-        except Exception:
-            raise errors.PluginError(
-                '[DNSPod] API response with non JSON, url: {0}, content: {1}'
-                .format(url, resp.text))
+            resp = self._get_session().post(url, data=data,
+                                            timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            self._observe_request(url, 'error')
+            raise
 
-        return result
+        return self._parse_response(url, resp.status_code, resp.content,
+                                    len(resp.request.body or ''))
+
+    def _is_retryable(self, e, action=None):
+        """
+        Tell whether a failed request may be sent again
+
+        Requests that never reached the API, like connect errors, and
+            rate limited ones, like HTTP 429, are retried. Requests that
+            may have been applied, failing with 5xx or after the
+            connection was made, are retried for `READ_ACTIONS` only, so
+            e.g. a create isn't applied twice. Read timeouts are never retried.
+
+        :param Exception e: error raised by `_send_post`.
+        :param str action: action of the request.
+        :rtype: bool
+        """
+        if self._is_unsent(e):
+            return True
+        if isinstance(e, requests.exceptions.Timeout):
+            return False
+
+        if isinstance(e, (UnavailableError,
+                          requests.exceptions.ConnectionError)):
+            return action in self.READ_ACTIONS
+
+        return isinstance(e, RetryableError)
+
+    @staticmethod
+    def _is_unsent(e):
+        """
+        Tell whether a failed request never reached the API
+
+        :param Exception e: error raised by `_send_post`.
+        :rtype: bool
+        """
+        if isinstance(e, requests.exceptions.ConnectTimeout):
+            return True
+        if not isinstance(e, requests.exceptions.ConnectionError):
+            return False
+
+        reason = getattr(e.args[0], 'reason', None) if e.args else None
+        return isinstance(reason, NewConnectionError)
 
     @staticmethod
-    def _split_full_domain(full_domain):
+    def _is_endpoint_failure(e):
+        """
+        Tell whether a failed request counts against its endpoint
+
+        :param Exception e: error raised by `_send_post`.
+        :rtype: bool
+        """
+        return isinstance(e, (UnavailableError,
+                              requests.exceptions.ConnectionError,
+                              requests.exceptions.Timeout))
+
+    @staticmethod
+    def _sub_domain(full_domain, base_domain):
+        """
+        Get the sub_domain of a full domain in a known zone
+
+        :param str full_domain: domain like abc.example.com
+        :param str base_domain: zone like example.com
+        :rtype: str
+        """
+        full_domain = full_domain.rstrip('.')
+        if full_domain.lower() == base_domain.lower():
+            return '@'
+
+        return full_domain[:-len(base_domain) - 1]
+
+    def _split_full_domain(self, full_domain):
         """
         Split full domain into sub_domain and base_domain
 
@@ -251,19 +1934,56 @@ class DNSPodClient(object):
         :returns: (sub_domain, base_domain) splitted domain parts,
             'abc.example.com' will be splitted into ('abc', 'example.com')
         :rtype: Tuple[str, str]
+        :raises errors.PluginError: If no zone contains the domain.
         """
-        parts = full_domain.rsplit('.', 2)
+        return self._split_with_index(self._get_zone_index(), full_domain)
 
-        if len(parts) == 3:
-            sub_domain, domain, tld = parts
-        elif len(parts) == 2:
-            sub_domain = '@'
-            domain, tld = parts
-        else:
-            raise errors.PluginError(
-                '[DNSPod] Unable to split full domain: {0}'
-                .format(full_domain))
+    def _get_zone_index(self):
+        """
+        Get the index of zones in the account, fetching it when expired
+
+        :rtype: ZoneIndex
+        """
+        with self._zone_index_lock:
+            if self._zone_index_expired():
+                with self._span('zone_resolution'):
+                    return self._set_zone_index(self._load_domains())
+
+            return self._zone_index
+
+    def _load_domains(self):
+        """
+        List all domains of the account, unless another process sharing
+        the cache listed them already
+
+        :returns: domain names mapped to their ids
+        :rtype: Dict[str, str]
+        :raises errors.PluginError: If the API returns error.
+        """
+        if self.shared_cache is None:
+            return self._list_domains()
+
+        domains = self.shared_cache.get_zones()
+        if domains is None:
+            domains = self._list_domains()
+            self.shared_cache.set_zones(domains, self.zone_cache_ttl)
+
+        return domains
+
+    def _list_domains(self):
+        """
+        List all domains of the account
+
+        :returns: domain names mapped to their ids
+        :rtype: Dict[str, str]
+        :raises errors.PluginError: If the API returns error.
+        """
+        domains = {}
+        has_more = True
 
-        base_domain = '{0}.{1}'.format(domain, tld)
+        while has_more:
+            result = self._do_post(self._get_url('Domain.List'),
+                                   self._list_domains_data(len(domains)))
+            has_more = self._parse_list_domains(result, domains)
 
-        return sub_domain, base_domain
+        return domains
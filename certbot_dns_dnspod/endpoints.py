@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Latency based selection of DNSPod API endpoints, with failover"""
+
+import threading
+import time
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN = 30
+DEFAULT_PROBE_INTERVAL = 60
+
+# Weight of the latest round trip in the moving average
+RTT_SMOOTHING = 0.3
+
+
+class EndpointSelector(object):
+    """Pick the fastest healthy endpoint of several serving the same API
+
+    Round trips of requests are averaged per endpoint, and endpoints not
+        measured for probe_interval are tried again, so the choice
+        follows the network. Each endpoint has a circuit breaker: after
+        failure_threshold failures in a row it is not used for cooldown
+        seconds, then one request may try it again, the others keep
+        avoiding it until that trial succeeds, fails, or is not heard of
+        for cooldown seconds. A failure also puts
+        an endpoint behind the others right away, so the retry of a
+        failed request goes elsewhere.
+    """
+
+    def __init__(self, base_urls, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 cooldown=DEFAULT_COOLDOWN,
+                 probe_interval=DEFAULT_PROBE_INTERVAL):
+        """Init EndpointSelector
+
+        :param List[str] base_urls: URLs the API actions are relative to,
+            preferred in this order while unmeasured.
+        :param int failure_threshold: failures in a row opening the
+            circuit of an endpoint.
+        :param float cooldown: seconds an open circuit lasts.
+        :param float probe_interval: seconds after which an endpoint is
+            measured again.
+        """
+        self.base_urls = [url.rstrip('/') + '/' for url in base_urls]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._states = dict((url, {
+            'rtt': None,
+            'measured_at': 0,
+            'failures': 0,
+            'open_until': 0,
+            'trial_at': 0,
+        }) for url in self.base_urls)
+
+    def choose(self, trial=True):
+        """
+        Get the endpoint the next request is sent to
+
+        Endpoints with an open circuit are skipped, unless all are open,
+            then the one closing first is used.
+
+        :param bool trial: whether a request is sent to the endpoint, so
+            it is the trial if the endpoint is half open; False to only
+            look at the preference.
+        :rtype: str
+        """
+        if len(self.base_urls) == 1:
+            return self.base_urls[0]
+
+        now = time.time()
+        with self._lock:
+            url = min(self.base_urls, key=lambda url: self._rank(url, now))
+            state = self._states[url]
+            if trial and state['open_until'] and state['open_until'] <= now:
+                # half open, this request is the trial
+                state['trial_at'] = now
+
+            return url
+
+    def success(self, base_url, rtt):
+        """Record a request an endpoint answered
+
+        :param str base_url: endpoint of the request.
+        :param float rtt: seconds the request took.
+        """
+        with self._lock:
+            state = self._states[base_url]
+            if state['rtt'] is None:
+                state['rtt'] = rtt
+            else:
+                state['rtt'] += RTT_SMOOTHING * (rtt - state['rtt'])
+            state['measured_at'] = time.time()
+            state['failures'] = 0
+            state['open_until'] = 0
+            state['trial_at'] = 0
+
+    def failure(self, base_url):
+        """Record a request an endpoint failed to answer
+
+        :param str base_url: endpoint of the request.
+        """
+        with self._lock:
+            state = self._states[base_url]
+            state['failures'] += 1
+            state['trial_at'] = 0
+            if state['failures'] >= self.failure_threshold:
+                state['open_until'] = time.time() + self.cooldown
+
+    def is_open(self, base_url):
+        """
+        Tell whether the circuit of an endpoint is open
+
+        :param str base_url: endpoint.
+        :rtype: bool
+        """
+        with self._lock:
+            return self._states[base_url]['open_until'] > time.time()
+
+    def _rank(self, url, now):
+        """Sort key of an endpoint, lower is better"""
+        state = self._states[url]
+        index = self.base_urls.index(url)
+        if state['open_until'] > now:
+            return (1, state['open_until'], 0, index)
+        if state['open_until']:
+            trial_until = state['trial_at'] + self.cooldown
+            if trial_until > now:
+                # half open with its trial in flight
+                return (1, trial_until, 0, index)
+            # half open, a failure opens the circuit again
+            return (0, 0, 0, index)
+
+        rtt = state['rtt']
+        if rtt is None or now - state['measured_at'] > self.probe_interval:
+            rtt = 0
+
+        return (0, state['failures'], rtt, index)
@@ -0,0 +1,792 @@
+# -*- coding: utf-8 -*-
+"""In-process stand-in for the DNSPod API
+
+Meant for load and latency testing of the clients, it keeps zones and
+records in memory and serves Domain.List, Record.List, Create, Modify
+and Remove, and the Batch.Record.Create and Modify jobs over HTTP on a
+local port:
+
+    with FakeDNSPodServer(zones=['example.com'], latency=0.05) as server:
+        client = DNSPodClient(token, 600, email, base_url=server.base_url)
+
+Requests carrying an X-TC-Action header are served as Tencent Cloud API
+v3 calls instead, their TC3-HMAC-SHA256 signature is checked when a
+secret_key is given.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from collections import OrderedDict
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qsl
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+DEFAULT_PAGE_SIZE = 3000
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Hand POSTed API actions over to the FakeDNSPodServer"""
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+
+        if self.headers.get('X-TC-Action'):
+            status_code, result = self.server.fake.handle_v3(
+                self.headers['X-TC-Action'], self.headers, body)
+        else:
+            action = self.path.strip('/').split('/')[-1]
+            status_code, result = self.server.fake.handle(
+                action, dict(parse_qsl(body.decode('utf-8'),
+                                       keep_blank_values=True)))
+
+        content = json.dumps(result).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        logger.debug('[FakeDNSPod] ' + format, *args)
+
+
+class FakeDNSPodServer(object):
+    """Local DNSPod API keeping zones and records in memory
+
+    Every request waits `latency` plus up to `jitter` seconds, fails with
+        HTTP 502 with probability `error_rate`, and is rejected with
+        DNSPod's '-2' usage limit code above `rate_limit` requests per
+        second, so clients can be studied under slow, flaky or
+        throttled APIs. With `lost_response_rate`, requests are applied
+        but answered with HTTP 502, like a gateway losing the response.
+        `calls` counts the requests of every action.
+
+    Batch jobs are applied when submitted, Batch.Detail reports them
+        running on the first poll and finished after.
+    """
+
+    def __init__(self, zones=None, latency=0, jitter=0, error_rate=0,
+                 rate_limit=None, api_token=None, host='127.0.0.1', port=0,
+                 seed=None, rejected_values=None, secret_id=None,
+                 secret_key=None, lost_response_rate=0):
+        """Init FakeDNSPodServer
+
+        :param zones: names of the zones hosted in the account.
+        :type zones: Optional[Iterable[str]]
+        :param float latency: Seconds every request takes at least.
+        :param float jitter: Max random seconds added to the latency.
+        :param float error_rate: Fraction of requests failing with 502.
+        :param float rate_limit: Max requests per second, unlimited
+            if None.
+        :param str api_token: login_token requests must carry, any token
+            is accepted if None.
+        :param str host: Address to listen on.
+        :param int port: Port to listen on, a free one if 0.
+        :param int seed: Seed of the jitter and error randomness.
+        :param rejected_values: record values creates and modifies fail
+            with, to test failures of single records.
+        :type rejected_values: Optional[Iterable[str]]
+        :param str secret_id: SecretId v3 requests must be signed by.
+        :param str secret_key: SecretKey v3 requests must be signed with,
+            signatures are not checked if None.
+        :param float lost_response_rate: Fraction of requests applied,
+            then failing with 502.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.lost_response_rate = lost_response_rate
+        self.rate_limit = rate_limit
+        self.api_token = api_token
+        self.secret_id = secret_id
+        self.secret_key = secret_key
+        self.rejected_values = set(rejected_values or [])
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._zones = OrderedDict()
+        self._jobs = {}
+        self._next_id = 1
+        self._tokens = float(rate_limit or 0)
+        self._tokens_updated_at = time.time()
+        self._server = _ThreadingHTTPServer((host, port), _Handler)
+        self._server.fake = self
+        self._thread = None
+
+        for zone in zones or []:
+            self.add_zone(zone)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def base_url(self):
+        """URL to pass as `base_url` of the clients"""
+        host, port = self._server.server_address[:2]
+        return 'http://{0}:{1}/'.format(host, port)
+
+    def start(self):
+        """Serve requests in a background thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever,
+                                            args=(0.05,))
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop serving and release the port"""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def add_zone(self, name):
+        """
+        Host a zone in the account
+
+        :param str name: zone name like example.com
+        :returns: domain id of the zone.
+        :rtype: str
+        """
+        with self._lock:
+            zone_id = self._new_id()
+            self._zones[name.lower()] = {
+                'id': zone_id,
+                'name': name.lower(),
+                'records': OrderedDict(),
+            }
+            return zone_id
+
+    def add_record(self, zone, sub_domain, value, record_type='TXT',
+                   updated_on=None):
+        """
+        Add a record without going through the API
+
+        :param str zone: zone name of the record.
+        :param str sub_domain: sub_domain of the record, '@' for the apex.
+        :param str value: value of the record.
+        :param str record_type: type of the record.
+        :param float updated_on: seconds since the epoch the record was
+            last changed, now if None.
+        :returns: record id.
+        :rtype: str
+        """
+        with self._lock:
+            return self._create(self._zones[zone.lower()], sub_domain,
+                                record_type, value, '600', updated_on)
+
+    def records(self, zone):
+        """
+        Get the records of a zone
+
+        :param str zone: zone name.
+        :returns: copies of the records, with id, name, type and value.
+        :rtype: List[Dict[str, str]]
+        """
+        with self._lock:
+            return [dict(record) for record
+                    in self._zones[zone.lower()]['records'].values()]
+
+    def handle(self, action, params):
+        """
+        Serve one API request
+
+        :param str action: API action like Record.List
+        :param Dict[str, str] params: form parameters.
+        :returns: (HTTP status code, JSON response).
+        :rtype: Tuple[int, Dict[str, Any]]
+        """
+        self._delay()
+
+        with self._lock:
+            rejected = self._admit(action)
+            if rejected == 'error':
+                return 502, {}
+            if rejected == 'limited':
+                return 200, self._status('-2', 'API usage is limited')
+
+            token = params.get('login_token')
+            if self.api_token is not None and token != self.api_token:
+                return 200, self._status('-1', 'Login failed')
+
+            handler = self._ACTIONS.get(action)
+            if handler is None:
+                return 404, {}
+
+            result = handler(self, params)
+            if self._lose_response():
+                return 502, {}
+
+            return 200, result
+
+    def handle_v3(self, action, headers, payload):
+        """
+        Serve one Tencent Cloud API v3 request
+
+        :param str action: X-TC-Action like DescribeRecordList
+        :param headers: request headers, signed ones included.
+        :param bytes payload: JSON request body.
+        :returns: (HTTP status code, JSON response).
+        :rtype: Tuple[int, Dict[str, Any]]
+        """
+        self._delay()
+
+        with self._lock:
+            rejected = self._admit(action)
+            if rejected == 'error':
+                return 502, {}
+
+            if rejected == 'limited':
+                result = self._v3_error('RequestLimitExceeded',
+                                        'Request limit exceeded')
+            elif not self._v3_authorized(headers, payload):
+                result = self._v3_error('AuthFailure.SignatureFailure',
+                                        'Signature verification failed')
+            elif action not in self._V3_ACTIONS:
+                result = self._v3_error('InvalidAction',
+                                        'Unknown action: ' + action)
+            else:
+                result = self._V3_ACTIONS[action](
+                    self, json.loads(payload.decode('utf-8')))
+                if self._lose_response():
+                    return 502, {}
+
+        result['RequestId'] = self._new_id()
+        return 200, {'Response': result}
+
+    def _delay(self):
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _admit(self, action):
+        """
+        Count a request and tell why it is rejected, if it is
+
+        :returns: 'error' for a 502, 'limited' above the rate limit,
+            None if the request is served.
+        :rtype: Optional[str]
+        """
+        self.calls[action] += 1
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            return 'error'
+
+        if not self._take_token():
+            return 'limited'
+
+        return None
+
+    def _lose_response(self):
+        """Tell whether the response of an applied request is lost"""
+        return bool(self.lost_response_rate) and \
+            self._random.random() < self.lost_response_rate
+
+    def _v3_authorized(self, headers, payload):
+        """Check the TC3-HMAC-SHA256 signature of a v3 request"""
+        if self.secret_key is None:
+            return True
+
+        timestamp = int(headers.get('X-TC-Timestamp') or 0)
+        date = time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+        canonical_request = (
+            'POST\n/\n\ncontent-type:{0}\nhost:{1}\n\n'
+            'content-type;host\n{2}'.format(
+                headers.get('Content-Type'), headers.get('Host'),
+                hashlib.sha256(payload).hexdigest()))
+        string_to_sign = 'TC3-HMAC-SHA256\n{0}\n{1}/dnspod/tc3_request\n{2}'\
+            .format(timestamp, date, hashlib.sha256(
+                canonical_request.encode('utf-8')).hexdigest())
+
+        key = ('TC3' + self.secret_key).encode('utf-8')
+        for msg in (date, 'dnspod', 'tc3_request'):
+            key = hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode('utf-8'),
+                             hashlib.sha256).hexdigest()
+
+        expected = ('TC3-HMAC-SHA256 Credential={0}/{1}/dnspod/tc3_request, '
+                    'SignedHeaders=content-type;host, Signature={2}'.format(
+                        self.secret_id, date, signature))
+
+        return hmac.compare_digest(
+            (headers.get('Authorization') or '').encode('utf-8'),
+            expected.encode('utf-8'))
+
+    def _take_token(self):
+        """Take a rate limit token, False if none is left"""
+        if not self.rate_limit:
+            return True
+
+        now = time.time()
+        self._tokens = min(
+            float(self.rate_limit),
+            self._tokens + (now - self._tokens_updated_at) * self.rate_limit)
+        self._tokens_updated_at = now
+
+        if self._tokens < 1:
+            return False
+
+        self._tokens -= 1
+        return True
+
+    def _new_id(self):
+        record_id = str(self._next_id)
+        self._next_id += 1
+        return record_id
+
+    @staticmethod
+    def _status(code, message='', **kwargs):
+        result = {'status': {'code': code, 'message': message}}
+        result.update(kwargs)
+        return result
+
+    @staticmethod
+    def _page(items, params):
+        offset = int(params.get('offset') or 0)
+        length = int(params.get('length') or DEFAULT_PAGE_SIZE)
+        return items[offset:offset + length]
+
+    def _create(self, zone, sub_domain, record_type, value, ttl,
+                updated_on=None):
+        record_id = self._new_id()
+        zone['records'][record_id] = {
+            'id': record_id,
+            'name': sub_domain,
+            'type': record_type,
+            'value': value,
+            'ttl': ttl,
+            'updated_on': self._format_time(updated_on),
+        }
+        return record_id
+
+    @staticmethod
+    def _format_time(timestamp=None):
+        """Format a time like DNSPod does, in China Standard Time"""
+        if timestamp is None:
+            timestamp = time.time()
+
+        return time.strftime('%Y-%m-%d %H:%M:%S',
+                             time.gmtime(timestamp + 8 * 3600))
+
+    def _get_zone(self, params):
+        return self._zones.get((params.get('domain') or '').lower())
+
+    def _get_zone_by_id(self, zone_id):
+        for zone in self._zones.values():
+            if zone['id'] == zone_id:
+                return zone
+        return None
+
+    def _find_record(self, record_id):
+        for zone in self._zones.values():
+            if record_id in zone['records']:
+                return zone, zone['records'][record_id]
+        return None, None
+
+    def _domain_list(self, params):
+        zones = list(self._zones.values())
+        page = self._page(zones, params)
+
+        return self._status(
+            '1', 'Action completed successful',
+            info={'domain_total': len(zones)},
+            domains=[{'id': zone['id'], 'name': zone['name']}
+                     for zone in page])
+
+    def _record_list(self, params):
+        zone = self._get_zone(params)
+        if zone is None:
+            return self._status('6', 'Domain not under you or your user')
+
+        records = list(zone['records'].values())
+        if params.get('sub_domain'):
+            sub_domain = params['sub_domain'].lower()
+            records = [r for r in records if r['name'].lower() == sub_domain]
+        if params.get('record_type'):
+            records = [r for r in records
+                       if r['type'] == params['record_type']]
+        if params.get('keyword'):
+            keyword = params['keyword']
+            records = [r for r in records
+                       if keyword in r['name'] or keyword in r['value']]
+
+        if not records:
+            return self._status('10', 'No records')
+
+        return self._status(
+            '1', 'Action completed successful',
+            info={'record_total': len(records)},
+            records=[dict(r) for r in self._page(records, params)])
+
+    def _record_create(self, params):
+        zone = self._get_zone(params)
+        if zone is None:
+            return self._status('6', 'Domain not under you or your user')
+        if params.get('value') in self.rejected_values:
+            return self._status('17', 'Record value invalid')
+
+        record_id = self._create(zone, params.get('sub_domain') or '@',
+                                 params.get('record_type'),
+                                 params.get('value'), params.get('ttl'))
+
+        return self._status(
+            '1', 'Action completed successful',
+            record={'id': record_id, 'name': params.get('sub_domain'),
+                    'status': 'enable'})
+
+    def _record_modify(self, params):
+        zone = self._get_zone(params)
+        if zone is None:
+            return self._status('6', 'Domain not under you or your user')
+
+        record = zone['records'].get(params.get('record_id'))
+        if record is None:
+            return self._status('8', 'Record id invalid')
+
+        record.update(name=params.get('sub_domain') or record['name'],
+                      type=params.get('record_type') or record['type'],
+                      value=params.get('value'),
+                      updated_on=self._format_time())
+
+        return self._status(
+            '1', 'Action completed successful',
+            record={'id': record['id'], 'name': record['name'],
+                    'value': record['value'], 'status': 'enable'})
+
+    def _record_remove(self, params):
+        zone = self._get_zone(params)
+        if zone is None:
+            return self._status('6', 'Domain not under you or your user')
+
+        if zone['records'].pop(params.get('record_id'), None) is None:
+            return self._status('8', 'Record id invalid')
+
+        return self._status('1', 'Action completed successful')
+
+    def _add_job(self, zone, results):
+        job_id = self._new_id()
+        self._jobs[job_id] = {'zone': zone, 'records': results, 'polls': 0}
+        return job_id
+
+    def _poll_job(self, job_id):
+        """Get a job and whether it still runs, it runs until polled"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None, False
+
+        job['polls'] += 1
+        return job, job['polls'] == 1
+
+    def _new_job(self, zone, results):
+        return self._status('1', 'Action completed successful',
+                            job_id=self._add_job(zone, results))
+
+    def _batch_create(self, zone, records):
+        """
+        Create records of a batch job
+
+        :param zone: zone of the records.
+        :param records: (sub_domain, record_type, value, ttl) tuples.
+        :returns: zone and result of every record.
+        """
+        results = []
+        for sub_domain, record_type, value, ttl in records:
+            result = {'record_id': '', 'sub_domain': sub_domain,
+                      'record_type': record_type, 'value': value,
+                      'status': 'ok', 'error': ''}
+            if value in self.rejected_values:
+                result.update(status='error', error='Record value invalid')
+            else:
+                result['record_id'] = self._create(
+                    zone, sub_domain, record_type, value, str(ttl))
+            results.append(result)
+
+        return zone, results
+
+    def _batch_modify(self, record_ids, value):
+        """
+        Set the value of the records of a batch job
+
+        :returns: zone of the first record and result of every record.
+        """
+        zone = None
+        results = []
+        for record_id in record_ids:
+            result = {'record_id': record_id, 'value': value,
+                      'status': 'ok', 'error': ''}
+            record_zone, record = self._find_record(record_id)
+            if record is None:
+                result.update(status='error', error='Record id invalid')
+            elif value in self.rejected_values:
+                result.update(sub_domain=record['name'], status='error',
+                              error='Record value invalid')
+            else:
+                record.update(value=value, updated_on=self._format_time())
+                result['sub_domain'] = record['name']
+                zone = zone or record_zone
+            results.append(result)
+
+        return zone, results
+
+    def _batch_remove(self, record_ids):
+        """
+        Remove the records of a batch job
+
+        :returns: zone of the first record and result of every record.
+        """
+        zone = None
+        results = []
+        for record_id in record_ids:
+            record_zone, record = self._find_record(record_id)
+            if record is None:
+                results.append({'record_id': record_id, 'status': 'error',
+                                'error': 'Record id invalid'})
+                continue
+
+            del record_zone['records'][record_id]
+            zone = zone or record_zone
+            results.append({'record_id': record_id,
+                            'sub_domain': record['name'],
+                            'value': record['value'], 'status': 'ok',
+                            'error': ''})
+
+        return zone, results
+
+    def _batch_record_create(self, params):
+        zone = self._get_zone_by_id(params.get('domain_id'))
+        if zone is None:
+            return self._status('6', 'Domain not under you or your user')
+
+        return self._new_job(*self._batch_create(zone, [
+            (record['sub_domain'], record['record_type'], record['value'],
+             record.get('ttl', '600'))
+            for record in json.loads(params.get('records') or '[]')]))
+
+    def _batch_record_modify(self, params):
+        if params.get('change') != 'value':
+            return self._status('2', 'Unsupported change')
+
+        return self._new_job(*self._batch_modify(
+            (params.get('record_id') or '').split(','),
+            params.get('change_to')))
+
+    def _batch_detail(self, params):
+        job, running = self._poll_job(params.get('job_id'))
+        if job is None:
+            return self._status('8', 'Job id invalid')
+
+        zone = job['zone'] or {'id': '', 'name': ''}
+
+        return self._status(
+            '1', 'Action completed successful',
+            detail=[{
+                'domain_id': zone['id'],
+                'domain': zone['name'],
+                'status': 'running' if running else 'ok',
+                'records': [dict(result, status='running') if running
+                            else dict(result) for result in job['records']],
+            }])
+
+    _ACTIONS = {
+        'Domain.List': _domain_list,
+        'Record.List': _record_list,
+        'Record.Create': _record_create,
+        'Record.Modify': _record_modify,
+        'Record.Remove': _record_remove,
+        'Batch.Record.Create': _batch_record_create,
+        'Batch.Record.Modify': _batch_record_modify,
+        'Batch.Detail': _batch_detail,
+    }
+
+    @staticmethod
+    def _v3_error(code, message):
+        return {'Error': {'Code': code, 'Message': message}}
+
+    def _v3_get_zone(self, params):
+        return self._zones.get((params.get('Domain') or '').lower())
+
+    def _v3_zone_error(self):
+        return self._v3_error('InvalidParameter.DomainNotExists',
+                              'Domain not exists')
+
+    def _v3_describe_domain_list(self, params):
+        zones = list(self._zones.values())
+        offset = int(params.get('Offset') or 0)
+        page = zones[offset:offset + int(params.get('Limit') or 20)]
+
+        return {
+            'DomainCountInfo': {'AllTotal': len(zones),
+                                'DomainTotal': len(zones)},
+            'DomainList': [{'DomainId': int(zone['id']),
+                            'Name': zone['name']} for zone in page],
+        }
+
+    def _v3_describe_record_list(self, params):
+        zone = self._v3_get_zone(params)
+        if zone is None:
+            return self._v3_zone_error()
+
+        records = self._record_list({
+            'domain': zone['name'],
+            'sub_domain': params.get('Subdomain'),
+            'record_type': params.get('RecordType'),
+            'keyword': params.get('Keyword'),
+            'offset': params.get('Offset'),
+            'length': params.get('Limit') or 100,
+        })
+        if records['status']['code'] != '1':
+            return self._v3_error('ResourceNotFound.NoDataOfRecord',
+                                  'No records')
+
+        return {
+            'RecordCountInfo': {
+                'TotalCount': records['info']['record_total']},
+            'RecordList': [{'RecordId': int(record['id']),
+                            'Name': record['name'], 'Type': record['type'],
+                            'Value': record['value'],
+                            'TTL': int(record['ttl'] or 600),
+                            'Line': '默认',
+                            'UpdatedOn': record['updated_on']}
+                           for record in records['records']],
+        }
+
+    def _v3_create_record(self, params):
+        zone = self._v3_get_zone(params)
+        if zone is None:
+            return self._v3_zone_error()
+        if params.get('Value') in self.rejected_values:
+            return self._v3_error('InvalidParameter.RecordValueInvalid',
+                                  'Record value invalid')
+
+        record_id = self._create(zone, params.get('SubDomain') or '@',
+                                 params.get('RecordType'),
+                                 params.get('Value'),
+                                 str(params.get('TTL', 600)))
+
+        return {'RecordId': int(record_id)}
+
+    def _v3_modify_record(self, params):
+        zone = self._v3_get_zone(params)
+        if zone is None:
+            return self._v3_zone_error()
+
+        record = zone['records'].get(str(params.get('RecordId')))
+        if record is None:
+            return self._v3_error('InvalidParameter.RecordIdInvalid',
+                                  'Record id invalid')
+
+        record.update(name=params.get('SubDomain') or record['name'],
+                      type=params.get('RecordType') or record['type'],
+                      value=params.get('Value'),
+                      updated_on=self._format_time())
+
+        return {'RecordId': int(record['id'])}
+
+    def _v3_delete_record(self, params):
+        zone = self._v3_get_zone(params)
+        if zone is None:
+            return self._v3_zone_error()
+
+        if zone['records'].pop(str(params.get('RecordId')), None) is None:
+            return self._v3_error('InvalidParameter.RecordIdInvalid',
+                                  'Record id invalid')
+
+        return {}
+
+    def _v3_create_record_batch(self, params):
+        zones = [self._get_zone_by_id(str(zone_id))
+                 for zone_id in params.get('DomainIdList') or []]
+        if len(zones) != 1 or zones[0] is None:
+            return self._v3_zone_error()
+
+        return {'JobId': int(self._add_job(*self._batch_create(zones[0], [
+            (record['SubDomain'], record['RecordType'], record['Value'],
+             record.get('TTL', 600))
+            for record in params.get('RecordList') or []])))}
+
+    def _v3_modify_record_batch(self, params):
+        if params.get('Change') != 'value':
+            return self._v3_error('InvalidParameter', 'Unsupported change')
+
+        return {'JobId': int(self._add_job(*self._batch_modify(
+            [str(record_id) for record_id in params.get('RecordIdList')],
+            params.get('ChangeTo'))))}
+
+    def _v3_delete_record_batch(self, params):
+        return {'JobId': int(self._add_job(*self._batch_remove(
+            [str(record_id) for record_id in params.get('RecordIdList')])))}
+
+    def _v3_describe_batch_task(self, params):
+        job, running = self._poll_job(str(params.get('JobId')))
+        if job is None:
+            return self._v3_error('InvalidParameter.JobNotExist',
+                                  'Job not exists')
+
+        statuses = {'ok': 'success', 'error': 'fail'}
+        zone = job['zone'] or {'id': '0', 'name': ''}
+        records = [{
+            'RecordId': int(result['record_id'] or 0),
+            'SubDomain': result.get('sub_domain', ''),
+            'Value': result.get('value', ''),
+            'Status': 'running' if running else statuses[result['status']],
+            'ErrMsg': result['error'] or None,
+        } for result in job['records']]
+
+        return {
+            'DetailList': [{
+                'Id': int(zone['id']),
+                'Domain': zone['name'],
+                'Status': 'running' if running else 'success',
+                'RecordList': records,
+            }],
+            'TotalCount': len(records),
+            'SuccessCount': sum(1 for r in job['records']
+                                if r['status'] == 'ok'),
+            'FailCount': sum(1 for r in job['records']
+                             if r['status'] != 'ok'),
+        }
+
+    _V3_ACTIONS = {
+        'DescribeDomainList': _v3_describe_domain_list,
+        'DescribeRecordList': _v3_describe_record_list,
+        'CreateRecord': _v3_create_record,
+        'ModifyRecord': _v3_modify_record,
+        'DeleteRecord': _v3_delete_record,
+        'CreateRecordBatch': _v3_create_record_batch,
+        'ModifyRecordBatch': _v3_modify_record_batch,
+        'DeleteRecordBatch': _v3_delete_record_batch,
+        'DescribeBatchTask': _v3_describe_batch_task,
+    }
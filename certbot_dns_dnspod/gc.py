@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Garbage collector of challenge TXT records left over by aborted runs
+
+Certbot runs that crash or are killed before cleanup leave their
+`_acme-challenge` records behind. This scans every zone of the account
+and removes the challenge records journaled longer ago than
+--older-than, or that the journal doesn't know and DNSPod reports
+unchanged for longer than --older-than:
+
+    certbot-dns-dnspod-gc --credentials /path/to/dnspod_credentials.ini \\
+        --work-dir /var/lib/letsencrypt --dry-run
+
+The journal and the pool of parked records are read from the work dir
+certbot runs with, so records of runs still in flight are kept.
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import sys
+from collections import Counter
+
+from certbot import errors
+from certbot.plugins import dns_common
+
+from .dns_dnspod import STALE_RECORD_SECONDS
+from .dns_dnspod import create_client
+from .dns_dnspod import validate_credentials
+from .journal import RecordJournal
+from .pool import RecordPool
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+DEFAULT_WORK_DIR = '/var/lib/letsencrypt'
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Prefixes of the credentials' keys, the second one is written by
+# certbot versions that namespaced third party plugins
+CREDENTIALS_PREFIXES = ('dns_dnspod_', 'certbot_dns_dnspod:dns_dnspod_')
+
+
+def load_credentials(path):
+    """
+    Load and validate the credentials INI file of the plugin
+
+    :param str path: path of the credentials INI file.
+    :rtype: dns_common.CredentialsConfiguration
+    :raises errors.PluginError: If the file is invalid, or credentials of
+        the backend are missing.
+    """
+    credentials = dns_common.CredentialsConfiguration(path)
+
+    prefix = CREDENTIALS_PREFIXES[0]
+    for candidate in CREDENTIALS_PREFIXES:
+        if any(key.startswith(candidate) for key in credentials.confobj):
+            prefix = candidate
+    credentials.mapper = lambda var: prefix + var
+
+    credentials.require({
+        'dns_ttl': 'TTL value for DNS records',
+        'contact_email': 'Contact email used to request DNSPod API',
+    })
+    validate_credentials(credentials)
+
+    return credentials
+
+
+def format_summary(zones, stale, removed, failures, dry_run):
+    """
+    Describe a collection, one stale record per line
+
+    :param int zones: number of zones scanned.
+    :param stale: (full_domain, zone, Record, reason) tuples found.
+    :param removed: stale tuples removed.
+    :param failures: (name, exception) pairs of zones or records failed.
+    :param bool dry_run: whether records were left in place.
+    :rtype: str
+    """
+    reasons = Counter(reason for _, _, _, reason in stale)
+    found = ', '.join('{0} {1}'.format(count, reason)
+                      for reason, count in sorted(reasons.items()))
+    lines = []
+
+    for full_domain, _, record, reason in stale:
+        lines.append('  {0} {1} "{2}" (record {3}, {4})'.format(
+            'stale ' if dry_run else 'remove', full_domain, record.value,
+            record.id, reason))
+    for name, e in failures:
+        lines.append('  failed {0}: {1}'.format(name, e))
+
+    lines.append(
+        'DNSPod GC: {0} zones scanned, {1} stale records found '
+        '({2}), {3} removed, {4} failed'.format(
+            zones, len(stale), found or 'none', len(removed),
+            len(failures)))
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """Collect stale challenge records from the command line"""
+    parser = argparse.ArgumentParser(
+        description='Remove _acme-challenge TXT records left over by '
+        'aborted certbot runs from every zone of a DNSPod account.')
+    parser.add_argument('--credentials', required=True,
+                        help='DNSPod credentials INI file of the plugin.')
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR,
+                        help='Work dir of certbot, whose journal of '
+                        'records is consulted.')
+    parser.add_argument('--older-than', type=float,
+                        default=STALE_RECORD_SECONDS,
+                        help='Seconds after which journaled records, and '
+                        'unjournaled records unchanged for as long, are '
+                        'collected.')
+    parser.add_argument('--max-concurrency', type=int,
+                        default=DEFAULT_MAX_CONCURRENCY,
+                        help='Max number of zones listed, or records '
+                        'removed, at the same time.')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='Max API calls per second, 0 for unlimited.')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only list stale records, without removing '
+                        'them.')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    try:
+        credentials = load_credentials(args.credentials)
+    except errors.PluginError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    # without the plugin's state dir, no challenge record is journaled
+    journal = pool = None
+    state_dir = os.path.join(args.work_dir, 'dns-dnspod')
+    if os.path.isdir(state_dir):
+        journal = RecordJournal(os.path.join(state_dir, 'journal.json'))
+        pool = RecordPool(os.path.join(state_dir, 'pool.json'))
+
+    client = create_client(
+        credentials, max_concurrency=args.max_concurrency,
+        rate_limit=args.rate_limit or None, journal=journal, pool=pool)
+
+    with client:
+        try:
+            zones = len(client.get_zones())
+            stale, failures = client.find_stale_records(args.older_than)
+        except errors.PluginError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+        removed = []
+        if not args.dry_run:
+            removed, remove_failures = client.remove_stale_records(stale)
+            failures.extend(remove_failures)
+
+    print(format_summary(zones, stale, removed, failures, args.dry_run))
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
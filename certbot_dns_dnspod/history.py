@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Per-zone history of observed DNS propagation delays"""
+
+import bisect
+import time
+
+from .journal import EntryStore
+
+# Upper bounds in seconds of the histogram buckets, the last bucket holds
+# anything slower
+BUCKETS = (1, 2, 3, 5, 8, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+
+# Observations of a zone needed before its percentiles are trusted
+MIN_SAMPLES = 5
+
+# Counts of a zone are halved past this, so old observations fade out
+MAX_SAMPLES = 200
+
+
+class PropagationHistory(EntryStore):
+    """Histogram of propagation delays per zone, keyed by zone
+
+    Each observation is the seconds from adding a zone's records until
+        all its nameservers answer them. Counts are kept per bucket of
+        `BUCKETS`, so the file stays small however long it is used.
+    """
+
+    def observe(self, zone, seconds):
+        """Count an observed delay
+
+        :param str zone: zone like example.com
+        :param float seconds: seconds until the records were visible.
+        """
+        zone = zone.rstrip('.').lower()
+        index = bisect.bisect_left(BUCKETS, seconds)
+
+        def update(entries):
+            entry = entries.setdefault(zone, {
+                'zone': zone,
+                'counts': [0] * (len(BUCKETS) + 1),
+            })
+            entry['counts'][index] += 1
+            entry['created_at'] = time.time()
+
+            if sum(entry['counts']) > MAX_SAMPLES:
+                entry['counts'] = [count // 2 for count in entry['counts']]
+
+        self._update(update)
+
+    def percentile(self, zone, percent):
+        """
+        Get a percentile of the delays of a zone
+
+        :param str zone: zone like example.com
+        :param float percent: percentile like 95.
+        :returns: upper bound in seconds of the bucket holding the
+            percentile, None if the zone has too few observations or the
+            percentile is slower than the last bound.
+        :rtype: Optional[float]
+        """
+        with self._lock:
+            entry = self._entries.get(zone.rstrip('.').lower())
+
+        if entry is None:
+            return None
+
+        counts = entry['counts']
+        total = sum(counts)
+        if total < MIN_SAMPLES:
+            return None
+
+        rank = total * percent / 100.0
+        seen = 0
+        for bound, count in zip(BUCKETS, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return None
+
+    def _entry_key(self, entry):
+        return entry['zone']
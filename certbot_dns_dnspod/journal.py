@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Journal of TXT records created or modified by the plugin"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+class EntryStore(object):
+    """Entries persisted to a JSON file shared by processes
+
+    Every change is written through to the file, re-read under an
+        exclusive lock before each write, so processes sharing it do not
+        drop each other's entries. Subclasses choose the key of entries.
+    """
+
+    def __init__(self, path=None):
+        """Init EntryStore
+
+        :param str path: JSON file the entries are persisted to, they are
+            kept in memory only if None.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def entries(self, older_than=None):
+        """
+        Get the entries
+
+        :param float older_than: Only return entries added more than
+            this many seconds ago.
+        :rtype: List[Dict[str, Any]]
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+
+        if older_than is not None:
+            deadline = time.time() - older_than
+            entries = [e for e in entries if e['created_at'] < deadline]
+
+        return entries
+
+    def _entry_key(self, entry):
+        """
+        Get the key of a loaded entry
+
+        :rtype: str
+        """
+        raise NotImplementedError()
+
+    def _update(self, func):
+        """Apply func to the entries and persist them"""
+        with self._lock:
+            if self.path is None:
+                func(self._entries)
+                return
+
+            with self._file_lock():
+                entries = self._load()
+                func(entries)
+                self._save(entries)
+                self._entries = entries
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold an exclusive lock on the file across processes"""
+        lock_file = open(self.path + '.lock', 'a')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+        finally:
+            lock_file.close()
+
+    def _load(self):
+        """
+        Load entries from the file
+
+        :rtype: Dict[str, Dict[str, Any]]
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except ValueError:
+            logger.warning('[DNSPod] Ignoring corrupted file: '
+                           '{0}'.format(self.path))
+            return {}
+
+        return dict((self._entry_key(e), e) for e in entries)
+
+    def _save(self, entries):
+        """Write entries to the file atomically"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(list(entries.values()), f, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+
+class RecordJournal(EntryStore):
+    """Records created or modified during perform, keyed by (domain, value)
+
+    Records of a run that crashed before cleanup can still be removed by
+        id later, from the journal file.
+    """
+
+    def add(self, full_domain, record_content, record_id, base_domain):
+        """Journal a record
+
+        :param str full_domain: Full domain of the record.
+        :param str record_content: Value of the record.
+        :param str record_id: DNS record ID in DNSPod.
+        :param str base_domain: Zone of the record.
+        """
+        entry = {
+            'domain': full_domain,
+            'value': record_content,
+            'record_id': record_id,
+            'zone': base_domain,
+            'created_at': time.time(),
+        }
+
+        def update(entries):
+            entries[self._key(full_domain, record_content)] = entry
+
+        self._update(update)
+
+    def get(self, full_domain, record_content):
+        """
+        Get the journaled record of a (domain, value)
+
+        :param str full_domain: Full domain of the record.
+        :param str record_content: Value of the record.
+        :returns: entry with record_id, zone and created_at, None if the
+            record is not journaled.
+        :rtype: Optional[Dict[str, Any]]
+        """
+        with self._lock:
+            return self._entries.get(self._key(full_domain, record_content))
+
+    def remove(self, full_domain, record_content):
+        """Forget a record, e.g. after it has been removed
+
+        :param str full_domain: Full domain of the record.
+        :param str record_content: Value of the record.
+        """
+        def update(entries):
+            entries.pop(self._key(full_domain, record_content), None)
+
+        self._update(update)
+
+    @staticmethod
+    def _key(full_domain, record_content):
+        return '{0} {1}'.format(full_domain.rstrip('.').lower(),
+                                record_content)
+
+    def _entry_key(self, entry):
+        return self._key(entry['domain'], entry['value'])
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""Metrics of DNSPod API calls and Authenticator phases"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+# Upper bounds in seconds, phases like the propagation wait take minutes
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+METRIC_HELP = {
+    'dnspod_api_requests_total':
+        ('counter', 'DNSPod API requests sent, by action and status code.'),
+    'dnspod_api_calls_total':
+        ('counter', 'DNSPod API calls, by action, retries included.'),
+    'dnspod_api_retries_total':
+        ('counter', 'Retries of DNSPod API calls, by action.'),
+    'dnspod_api_sent_bytes_total':
+        ('counter', 'Request bytes sent to DNSPod API, by action.'),
+    'dnspod_api_received_bytes_total':
+        ('counter', 'Response bytes received from DNSPod API, by action.'),
+    'dnspod_api_call_seconds':
+        ('histogram', 'Duration of DNSPod API calls, retries and '
+         'rate limit waits included, by action.'),
+    'dnspod_phase_seconds':
+        ('histogram', 'Duration of Authenticator phases.'),
+}
+
+
+class MetricsSink(object):
+    """Destination of metrics, subclasses override what they need"""
+
+    def emit(self, event):
+        """Receive an event as it happens
+
+        :param Dict[str, Any] event: 'type' is 'request', 'call' or
+            'phase', the other keys depend on it.
+        """
+
+    def flush(self, metrics):
+        """Write out the metrics, e.g. at the end of a run
+
+        :param Metrics metrics: aggregated metrics.
+        """
+
+
+class PrometheusTextfileSink(MetricsSink):
+    """Write metrics in Prometheus text format for node_exporter's
+    textfile collector
+
+    The file is replaced atomically, so the collector never reads a
+        partially written file.
+    """
+
+    def __init__(self, path):
+        """Init PrometheusTextfileSink
+
+        :param str path: file to write, should end with `.prom`.
+        """
+        self.path = path
+
+    def flush(self, metrics):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(metrics.render_prometheus())
+        os.rename(tmp_path, self.path)
+
+
+class JSONLinesSink(MetricsSink):
+    """Append every event as a JSON line to a file
+
+    Events are buffered in memory and appended on flush, so API calls
+        don't wait for file writes.
+    """
+
+    def __init__(self, path):
+        """Init JSONLinesSink
+
+        :param str path: file to append to.
+        """
+        self.path = path
+        self._events = []
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        with self._lock:
+            self._events.append(event)
+
+    def flush(self, metrics):
+        with self._lock:
+            events, self._events = self._events, []
+
+        if events:
+            with open(self.path, 'a') as f:
+                for event in events:
+                    f.write(json.dumps(event, sort_keys=True) + '\n')
+
+
+class Metrics(object):
+    """Thread safe counters and histograms, forwarded to sinks"""
+
+    def __init__(self, sinks=None, buckets=DEFAULT_BUCKETS):
+        """Init Metrics
+
+        :param sinks: where events and aggregated metrics are written.
+        :type sinks: Optional[List[MetricsSink]]
+        :param buckets: upper bounds of histogram buckets, in seconds.
+        :type buckets: Tuple[float]
+        """
+        self.sinks = list(sinks or [])
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters = OrderedDict()
+        self._histograms = OrderedDict()
+
+    def inc(self, name, labels, value=1):
+        """
+        Increase a counter
+
+        :param str name: metric name.
+        :param Dict[str, str] labels: metric labels.
+        :param float value: amount to add.
+        """
+        key = (name, self._labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        """
+        Add a sample to a histogram
+
+        :param str name: metric name.
+        :param Dict[str, str] labels: metric labels.
+        :param float value: sample, in seconds.
+        """
+        key = (name, self._labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': [0] * len(self.buckets), 'sum': 0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def get_counter(self, name, **labels):
+        """
+        Get the value of a counter
+
+        :rtype: float
+        """
+        with self._lock:
+            return self._counters.get((name, self._labels_key(labels)), 0)
+
+    def get_histogram(self, name, **labels):
+        """
+        Get a histogram
+
+        :returns: cumulative 'buckets' counts, 'sum' and 'count', None if
+            nothing has been observed.
+        :rtype: Optional[Dict[str, Any]]
+        """
+        with self._lock:
+            histogram = self._histograms.get(
+                (name, self._labels_key(labels)))
+            return None if histogram is None else dict(histogram)
+
+    def observe_request(self, action, code, sent_bytes, received_bytes):
+        """
+        Record an HTTP request sent to DNSPod API
+
+        :param str action: API action like Record.List
+        :param str code: DNSPod status code, 'http_<status>' if the HTTP
+            request failed, 'error' if no response was received.
+        :param int sent_bytes: size of the request body.
+        :param int received_bytes: size of the response body.
+        """
+        self.inc('dnspod_api_requests_total',
+                 {'action': action, 'code': code})
+        self.inc('dnspod_api_sent_bytes_total', {'action': action},
+                 sent_bytes)
+        self.inc('dnspod_api_received_bytes_total', {'action': action},
+                 received_bytes)
+        self._emit({'type': 'request', 'action': action, 'code': code,
+                    'sent_bytes': sent_bytes,
+                    'received_bytes': received_bytes})
+
+    def observe_call(self, action, seconds, attempts):
+        """
+        Record a DNSPod API call
+
+        :param str action: API action like Record.List
+        :param float seconds: duration, retries included.
+        :param int attempts: number of requests sent.
+        """
+        retries = max(0, attempts - 1)
+        self.inc('dnspod_api_calls_total', {'action': action})
+        self.inc('dnspod_api_retries_total', {'action': action}, retries)
+        self.observe('dnspod_api_call_seconds', {'action': action}, seconds)
+        self._emit({'type': 'call', 'action': action, 'seconds': seconds,
+                    'retries': retries})
+
+    def observe_phase(self, phase, seconds):
+        """
+        Record an Authenticator phase
+
+        :param str phase: phase like perform, propagation or cleanup.
+        :param float seconds: duration.
+        """
+        self.observe('dnspod_phase_seconds', {'phase': phase}, seconds)
+        self._emit({'type': 'phase', 'phase': phase, 'seconds': seconds})
+
+    @contextmanager
+    def phase(self, phase):
+        """Time the block as an Authenticator phase
+
+        :param str phase: phase like perform, propagation or cleanup.
+        """
+        started_at = time.time()
+        try:
+            yield
+        finally:
+            self.observe_phase(phase, time.time() - started_at)
+
+    def flush(self):
+        """Write out metrics to all sinks, errors are logged only"""
+        for sink in self.sinks:
+            try:
+                sink.flush(self)
+            except (IOError, OSError) as e:
+                logger.warning('Unable to write DNSPod metrics: %s', e)
+
+    def render_prometheus(self):
+        """
+        Render metrics in Prometheus text exposition format
+
+        :rtype: str
+        """
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, dict(value, buckets=list(value['buckets'])))
+                          for key, value in self._histograms.items()]
+
+        samples = OrderedDict()
+        for (name, labels), value in counters:
+            samples.setdefault(name, []).append(
+                (name, labels, value))
+        for (name, labels), histogram in histograms:
+            lines = samples.setdefault(name, [])
+            for bound, count in zip(self.buckets, histogram['buckets']):
+                lines.append((name + '_bucket',
+                              labels + (('le', _format_value(bound)),),
+                              count))
+            lines.append((name + '_bucket', labels + (('le', '+Inf'),),
+                          histogram['count']))
+            lines.append((name + '_sum', labels, histogram['sum']))
+            lines.append((name + '_count', labels, histogram['count']))
+
+        output = []
+        for name in sorted(samples):
+            metric_type, help_text = METRIC_HELP.get(name, ('untyped', name))
+            output.append('# HELP {0} {1}'.format(name, help_text))
+            output.append('# TYPE {0} {1}'.format(name, metric_type))
+            for sample_name, labels, value in samples[name]:
+                output.append('{0}{1} {2}'.format(
+                    sample_name, _format_labels(labels),
+                    _format_value(value)))
+
+        return '\n'.join(output) + '\n'
+
+    def _emit(self, event):
+        if not self.sinks:
+            return
+
+        event['time'] = time.time()
+        for sink in self.sinks:
+            sink.emit(event)
+
+    @staticmethod
+    def _labels_key(labels):
+        return tuple(sorted((key, str(value))
+                            for key, value in labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+
+    return '{' + ','.join(
+        '{0}="{1}"'.format(key, value.replace('\\', '\\\\')
+                           .replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+
+    return repr(value) if isinstance(value, float) else str(value)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Pool of parked TXT records reused across runs"""
+
+import time
+
+from .journal import EntryStore
+
+# Value parked records hold between runs
+PARKED_VALUE = 'certbot-dns-dnspod-parked'
+
+
+class RecordPool(EntryStore):
+    """Challenge records parked by cleanup instead of being removed
+
+    A parked record holds `PARKED_VALUE` until a later perform takes it
+        and sets the new validation with one Record.Modify, so renewals
+        don't create and remove the same records every time. Entries are
+        keyed by record id.
+    """
+
+    def park(self, full_domain, record_id, base_domain):
+        """Remember a parked record
+
+        :param str full_domain: Full domain of the record.
+        :param str record_id: DNS record ID in DNSPod.
+        :param str base_domain: Zone of the record.
+        """
+        entry = {
+            'domain': full_domain.rstrip('.').lower(),
+            'value': PARKED_VALUE,
+            'record_id': record_id,
+            'zone': base_domain,
+            'created_at': time.time(),
+        }
+
+        def update(entries):
+            entries[record_id] = entry
+
+        self._update(update)
+
+    def take(self, full_domain):
+        """
+        Take a parked record of a domain out of the pool
+
+        :param str full_domain: Full domain of the record.
+        :returns: entry with record_id and zone, None if no record of
+            the domain is parked.
+        :rtype: Optional[Dict[str, Any]]
+        """
+        domain = full_domain.rstrip('.').lower()
+        taken = []
+
+        def update(entries):
+            for record_id, entry in sorted(entries.items()):
+                if entry['domain'] == domain:
+                    taken.append(entries.pop(record_id))
+                    return
+
+        self._update(update)
+
+        return taken[0] if taken else None
+
+    def discard(self, record_id):
+        """Forget a parked record, e.g. after it has been removed
+
+        :param str record_id: DNS record ID in DNSPod.
+        """
+        def update(entries):
+            entries.pop(record_id, None)
+
+        self._update(update)
+
+    def _entry_key(self, entry):
+        return entry['record_id']
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""Check TXT records propagation on authoritative nameservers"""
+
+import logging
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dns.exception
+import dns.flags
+import dns.message
+import dns.query
+import dns.rdatatype
+import dns.resolver
+
+from certbot import errors
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+DEFAULT_QUERY_TIMEOUT = 3
+DEFAULT_MIN_INTERVAL = 1
+DEFAULT_MAX_INTERVAL = 10
+DEFAULT_MAX_WORKERS = 8
+
+DNS_PORT = 53
+
+
+def parse_nameservers(value):
+    """
+    Parse nameserver addresses
+
+    :param str value: comma separated addresses like
+        '127.0.0.1, 127.0.0.1:5353, [::1]:5353'
+    :returns: (address, port) pairs.
+    :rtype: List[Tuple[str, int]]
+    :raises errors.PluginError: If an address is invalid.
+    """
+    nameservers = []
+
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+
+        if item.startswith('['):
+            address, _, port = item[1:].partition(']')
+            port = port.lstrip(':')
+        elif item.count(':') == 1:
+            address, port = item.split(':')
+        else:
+            address, port = item, ''
+
+        try:
+            nameservers.append((address, int(port or DNS_PORT)))
+        except ValueError:
+            raise errors.PluginError(
+                '[DNSPod] Invalid nameserver address: {0}'.format(item))
+
+    return nameservers
+
+
+def _resolve(name, rdtype):
+    """Resolve name with the system resolver, dnspython 1.x and 2.x"""
+    resolve = getattr(dns.resolver, 'resolve', None) or dns.resolver.query
+    return resolve(name, rdtype)
+
+
+class PropagationChecker(object):
+    """Poll authoritative nameservers until TXT records are visible
+
+    Every nameserver of a record's zone is queried, in parallel, and
+        polling backs off exponentially between rounds.
+    """
+
+    def __init__(self, nameservers=None,
+                 query_timeout=DEFAULT_QUERY_TIMEOUT,
+                 min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL,
+                 max_workers=DEFAULT_MAX_WORKERS):
+        """Init PropagationChecker
+
+        :param nameservers: (address, port) pairs queried for every zone
+            instead of the zone's authoritative nameservers.
+        :type nameservers: Optional[List[Tuple[str, int]]]
+        :param float query_timeout: Seconds to wait for a DNS response.
+        :param float min_interval: Seconds to wait after the first round.
+        :param float max_interval: Max seconds to wait between rounds.
+        :param int max_workers: Max number of queries at the same time.
+        """
+        self.nameservers = nameservers
+        self.query_timeout = query_timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_workers = max_workers
+        #: zone => time all records of the zone were seen by the last
+        #: `wait`, on every nameserver.
+        self.visible_at = {}
+        #: zones whose records were all seen by the first round of the
+        #: last `wait`, so they may have been visible earlier.
+        self.visible_on_first_round = set()
+        self._zone_nameservers = {}
+
+    def wait(self, records, timeout):
+        """
+        Wait until records are visible on all nameservers of their zones
+
+        :param records: (full_domain, record_content, zone) tuples.
+        :type records: Iterable[Tuple[str, str, str]]
+        :param float timeout: Max seconds to wait.
+        :returns: True if all records are visible, False if the deadline
+            passed first.
+        :rtype: bool
+        :raises errors.PluginError: If nameservers of a zone can not be
+            found.
+        """
+        deadline = time.time() + timeout
+        self.visible_at = {}
+        self.visible_on_first_round = set()
+
+        pending = {}
+        zones = {}
+        for full_domain, record_content, zone in records:
+            name = full_domain.rstrip('.').lower()
+            zones[name] = zone
+            for nameserver in self._get_nameservers(zone):
+                pending.setdefault((name, nameserver), set()).add(
+                    record_content)
+
+        first_round = True
+        interval = self.min_interval
+        workers = max(1, min(self.max_workers, len(pending)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while pending:
+                checks = list(pending.items())
+                results = executor.map(
+                    lambda check: self._query_txt(*check[0]), checks)
+
+                for (key, values), found in zip(checks, results):
+                    if values <= found:
+                        del pending[key]
+
+                now = time.time()
+                waiting = set(zones[name] for name, _ in pending)
+                for zone in set(zones.values()) - waiting:
+                    self.visible_at.setdefault(zone, now)
+                    if first_round:
+                        self.visible_on_first_round.add(zone)
+                first_round = False
+
+                remaining = deadline - time.time()
+                if not pending or remaining <= 0:
+                    break
+
+                time.sleep(min(interval, remaining))
+                interval = min(interval * 2, self.max_interval)
+
+        if pending:
+            logger.warning(
+                'TXT records are still not visible after %s seconds: %s',
+                timeout, ', '.join(sorted(set(
+                    '{0}@{1}'.format(name, nameserver[0])
+                    for name, nameserver in pending))))
+            return False
+
+        return True
+
+    def _get_nameservers(self, zone):
+        """
+        Get nameserver addresses of a zone
+
+        :param str zone: zone like example.com
+        :returns: (address, port) pairs.
+        :rtype: List[Tuple[str, int]]
+        :raises errors.PluginError: If no nameserver can be found.
+        """
+        if self.nameservers:
+            return self.nameservers
+
+        if zone not in self._zone_nameservers:
+            nameservers = []
+            try:
+                for ns in _resolve(zone, 'NS'):
+                    for address in _resolve(ns.target.to_text(), 'A'):
+                        nameservers.append((address.to_text(), DNS_PORT))
+            except dns.exception.DNSException as e:
+                raise errors.PluginError(
+                    '[DNSPod] Unable to find nameservers of zone: {0}, '
+                    'error: {1}'.format(zone, e))
+
+            if not nameservers:
+                raise errors.PluginError(
+                    '[DNSPod] Unable to find nameservers of zone: {0}'
+                    .format(zone))
+
+            self._zone_nameservers[zone] = nameservers
+
+        return self._zone_nameservers[zone]
+
+    def _query_txt(self, name, nameserver):
+        """
+        Query TXT values of a name from a nameserver
+
+        :param str name: full domain.
+        :param Tuple[str, int] nameserver: (address, port).
+        :returns: values found, empty if the query fails.
+        :rtype: Set[str]
+        """
+        address, port = nameserver
+        query = dns.message.make_query(name, dns.rdatatype.TXT)
+
+        try:
+            response = dns.query.udp(query, address, self.query_timeout,
+                                     port=port)
+            if response.flags & dns.flags.TC:
+                response = dns.query.tcp(query, address, self.query_timeout,
+                                         port=port)
+        except (dns.exception.DNSException, socket.error) as e:
+            logger.debug('Querying TXT of %s from %s failed: %s',
+                         name, address, e)
+            return set()
+
+        values = set()
+        for rrset in response.answer:
+            if rrset.rdtype != dns.rdatatype.TXT:
+                continue
+            for rdata in rrset:
+                values.add(b''.join(rdata.strings).decode('utf-8'))
+
+        return values
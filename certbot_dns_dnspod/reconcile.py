@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Desired-state reconciliation of challenge TXT records"""
+
+from collections import OrderedDict
+
+
+class ReconcilePlan(object):
+    """Operations turning the current TXT records into the desired ones
+
+    Values already present are left alone, missing values reuse stale
+        records of the same name with a modify before new records are
+        created, and stale records left over are removed.
+    """
+
+    def __init__(self):
+        #: (full_domain, record_content) pairs.
+        self.creates = []
+        #: (full_domain, record_content, record_id, old_content) tuples.
+        self.modifies = []
+        #: (full_domain, record_content, record_id) tuples.
+        self.removes = []
+        #: (full_domain, record_content, record_id) tuples.
+        self.noops = []
+        #: number of Record.List calls made to build the plan.
+        self.lists = 0
+
+    def add_zone(self, names, record_ids):
+        """
+        Plan the operations of a zone
+
+        :param names: sub_domain => (full_domain, values) of the zone.
+        :param record_ids: lower cased sub_domain => value => record id
+            of the existing records.
+        """
+        for sub_domain, (full_domain, values) in names.items():
+            existing = OrderedDict(
+                sorted(record_ids.get(sub_domain.lower(), {}).items()))
+
+            missing = []
+            for value in values:
+                if value in existing:
+                    self.noops.append((full_domain, value,
+                                       existing.pop(value)))
+                else:
+                    missing.append(value)
+
+            stale = list(existing.items())
+            for value in missing:
+                if stale:
+                    old_value, record_id = stale.pop(0)
+                    self.modifies.append((full_domain, value, record_id,
+                                          old_value))
+                else:
+                    self.creates.append((full_domain, value))
+
+            self.removes.extend((full_domain, old_value, record_id)
+                                for old_value, record_id in stale)
+
+    @property
+    def changes(self):
+        """
+        Number of records changed by the plan
+
+        :rtype: int
+        """
+        return len(self.creates) + len(self.modifies) + len(self.removes)
+
+    def cost(self):
+        """
+        Get the API calls of the plan, listing included
+
+        :returns: action => number of calls.
+        :rtype: OrderedDict[str, int]
+        """
+        return OrderedDict([
+            ('Record.List', self.lists),
+            ('Record.Create', len(self.creates)),
+            ('Record.Modify', len(self.modifies)),
+            ('Record.Remove', len(self.removes)),
+        ])
+
+    def format(self):
+        """
+        Describe the plan, one operation per line
+
+        :rtype: str
+        """
+        lines = ['DNSPod plan: {0} to create, {1} to modify, {2} to remove, '
+                 '{3} unchanged'.format(len(self.creates), len(self.modifies),
+                                        len(self.removes), len(self.noops))]
+
+        for full_domain, value in self.creates:
+            lines.append('  create {0} "{1}"'.format(full_domain, value))
+        for full_domain, value, record_id, old_value in self.modifies:
+            lines.append('  modify {0} "{1}" -> "{2}" (record {3})'.format(
+                full_domain, old_value, value, record_id))
+        for full_domain, value, record_id in self.removes:
+            lines.append('  remove {0} "{1}" (record {2})'.format(
+                full_domain, value, record_id))
+        for full_domain, value, record_id in self.noops:
+            lines.append('  keep   {0} "{1}" (record {2})'.format(
+                full_domain, value, record_id))
+
+        cost = self.cost()
+        lines.append('API calls: {0}, {1} in total'.format(
+            ', '.join('{0}={1}'.format(action, count)
+                      for action, count in cost.items()),
+            sum(cost.values())))
+
+        return '\n'.join(lines)
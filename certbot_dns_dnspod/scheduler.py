@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""Rate limiting and retrying of DNSPod API requests"""
+
+import logging
+import random
+import threading
+import time
+
+from certbot import errors
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 10
+DEFAULT_TIME_BUDGET = 60
+
+
+class RetryableError(errors.PluginError):
+    """Error of a request that may succeed if sent again"""
+
+
+class UnavailableError(RetryableError):
+    """Error of a request the API host failed to serve, like HTTP 502"""
+
+
+def _is_retryable_error(e):
+    return isinstance(e, RetryableError)
+
+
+class TokenBucket(object):
+    """Thread safe token bucket limiting requests per second"""
+
+    def __init__(self, rate, capacity=None):
+        """Init TokenBucket
+
+        :param float rate: tokens added per second.
+        :param float capacity: max tokens kept, allowing bursts,
+            defaults to one second worth of tokens.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self._tokens = self.capacity
+        self._updated_at = time.time()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token, borrowing it from the future if none is available
+
+        :returns: seconds to wait before the token may be used.
+        :rtype: float
+        """
+        with self._lock:
+            now = time.time()
+            elapsed = max(0, now - self._updated_at)
+            self._tokens = min(self.capacity,
+                               self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """Take a token, waiting until one is available"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RequestScheduler(object):
+    """Send requests under a rate limit, retrying transient failures
+
+    Retries back off exponentially with full jitter, and stop when
+        either the retries or the time budget of the request run out.
+    """
+
+    def __init__(self, rate_limit=None, max_retries=DEFAULT_MAX_RETRIES,
+                 time_budget=DEFAULT_TIME_BUDGET,
+                 base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, bucket=None):
+        """Init RequestScheduler
+
+        :param float rate_limit: Max requests per second, unlimited if None.
+        :param int max_retries: Max number of retries of a request.
+        :param float time_budget: Max seconds spent on a request,
+            including retries.
+        :param float base_delay: Seconds to back off before the 1st retry.
+        :param float max_delay: Max seconds to back off between retries.
+        :param bucket: token bucket limiting the rate instead of one of
+            rate_limit, e.g. a `SharedTokenBucket` of several processes.
+        """
+        if bucket is None and rate_limit:
+            bucket = TokenBucket(rate_limit)
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.time_budget = time_budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def run(self, send, is_retryable=None):
+        """
+        Send a request
+
+        :param callable send: sends the request and returns its result,
+            raises on failure.
+        :param callable is_retryable: tells whether an exception raised by
+            send can be retried, defaults to `RetryableError` only.
+        :returns: result of send.
+        :raises Exception: the last error raised by send when it can not
+            be retried any more.
+        """
+        deadline = self.get_deadline()
+        attempt = 0
+
+        while True:
+            wait = self.reserve()
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                return send()
+            except Exception as e:  # pylint: disable=broad-except
+                delay = self.get_retry_delay(e, attempt, deadline,
+                                             is_retryable)
+                if delay is None:
+                    raise
+
+                attempt += 1
+                time.sleep(delay)
+
+    def get_deadline(self):
+        """
+        Get the time a request starting now must be done by
+
+        :rtype: float
+        """
+        return time.time() + self.time_budget
+
+    def reserve(self):
+        """
+        Take a rate limit token for a request
+
+        :returns: seconds to wait before sending the request.
+        :rtype: float
+        """
+        if self.bucket is None:
+            return 0
+
+        return self.bucket.reserve()
+
+    def get_retry_delay(self, e, attempt, deadline, is_retryable=None):
+        """
+        Decide whether a failed request is retried
+
+        :param Exception e: error of the failed request.
+        :param int attempt: number of retries done.
+        :param float deadline: time the request must be done by.
+        :param callable is_retryable: tells whether an exception can be
+            retried, defaults to `RetryableError` only.
+        :returns: seconds to back off before the retry, None if the
+            request must not be retried.
+        :rtype: Optional[float]
+        """
+        if is_retryable is None:
+            is_retryable = _is_retryable_error
+
+        if not is_retryable(e) or attempt >= self.max_retries:
+            return None
+
+        delay = self._backoff(attempt)
+        if time.time() + delay > deadline:
+            return None
+
+        logger.warning('[DNSPod] Request failed, retry %d/%d in '
+                       '%.2f seconds: %s',
+                       attempt + 1, self.max_retries, delay, e)
+        return delay
+
+    def _backoff(self, attempt):
+        """
+        Get seconds to wait before a retry, with full jitter
+
+        :param int attempt: number of retries done.
+        :rtype: float
+        """
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * (2 ** attempt)))
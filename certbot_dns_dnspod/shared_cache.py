@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Zone and record cache shared by certbot processes of an account"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import closing
+from contextlib import contextmanager
+
+# Seconds a process waits for another one holding the database lock
+DEFAULT_LOCK_TIMEOUT = 30
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS zones ('
+    ' account TEXT PRIMARY KEY, domains TEXT, expires_at REAL)',
+    'CREATE TABLE IF NOT EXISTS records ('
+    ' account TEXT, domain TEXT, value TEXT, record_id TEXT, zone TEXT,'
+    ' created_at REAL, PRIMARY KEY (account, domain, value))',
+    'CREATE TABLE IF NOT EXISTS buckets ('
+    ' account TEXT PRIMARY KEY, tokens REAL, updated_at REAL)',
+)
+
+
+def account_key(secret):
+    """
+    Get the key an account's entries are cached under
+
+    :param str secret: API token or SecretId of the account.
+    :returns: digest of the secret, which is never stored itself.
+    :rtype: str
+    """
+    return hashlib.sha256(secret.encode('utf-8')).hexdigest()[:16]
+
+
+class SharedCache(object):
+    """Zone ids, challenge record ids and a rate budget in a SQLite file
+
+    Certbot processes renewing certificates of the same account at once
+        reuse each other's zone listing, find records created by each
+        other by id, and take API tokens from one bucket, so together
+        they stay under the account's rate limit. SQLite locks the file
+        across processes, every operation is a short transaction.
+    """
+
+    def __init__(self, path, account, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        """Init SharedCache
+
+        :param str path: SQLite file, created if missing.
+        :param str account: key of the account, see `account_key`.
+        :param float lock_timeout: Seconds to wait for the file lock.
+        """
+        self.path = path
+        self.account = account
+        self.lock_timeout = lock_timeout
+
+        with self._transaction() as db:
+            for statement in _SCHEMA:
+                db.execute(statement)
+
+    def get_zones(self):
+        """
+        Get the zones cached by any process, unless expired
+
+        :returns: domain names mapped to their ids, None if not cached.
+        :rtype: Optional[Dict[str, str]]
+        """
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT domains FROM zones WHERE account = ? AND '
+                'expires_at > ?', (self.account, time.time())).fetchone()
+
+        if row is None:
+            return None
+
+        return json.loads(row[0])
+
+    def set_zones(self, domains, ttl):
+        """Cache the zones of the account
+
+        :param Dict[str, str] domains: domain names mapped to their ids.
+        :param float ttl: seconds the zones are reused.
+        """
+        with self._transaction() as db:
+            db.execute('INSERT OR REPLACE INTO zones VALUES (?, ?, ?)',
+                       (self.account, json.dumps(domains, sort_keys=True),
+                        time.time() + ttl))
+
+    def add_record(self, full_domain, record_content, record_id,
+                   base_domain):
+        """Cache the id of a challenge record
+
+        :param str full_domain: Full domain of the record.
+        :param str record_content: Value of the record.
+        :param str record_id: DNS record ID in DNSPod.
+        :param str base_domain: Zone of the record.
+        """
+        with self._transaction() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?)',
+                (self.account, self._domain(full_domain), record_content,
+                 record_id, base_domain, time.time()))
+
+    def get_record(self, full_domain, record_content):
+        """
+        Get the cached id of a challenge record
+
+        :param str full_domain: Full domain of the record.
+        :param str record_content: Value of the record.
+        :returns: entry with record_id and zone, None if not cached.
+        :rtype: Optional[Dict[str, str]]
+        """
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT record_id, zone FROM records WHERE account = ? AND '
+                'domain = ? AND value = ?',
+                (self.account, self._domain(full_domain),
+                 record_content)).fetchone()
+
+        if row is None:
+            return None
+
+        return {'record_id': row[0], 'zone': row[1]}
+
+    def remove_record(self, full_domain, record_content):
+        """Forget a challenge record, e.g. after it has been removed
+
+        :param str full_domain: Full domain of the record.
+        :param str record_content: Value of the record.
+        """
+        with self._transaction() as db:
+            db.execute(
+                'DELETE FROM records WHERE account = ? AND domain = ? AND '
+                'value = ?',
+                (self.account, self._domain(full_domain), record_content))
+
+    def token_bucket(self, rate, capacity=None):
+        """
+        Get the token bucket of the account shared by processes
+
+        :param float rate: tokens added per second.
+        :param float capacity: max tokens kept, allowing bursts,
+            defaults to one second worth of tokens.
+        :rtype: SharedTokenBucket
+        """
+        return SharedTokenBucket(self, rate, capacity)
+
+    @staticmethod
+    def _domain(full_domain):
+        return full_domain.rstrip('.').lower()
+
+    @contextmanager
+    def _transaction(self):
+        """Run the block in a transaction holding the write lock"""
+        db = sqlite3.connect(self.path, timeout=self.lock_timeout,
+                             isolation_level=None)
+        with closing(db):
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+
+
+class SharedTokenBucket(object):
+    """Token bucket of an account, shared by processes via `SharedCache`
+
+    Same interface as `scheduler.TokenBucket`, the tokens are kept in
+        the database so a process refills and takes them under its lock.
+    """
+
+    def __init__(self, cache, rate, capacity=None):
+        """Init SharedTokenBucket
+
+        :param SharedCache cache: cache holding the tokens.
+        :param float rate: tokens added per second.
+        :param float capacity: max tokens kept, allowing bursts,
+            defaults to one second worth of tokens.
+        """
+        self.cache = cache
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+
+    def reserve(self):
+        """
+        Take a token, borrowing it from the future if none is available
+
+        :returns: seconds to wait before the token may be used.
+        :rtype: float
+        """
+        # pylint: disable=protected-access
+        with self.cache._transaction() as db:
+            now = time.time()
+            row = db.execute(
+                'SELECT tokens, updated_at FROM buckets WHERE account = ?',
+                (self.cache.account,)).fetchone()
+
+            tokens = self.capacity
+            if row is not None:
+                elapsed = max(0, now - row[1])
+                tokens = min(self.capacity, row[0] + elapsed * self.rate)
+
+            tokens -= 1
+            db.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)',
+                       (self.cache.account, tokens, now))
+
+        if tokens >= 0:
+            return 0
+
+        return -tokens / self.rate
+
+    def acquire(self):
+        """Take a token, waiting until one is available"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
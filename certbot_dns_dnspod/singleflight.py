@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Coalescing of identical concurrent reads, with a short result cache"""
+
+import threading
+import time
+
+DEFAULT_TTL = 2
+
+
+class _Call(object):
+    """A read in flight, followers wait for its result"""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Run identical concurrent reads once and share their result
+
+    The first caller of a key runs the read, callers arriving while it
+        runs wait for it and get the same result, or error. Results are
+        cached for ttl seconds, unless a write to their zone invalidates
+        them; a read overlapping such a write is not cached, since it
+        may have missed the change.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        """Init SingleFlight
+
+        :param float ttl: seconds results are cached, 0 to only coalesce
+            reads in flight.
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._cache = {}
+        # zone => number of invalidations, None counts every zone
+        self._generations = {}
+
+    def do(self, key, zone, func):
+        """
+        Run a read, unless an identical one is in flight or cached
+
+        :param key: hashable identity of the read, e.g. action and
+            parameters.
+        :param str zone: zone the read depends on, None if any.
+        :param callable func: runs the read.
+        :returns: result of func, shared by the callers of key.
+        :raises Exception: the error func raised.
+        """
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > time.time():
+                return cached[1]
+
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                generation = self._generation(zone)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                unchanged = self._generation(zone) == generation
+                if call.error is None and self.ttl > 0 and unchanged:
+                    self._cache[key] = (time.time() + self.ttl, call.result,
+                                        zone)
+            call.done.set()
+
+        return call.result
+
+    def invalidate(self, zone=None):
+        """Drop cached results of a zone, e.g. after changing its records
+
+        :param str zone: zone changed, None for every zone.
+        """
+        with self._lock:
+            self._generations[zone] = self._generations.get(zone, 0) + 1
+            self._cache = dict(
+                (key, cached) for key, cached in self._cache.items()
+                if zone is not None and cached[2] != zone)
+
+    def _generation(self, zone):
+        """Count invalidations affecting a zone"""
+        count = self._generations.get(None, 0)
+        if zone is not None:
+            count += self._generations.get(zone, 0)
+        return count
@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+"""Client of the Tencent Cloud DNSPod API (v3)
+
+The v3 API takes JSON requests signed with TC3-HMAC-SHA256 by a
+SecretId/SecretKey pair, has higher rate limits than the legacy token
+API, and creates and deletes records in batch jobs.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import time
+
+try:
+    from urllib.parse import urlparse
+except ImportError:  # pragma: no cover
+    from urlparse import urlparse
+
+import requests
+from certbot import errors
+
+from .dnspod_client import BATCH_CHUNK_SIZE
+from .dnspod_client import DNSPodClient
+from .dnspod_client import DOMAIN_LIST_PAGE_SIZE
+from .dnspod_client import Record
+from .dnspod_client import RecordGoneError
+from .dnspod_client import parse_api_time
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+TENCENTCLOUD_BASE_URL = 'https://dnspod.tencentcloudapi.com/'
+API_VERSION = '2021-03-23'
+SERVICE = 'dnspod'
+SIGNATURE_ALGORITHM = 'TC3-HMAC-SHA256'
+CONTENT_TYPE = 'application/json; charset=utf-8'
+
+NO_RECORD_CODE = 'ResourceNotFound.NoDataOfRecord'
+NO_DOMAIN_CODE = 'ResourceNotFound.NoDataOfDomain'
+GONE_ERR_CODES = ('InvalidParameter.RecordIdInvalid', NO_RECORD_CODE)
+
+# Legacy actions the shared client logic calls, mapped to v3 actions
+ACTIONS = {
+    'Domain.List': 'DescribeDomainList',
+    'Record.List': 'DescribeRecordList',
+    'Record.Create': 'CreateRecord',
+    'Record.Modify': 'ModifyRecord',
+    'Record.Remove': 'DeleteRecord',
+    'Batch.Record.Create': 'CreateRecordBatch',
+    'Batch.Record.Modify': 'ModifyRecordBatch',
+    'Batch.Record.Remove': 'DeleteRecordBatch',
+    'Batch.Detail': 'DescribeBatchTask',
+}
+
+# Statuses of records in DescribeBatchTask, mapped to Batch.Detail ones
+BATCH_STATUSES = {
+    'success': 'ok',
+    'fail': 'error',
+}
+
+
+def _hmac_sha256(key, msg):
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+def _sha256_hex(content):
+    if not isinstance(content, bytes):
+        content = content.encode('utf-8')
+
+    return hashlib.sha256(content).hexdigest()
+
+
+class TC3Signer(object):
+    """Sign v3 API requests with TC3-HMAC-SHA256
+
+    The signing key only depends on the UTC date, so it is derived once
+        per day instead of with four HMACs per request.
+    """
+
+    def __init__(self, secret_id, secret_key, service=SERVICE):
+        """Init TC3Signer
+
+        :param str secret_id: SecretId of the API key.
+        :param str secret_key: SecretKey of the API key.
+        :param str service: service the requests are sent to.
+        """
+        self.secret_id = secret_id
+        self.secret_key = secret_key
+        self.service = service
+        self._signing_key = (None, None)
+
+    def get_signing_key(self, date):
+        """
+        Get the key signing the requests of a day
+
+        :param str date: UTC date like 2021-03-23.
+        :rtype: bytes
+        """
+        key_date, key = self._signing_key
+        if key_date != date:
+            secret_date = _hmac_sha256(
+                ('TC3' + self.secret_key).encode('utf-8'), date)
+            secret_service = _hmac_sha256(secret_date, self.service)
+            key = _hmac_sha256(secret_service, 'tc3_request')
+            self._signing_key = (date, key)
+
+        return key
+
+    def sign(self, host, payload, timestamp):
+        """
+        Get the Authorization header of a request
+
+        :param str host: Host header of the request.
+        :param bytes payload: request body.
+        :param int timestamp: X-TC-Timestamp of the request.
+        :rtype: str
+        """
+        date = time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+        scope = '{0}/{1}/tc3_request'.format(date, self.service)
+
+        canonical_request = '\n'.join([
+            'POST', '/', '',
+            'content-type:{0}'.format(CONTENT_TYPE),
+            'host:{0}'.format(host), '',
+            'content-type;host',
+            _sha256_hex(payload),
+        ])
+        string_to_sign = '\n'.join([
+            SIGNATURE_ALGORITHM, str(timestamp), scope,
+            _sha256_hex(canonical_request),
+        ])
+        signature = hmac.new(self.get_signing_key(date),
+                             string_to_sign.encode('utf-8'),
+                             hashlib.sha256).hexdigest()
+
+        return ('{0} Credential={1}/{2}, SignedHeaders=content-type;host, '
+                'Signature={3}'.format(SIGNATURE_ALGORITHM, self.secret_id,
+                                       scope, signature))
+
+
+class TencentCloudDNSPodClient(DNSPodClient):
+    """DNSPod client speaking the Tencent Cloud API v3
+
+    Zones, listing, journaling, rollback and concurrency are shared with
+        `DNSPodClient`, only requests and responses differ. With batch,
+        records are also removed with DeleteRecordBatch jobs.
+    """
+
+    RETRY_ERR_CODES = ('RequestLimitExceeded',
+                       'RequestLimitExceeded.UinLimitExceeded',
+                       'RequestLimitExceeded.IPLimitExceeded')
+    GONE_ERR_CODES = GONE_ERR_CODES
+    READ_ACTIONS = ('DescribeDomainList', 'DescribeRecordList')
+
+    def __init__(self, secret_id, secret_key, ttl, contact_email,
+                 region=None, base_url=TENCENTCLOUD_BASE_URL, **kwargs):
+        """Init TencentCloudDNSPodClient
+
+        :param str secret_id: SecretId of a Tencent Cloud API key.
+        :param str secret_key: SecretKey of a Tencent Cloud API key.
+        :param int ttl: DNS ttl.
+        :param str contact_email: Contact email, sent in the User-Agent.
+        :param str region: X-TC-Region of the requests, not needed by
+            DNSPod.
+        :param base_url: URL of the API endpoint, or a list of them.
+        :type base_url: Union[str, List[str]]
+
+        Other parameters are the ones of `DNSPodClient`.
+        """
+        super(TencentCloudDNSPodClient, self).__init__(
+            None, ttl, contact_email, base_url=base_url, **kwargs)
+        self.region = region
+        self.signer = TC3Signer(secret_id, secret_key)
+
+    def _common_data(self):
+        return {}
+
+    @staticmethod
+    def _request_zone(data):
+        zone = data.get('Domain')
+
+        return zone.lower() if zone else None
+
+    def _get_url(self, action, base_url=None):
+        return '{0}{1}'.format(
+            base_url or self.endpoints.choose(trial=False),
+            ACTIONS.get(action, action))
+
+    def _parse_response(self, url, status_code, content, sent_bytes=0):
+        result = super(TencentCloudDNSPodClient, self)._parse_response(
+            url, status_code, content, sent_bytes)
+
+        return result.get('Response') or {}
+
+    @staticmethod
+    def _result_status(result):
+        error = (result.get('Response') or {}).get('Error')
+        if error:
+            return error.get('Code'), error.get('Message')
+
+        return 'Success', ''
+
+    @staticmethod
+    def _check(result, message, **kwargs):
+        """
+        Raise the error of a v3 API response
+
+        :param Dict[str, Any] result: `Response` of the API response.
+        :param str message: what failed, formatted with kwargs.
+        :raises errors.PluginError: If the API returned an error.
+        """
+        error = result.get('Error')
+        if error:
+            raise errors.PluginError(
+                '[DNSPod] {0}, err_code: {1}, err_msg: {2}'.format(
+                    message.format(**kwargs), error.get('Code'),
+                    error.get('Message')))
+
+    @staticmethod
+    def _list_domains_data(offset):
+        return {
+            'Type': 'ALL',
+            'Offset': offset,
+            'Limit': DOMAIN_LIST_PAGE_SIZE
+        }
+
+    @classmethod
+    def _parse_list_domains(cls, result, domains):
+        if (result.get('Error') or {}).get('Code') == NO_DOMAIN_CODE:
+            return False
+        cls._check(result, 'List domains failed')
+
+        page = result.get('DomainList') or []
+        for domain in page:
+            name = domain.get('Punycode') or domain['Name']
+            domains[name] = str(domain['DomainId'])
+
+        total = int((result.get('DomainCountInfo') or {})
+                    .get('AllTotal', 0))
+
+        return bool(page) and len(domains) < total
+
+    def _create_txt_record_data(self, sub_domain, base_domain,
+                                record_content):
+        return {
+            'Domain': base_domain,
+            'SubDomain': sub_domain,
+            'RecordType': 'TXT',
+            'RecordLine': '默认',
+            'Value': record_content,
+            'TTL': int(self.ttl)
+        }
+
+    def _parse_create_txt_record(self, result, full_domain, record_content,
+                                 base_domain):
+        self._check(result, 'Create TXT record failed, domain: {domain}',
+                    domain=full_domain)
+
+        record_id = result.get('RecordId')
+        if record_id is None:
+            return None
+
+        record_id = str(record_id)
+        self._journal_record(full_domain, record_content, record_id,
+                             base_domain)
+
+        return record_id
+
+    @staticmethod
+    def _modify_txt_record_data(record_id, sub_domain, base_domain,
+                                record_content):
+        return {
+            'Domain': base_domain,
+            'RecordId': int(record_id),
+            'SubDomain': sub_domain,
+            'RecordType': 'TXT',
+            'RecordLine': '默认',
+            'Value': record_content
+        }
+
+    def _parse_modify_txt_record(self, result, record_id, full_domain,
+                                 record_content, base_domain):
+        if (result.get('Error') or {}).get('Code') in self.GONE_ERR_CODES:
+            raise RecordGoneError(
+                '[DNSPod] Modify TXT record failed, domain: {0}, '
+                'err_code: {1}, err_msg: {2}'.format(
+                    full_domain, result['Error'].get('Code'),
+                    result['Error'].get('Message')))
+        self._check(result, 'Modify TXT record failed, domain: {domain}',
+                    domain=full_domain)
+
+        self._journal_record(full_domain, record_content, record_id,
+                             base_domain)
+
+    @staticmethod
+    def _list_records_data(base_domain, offset, length, sub_domain=None,
+                           record_type=None, keyword=None):
+        data = {
+            'Domain': base_domain,
+            'Offset': offset,
+            'Limit': length
+        }
+
+        if sub_domain:
+            data['Subdomain'] = sub_domain
+        if record_type:
+            data['RecordType'] = record_type
+        if keyword:
+            data['Keyword'] = keyword
+
+        return data
+
+    @classmethod
+    def _parse_list_records(cls, result, data):
+        if (result.get('Error') or {}).get('Code') == NO_RECORD_CODE:
+            return [], False
+
+        full_domain = data['Domain']
+        if 'Subdomain' in data:
+            full_domain = '{0}.{1}'.format(data['Subdomain'], full_domain)
+        cls._check(result, 'Get {type} record info failed, domain: {domain}',
+                   type=data.get('RecordType', 'DNS'), domain=full_domain)
+
+        records = [Record(str(record['RecordId']), record['Name'],
+                          record['Type'], record['Value'],
+                          parse_api_time(record.get('UpdatedOn')))
+                   for record in result.get('RecordList') or []]
+
+        if len(records) < data['Limit']:
+            return records, False
+
+        total = (result.get('RecordCountInfo') or {}).get('TotalCount')
+        if total is None:
+            return records, True
+
+        return records, data['Offset'] + len(records) < int(total)
+
+    @staticmethod
+    def _remove_record_data(record_id, base_domain):
+        return {
+            'Domain': base_domain,
+            'RecordId': int(record_id)
+        }
+
+    @classmethod
+    def _parse_remove_record(cls, result, full_domain):
+        error = result.get('Error')
+        if error and error.get('Code') in cls.GONE_ERR_CODES:
+            logger.info('[DNSPod] Record of {0} is already removed, '
+                        'err_msg: {1}'.format(full_domain,
+                                              error.get('Message')))
+        elif error:
+            logger.error(
+                '[DNSPod] Remove record failed, domain: {0}, '
+                'err_code: {1}, err_msg: {2}'.format(
+                    full_domain, error.get('Code'), error.get('Message')))
+            return False
+
+        return True
+
+    def _batch_create_txt_data(self, zone_id, entries):
+        return {
+            'DomainIdList': [zone_id],
+            'RecordList': [{
+                'SubDomain': sub_domain,
+                'RecordType': 'TXT',
+                'RecordLine': '默认',
+                'Value': value,
+                'TTL': int(self.ttl)
+            } for sub_domain, value in entries]
+        }
+
+    @staticmethod
+    def _batch_modify_value_data(record_ids, record_content):
+        return {
+            'RecordIdList': [int(record_id) for record_id in record_ids],
+            'Change': 'value',
+            'ChangeTo': record_content
+        }
+
+    @staticmethod
+    def _batch_remove_data(record_ids):
+        """
+        Get parameters of DeleteRecordBatch
+
+        :param List[str] record_ids: DNS record IDs in DNSPod.
+        :rtype: Dict[str, Any]
+        """
+        return {
+            'RecordIdList': [int(record_id) for record_id in record_ids]
+        }
+
+    @staticmethod
+    def _batch_detail_data(job_id):
+        return {'JobId': int(job_id)}
+
+    @classmethod
+    def _parse_batch_job(cls, result, operation):
+        cls._check(result, '{operation} batch job failed',
+                   operation=operation)
+
+        return str(result['JobId'])
+
+    @classmethod
+    def _parse_batch_detail(cls, result):
+        cls._check(result, 'Get batch job detail failed')
+
+        records = []
+        for domain in result.get('DetailList') or []:
+            for record in domain.get('RecordList') or []:
+                status = record.get('Status')
+                records.append({
+                    'domain': domain.get('Domain'),
+                    'record_id': str(record.get('RecordId') or ''),
+                    'sub_domain': record.get('SubDomain') or '',
+                    'value': record.get('Value'),
+                    'status': BATCH_STATUSES.get(status, status),
+                    'error': record.get('ErrMsg'),
+                })
+
+        pending = any(record['status'] not in ('ok', 'error')
+                      for record in records)
+
+        return pending, records
+
+    def batch_remove_records(self, records):
+        """
+        Remove records with DeleteRecordBatch jobs
+
+        :param records: (full_domain, record_content, record_id) tuples.
+        :type records: Iterable[Tuple[str, str, str]]
+        :returns: (removed, failures), (record, record_id) pairs of
+            removed records and (record, error message) pairs of the
+            others.
+        :rtype: Tuple[list, list]
+        """
+        records = list(records)
+
+        jobs = []
+        for chunk in self._chunks(records, BATCH_CHUNK_SIZE):
+            data = self._batch_remove_data([record[2] for record in chunk])
+            with self._span('batch_remove', records=len(chunk)):
+                jobs.append(self._submit_batch_job(
+                    'Batch.Record.Remove', data, 'Remove', chunk))
+
+        return self._wait_batch_jobs(jobs, lambda record: (record[2],))
+
+    def _batch_remove_tasks(self, tasks):
+        records = [(task[0], task[1], task[3][0]) for task in tasks]
+        tasks_by_record = dict(zip(records, tasks))
+
+        removed, failures = self.batch_remove_records(records)
+
+        return (
+            [(tasks_by_record[record], True) for record, _ in removed],
+            [(record[0], errors.PluginError(
+                '[DNSPod] Remove record failed, {0}'.format(error)))
+             for record, error in failures])
+
+    def _send_post(self, url, data):
+        """
+        Send one signed request to the v3 API
+
+        :param str url: URL of the action, see `_get_url`.
+        :param Dict[str, Any] data: request parameters
+        :returns: `Response` of the API response
+        :rtype: Dict[str, Any]
+        :raises RetryableError: If the request failed transiently.
+        """
+        base_url = self._get_base_url(url)
+        host = urlparse(base_url).netloc
+        payload = json.dumps(data).encode('utf-8')
+        timestamp = int(time.time())
+
+        headers = {
+            'Authorization': self.signer.sign(host, payload, timestamp),
+            'Content-Type': CONTENT_TYPE,
+            'Host': host,
+            'X-TC-Action': self._get_action(url),
+            'X-TC-Timestamp': str(timestamp),
+            'X-TC-Version': API_VERSION,
+        }
+        if self.region:
+            headers['X-TC-Region'] = self.region
+
+        try:
+            resp = self._get_session().post(base_url, data=payload,
+                                            headers=headers,
+                                            timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            self._observe_request(url, 'error')
+            raise
+
+        return self._parse_response(url, resp.status_code, resp.content,
+                                    len(payload))
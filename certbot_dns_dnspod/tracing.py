@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""Tracing spans and sampling profiler of Authenticator runs"""
+
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import contextvars
+except ImportError:  # pragma: no cover
+    contextvars = None
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# time.monotonic is missing on Python 2
+_clock = getattr(time, 'monotonic', time.time)
+
+
+@contextmanager
+def null_span():
+    """Stand-in for `Tracer.span` when tracing is off"""
+    yield None
+
+
+class _ThreadLocalVar(object):
+    """Minimal ContextVar on top of threading.local, for Python 2"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self):
+        return getattr(self._local, 'value', None)
+
+    def set(self, value):
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        self._local.value = token
+
+
+class Tracer(object):
+    """Collect nested spans and write them in Chrome trace event format
+
+    The current span follows the thread, and the asyncio task, it was
+        started in, so spans started inside are its children. Functions
+        handed to a thread pool are wrapped with `bind` to keep their
+        parent. The trace file can be loaded in chrome://tracing or
+        https://ui.perfetto.dev.
+    """
+
+    def __init__(self, path=None):
+        """Init Tracer
+
+        :param str path: file `flush` writes the trace to, spans are only
+            kept in memory if None.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._spans = []
+        self._ids = itertools.count(1)
+        self._origin = _clock()
+        if contextvars is not None:
+            self._current = contextvars.ContextVar(
+                'dnspod_span_{0}'.format(id(self)), default=None)
+        else:  # pragma: no cover
+            self._current = _ThreadLocalVar()
+
+    @property
+    def spans(self):
+        """Finished spans, in the order they finished
+
+        :rtype: List[Dict[str, Any]]
+        """
+        with self._lock:
+            return list(self._spans)
+
+    def current_id(self):
+        """
+        Get the id of the span the caller runs in
+
+        :rtype: Optional[int]
+        """
+        return self._current.get()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time the block as a span, child of the current span
+
+        :param str name: span name like list or create.
+        :param attrs: attributes of the span, e.g. domain, more can be
+            added to the yielded span's 'attrs'.
+        """
+        with self._lock:
+            span_id = next(self._ids)
+        span = {
+            'id': span_id,
+            'parent_id': self._current.get(),
+            'name': name,
+            'attrs': attrs,
+            'thread_id': threading.current_thread().ident,
+            'start': _clock() - self._origin,
+        }
+
+        token = self._current.set(span_id)
+        try:
+            yield span
+        except BaseException as e:
+            span['attrs']['error'] = '{0}: {1}'.format(type(e).__name__, e)
+            raise
+        finally:
+            self._current.reset(token)
+            span['end'] = _clock() - self._origin
+            with self._lock:
+                self._spans.append(span)
+
+    def bind(self, func):
+        """
+        Run func as a child of the current span, wherever it is called
+
+        :param callable func: function handed to another thread.
+        :rtype: callable
+        """
+        parent_id = self._current.get()
+
+        def bound(*args, **kwargs):
+            token = self._current.set(parent_id)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._current.reset(token)
+
+        return bound
+
+    def to_trace_events(self):
+        """
+        Get the spans in Chrome trace event format
+
+        :rtype: Dict[str, Any]
+        """
+        pid = os.getpid()
+        events = []
+
+        for span in sorted(self.spans, key=lambda s: s['start']):
+            args = dict(span['attrs'], span_id=span['id'],
+                        parent_id=span['parent_id'])
+            events.append({
+                'name': span['name'],
+                'cat': 'dnspod',
+                'ph': 'X',
+                'ts': round(span['start'] * 1e6, 3),
+                'dur': round((span['end'] - span['start']) * 1e6, 3),
+                'pid': pid,
+                'tid': span['thread_id'],
+                'args': args,
+            })
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def flush(self):
+        """Write the trace file, errors are logged only"""
+        if not self.path:
+            return
+
+        try:
+            _write_atomically(self.path, json.dumps(self.to_trace_events()))
+        except (IOError, OSError) as e:
+            logger.warning('Unable to write DNSPod trace: %s', e)
+
+
+class SamplingProfiler(object):
+    """Sample stacks of all threads while plugin phases run
+
+    Stacks are written in the folded format of flamegraph.pl, which
+        speedscope and most flame graph viewers load, rooted at the phase
+        and the thread name. Threads blocked on the network show up in
+        socket frames, so both CPU and wall time are visible.
+    """
+
+    def __init__(self, path, interval=DEFAULT_SAMPLE_INTERVAL):
+        """Init SamplingProfiler
+
+        :param str path: file `flush` writes the folded stacks to.
+        :param float interval: seconds between samples.
+        """
+        self.path = path
+        self.interval = interval
+        self.stacks = Counter()
+        self._phase = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def phase(self, name):
+        """Sample stacks while the block runs
+
+        :param str name: phase name like perform or cleanup.
+        """
+        self._phase = name
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='dnspod-profiler')
+        self._thread.daemon = True
+        self._thread.start()
+        try:
+            yield
+        finally:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def sample(self):
+        """Take one sample of all threads but the profiler's"""
+        names = dict((thread.ident, thread.name)
+                     for thread in threading.enumerate())
+        own_id = threading.current_thread().ident
+
+        # pylint: disable=protected-access
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+
+            functions = []
+            while frame is not None:
+                code = frame.f_code
+                functions.append('{0}.{1}'.format(
+                    frame.f_globals.get('__name__', '?'), code.co_name))
+                frame = frame.f_back
+
+            functions.append(names.get(thread_id, str(thread_id)))
+            functions.append(self._phase or '-')
+            self.stacks[';'.join(reversed(functions))] += 1
+
+    def flush(self):
+        """Write the folded stacks, errors are logged only"""
+        try:
+            _write_atomically(self.path, ''.join(
+                '{0} {1}\n'.format(stack, count)
+                for stack, count in sorted(self.stacks.items())))
+        except (IOError, OSError) as e:
+            logger.warning('Unable to write DNSPod profile: %s', e)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+def _write_atomically(path, content):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.rename(tmp_path, path)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Suffix trie of the zones hosted in a DNSPod account"""
+
+
+class ZoneIndex(object):
+    """Map full domains to the DNSPod zone they belong to
+
+    Zones are stored in a trie keyed by reversed labels, so looking up a
+        domain costs one dict access per label and always returns the
+        longest matching zone, e.g. `a.example.com.cn` resolves to zone
+        `example.com.cn` and a delegated `dev.example.com` wins over
+        `example.com`.
+    """
+
+    # Key of the zone name stored on a trie node, labels are never None
+    _ZONE = None
+
+    def __init__(self, zones=None):
+        """Init ZoneIndex
+
+        :param Dict[str, str] zones: zone names mapped to their DNSPod ids.
+        """
+        self._root = {}
+        self.zone_ids = {}
+
+        for name, zone_id in (zones or {}).items():
+            self.add(name, zone_id)
+
+    def __len__(self):
+        return len(self.zone_ids)
+
+    def add(self, name, zone_id=None):
+        """Add a zone
+
+        :param str name: zone name like example.com
+        :param str zone_id: DNSPod domain id of the zone
+        """
+        name = name.rstrip('.').lower()
+
+        node = self._root
+        for label in reversed(name.split('.')):
+            node = node.setdefault(label, {})
+        node[self._ZONE] = name
+
+        self.zone_ids[name] = zone_id
+
+    def split(self, full_domain):
+        """
+        Split full domain into sub_domain and the zone containing it
+
+        :param str full_domain: domain like abc.example.com
+        :returns: (sub_domain, zone) or None if no zone contains the domain,
+            sub_domain is '@' for the apex of the zone.
+        :rtype: Optional[Tuple[str, str]]
+        """
+        labels = full_domain.rstrip('.').split('.')
+
+        node = self._root
+        zone = None
+        depth = 0
+        for i, label in enumerate(reversed(labels)):
+            node = node.get(label.lower())
+            if node is None:
+                break
+            if self._ZONE in node:
+                zone = node[self._ZONE]
+                depth = i + 1
+
+        if zone is None:
+            return None
+
+        sub_domain = '.'.join(labels[:-depth]) or '@'
+
+        return sub_domain, zone
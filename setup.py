@@ -55,10 +55,16 @@ setup(
     ],
     install_requires=install_requires,
     tests_requires=tests_requires,
+    extras_require={
+        'async': ['aiohttp'],
+    },
     entry_points={
         'certbot.plugins': [
             'dns-dnspod = certbot_dns_dnspod.dns_dnspod:Authenticator',
         ],
+        'console_scripts': [
+            'certbot-dns-dnspod-gc = certbot_dns_dnspod.gc:main',
+        ],
     },
     include_package_data=True,
     # test_suite='tests',
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+import sys
+
+import pytest
+
+# The asyncio client and its tests use async/await, a syntax error on
+# Python 2, so the module can't even be collected to be skipped there.
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append('test_async_client.py')
+
+
+@pytest.fixture
+def no_retry_sleep(monkeypatch):
+    """Skip the delays between retries, and any other time.sleep"""
+    monkeypatch.setattr('certbot_dns_dnspod.scheduler.time.sleep',
+                        lambda seconds: None)
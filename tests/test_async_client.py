@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from certbot.errors import PluginError
+
+aiohttp = pytest.importorskip('aiohttp')
+aioresponses = pytest.importorskip('aioresponses').aioresponses
+
+from certbot_dns_dnspod.async_client import AsyncDNSPodClient  # noqa: E402
+from certbot_dns_dnspod.journal import RecordJournal  # noqa: E402
+
+
+API_TOKEN = '1234,abcdefg'
+TTL = 600
+CONTACT_EMAIL = 'admin@example.com'
+
+SUB_DOMAIN = '_acme-challenge'
+BASE_DOMAIN = 'example.com'
+FULL_DOMAIN = '.'.join([SUB_DOMAIN, BASE_DOMAIN])
+RECORD_ID = '1234567'
+
+
+@pytest.fixture(autouse=True)
+def no_retry_sleep(monkeypatch):
+    async def sleep(seconds):
+        pass
+
+    monkeypatch.setattr('certbot_dns_dnspod.async_client.asyncio.sleep',
+                        sleep)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def url(action):
+    return 'https://dnsapi.cn/{0}'.format(action)
+
+
+def mock_domain_list(mocked, *zones):
+    zones = zones or (BASE_DOMAIN,)
+    mocked.post(url('Domain.List'), payload={
+        'status': {'code': '1'},
+        'info': {'domain_total': len(zones)},
+        'domains': [{'id': str(i), 'name': zone}
+                    for i, zone in enumerate(zones, 1)]
+    })
+
+
+def sent(mocked, action):
+    return [call.kwargs['data'] for (method, call_url), calls
+            in mocked.requests.items() if str(call_url) == url(action)
+            for call in calls]
+
+
+def test_add_and_del_txt_record():
+    journal = RecordJournal()
+
+    async def scenario():
+        async with AsyncDNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL,
+                                     journal=journal) as client:
+            await client.add_txt_record(FULL_DOMAIN, 'v2')
+            await client.del_txt_record(FULL_DOMAIN, 'v2')
+
+    with aioresponses() as mocked:
+        mock_domain_list(mocked)
+        mocked.post(url('Record.List'), payload={
+            'status': {'code': '1'},
+            'records': [{'id': '1', 'name': SUB_DOMAIN, 'type': 'TXT',
+                         'value': 'v1'}]})
+        mocked.post(url('Record.Create'), payload={
+            'status': {'code': '1'}, 'record': {'id': RECORD_ID}})
+        mocked.post(url('Record.Remove'), payload={'status': {'code': '1'}})
+
+        run(scenario())
+
+        create, = sent(mocked, 'Record.Create')
+        assert create['value'] == 'v2'
+        assert create['sub_domain'] == SUB_DOMAIN
+        assert create['ttl'] == str(TTL)
+        assert create['login_token'] == API_TOKEN
+        remove, = sent(mocked, 'Record.Remove')
+        assert remove['record_id'] == RECORD_ID
+        assert len(sent(mocked, 'Record.List')) == 1
+        assert len(journal) == 0
+
+
+def test_many_records_in_flight():
+    zones = ['example.com', 'example.net', 'example.org']
+    records = [('_acme-challenge.www{0}.{1}'.format(i, zone), 'v{0}'.format(i))
+               for i in range(100) for zone in zones]
+
+    async def scenario():
+        async with AsyncDNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL) as client:
+            await client.add_txt_records(records)
+
+    with aioresponses() as mocked:
+        mock_domain_list(mocked, *zones)
+        mocked.post(url('Record.List'), payload={'status': {'code': '10'}},
+                    repeat=True)
+        mocked.post(url('Record.Create'), payload={'status': {'code': '1'}},
+                    repeat=True)
+
+        run(scenario())
+
+        assert len(sent(mocked, 'Domain.List')) == 1
+        assert len(sent(mocked, 'Record.List')) == 3
+        assert len(sent(mocked, 'Record.Create')) == 300
+
+
+def test_add_failure_aggregated_and_rolled_back():
+    journal = RecordJournal()
+
+    async def scenario():
+        client = AsyncDNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL,
+                                   journal=journal, max_retries=0)
+        try:
+            await client.add_txt_records([
+                ('_acme-challenge.a.example.com', 'good'),
+                ('_acme-challenge.b.example.com', 'bad'),
+            ])
+        finally:
+            await client.close()
+
+    with aioresponses() as mocked:
+        mock_domain_list(mocked)
+        mocked.post(url('Record.List'), payload={'status': {'code': '10'}})
+        mocked.post(url('Record.Create'), payload={
+            'status': {'code': '1'}, 'record': {'id': RECORD_ID}})
+        mocked.post(url('Record.Create'), status=500)
+        mocked.post(url('Record.Remove'), payload={'status': {'code': '1'}})
+
+        with pytest.raises(PluginError, match='failed for 1 of 2 records'):
+            run(scenario())
+
+        remove, = sent(mocked, 'Record.Remove')
+        assert remove['record_id'] == RECORD_ID
+        assert len(journal) == 0
+
+
+def test_retry_transient_error():
+    async def scenario():
+        async with AsyncDNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL) as client:
+            return await client._get_zone_index()
+
+    with aioresponses() as mocked:
+        mocked.post(url('Domain.List'), status=503)
+        mocked.post(url('Domain.List'), payload={
+            'status': {'code': '-2', 'message': 'API usage exceeded'}})
+        mock_domain_list(mocked)
+
+        zone_index = run(scenario())
+
+        assert zone_index.split(FULL_DOMAIN) == (SUB_DOMAIN, BASE_DOMAIN)
+        assert len(sent(mocked, 'Domain.List')) == 3
+
+
+def test_no_retry_of_write_that_may_be_applied():
+    async def scenario():
+        async with AsyncDNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL) as client:
+            await client.add_txt_record(FULL_DOMAIN, 'v1')
+
+    with aioresponses() as mocked:
+        mock_domain_list(mocked)
+        mocked.post(url('Record.List'), payload={
+            'status': {'code': '10', 'message': 'No records'}})
+        mocked.post(url('Record.Create'), status=502)
+
+        with pytest.raises(PluginError, match='status_code: 502'):
+            run(scenario())
+
+        assert len(sent(mocked, 'Record.Create')) == 1
+
+
+def test_error_mapping():
+    async def scenario():
+        async with AsyncDNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL) as client:
+            await client.add_txt_record(FULL_DOMAIN, 'v1')
+
+    with aioresponses() as mocked:
+        mock_domain_list(mocked)
+        mocked.post(url('Record.List'), payload={
+            'status': {'code': '13', 'message': 'Domain not exists'}})
+
+        with pytest.raises(PluginError,
+                           match=r'\[DNSPod\] Get TXT record info failed'):
+            run(scenario())
+
+
+def test_failover_between_endpoints():
+    backup = 'https://backup.example.com/'
+
+    async def scenario():
+        async with AsyncDNSPodClient(
+                API_TOKEN, TTL, CONTACT_EMAIL,
+                base_url=['https://dnsapi.cn/', backup]) as client:
+            zone_index = await client._get_zone_index()
+            return client, zone_index
+
+    with aioresponses() as mocked:
+        mocked.post(url('Domain.List'),
+                    exception=aiohttp.ServerDisconnectedError())
+        mocked.post(backup + 'Domain.List', payload={
+            'status': {'code': '1'}, 'info': {'domain_total': 1},
+            'domains': [{'id': '1', 'name': BASE_DOMAIN}]})
+
+        client, zone_index = run(scenario())
+
+        # the preferred endpoint failed, the retry went to the other one
+        assert zone_index.split(FULL_DOMAIN) == (SUB_DOMAIN, BASE_DOMAIN)
+        assert len(sent(mocked, 'Domain.List')) == 1
+        assert client.endpoints.choose() == backup
+
+
+def test_concurrent_identical_reads_are_coalesced():
+    async def scenario():
+        async with AsyncDNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL,
+                                     read_cache_ttl=0) as client:
+            return await asyncio.gather(*[
+                client._list_txt_records(BASE_DOMAIN, [SUB_DOMAIN])
+                for _ in range(3)])
+
+    async def respond(request_url, **kwargs):
+        # keep the first read in flight while the others start
+        loop = asyncio.get_event_loop()
+        answered = loop.create_future()
+        loop.call_later(0.05, answered.set_result, None)
+        await answered
+
+    with aioresponses() as mocked:
+        mocked.post(url('Record.List'), callback=respond, payload={
+            'status': {'code': '1'},
+            'records': [{'id': '1', 'name': SUB_DOMAIN, 'type': 'TXT',
+                         'value': 'v1'}]})
+
+        listings = run(scenario())
+
+        assert len(sent(mocked, 'Record.List')) == 1
+        assert listings[0] == listings[1] == listings[2]
+        assert listings[0]
+
+
+def test_pool_and_batch_rejected():
+    with pytest.raises(PluginError, match='not supported'):
+        AsyncDNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL, batch=True)
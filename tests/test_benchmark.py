@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import pytest
+
+from certbot_dns_dnspod import benchmark
+
+BASELINE = os.path.join(os.path.dirname(__file__), os.pardir, 'benchmarks',
+                        'baseline.json')
+
+
+@pytest.fixture(scope='module')
+def account_key():
+    import josepy as jose
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    return jose.JWKRSA(key=rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend()))
+
+
+def test_get_domains():
+    assert benchmark.get_domains('many-zones', 2) == (
+        ['example0.com', 'example1.com'], ['example0.com', 'example1.com'])
+    assert benchmark.get_domains('wildcard-apex', 3) == (
+        ['example.com'],
+        ['san0.example.com', '*.san0.example.com', 'san1.example.com'])
+
+    with pytest.raises(ValueError):
+        benchmark.get_domains('unknown', 1)
+
+
+def test_percentile():
+    samples = [float(i) for i in range(1, 101)]
+
+    assert benchmark.percentile(samples, 50) == 50
+    assert benchmark.percentile(samples, 99) == 99
+    assert benchmark.percentile([], 99) == 0
+
+
+@pytest.mark.parametrize('shape', benchmark.SHAPES)
+def test_calls_not_above_baseline(shape, account_key):
+    results = [benchmark.run_scenario(shape, sans, account_key, latency=0,
+                                      jitter=0)
+               for sans in (1, 10)]
+
+    assert all(result['leftover_records'] == 0 for result in results)
+    with open(BASELINE) as f:
+        assert benchmark.compare(results, json.load(f)['results']) == []
+
+
+def test_wildcard_apex_lists_once(account_key):
+    result = benchmark.run_scenario('wildcard-apex', 10, account_key,
+                                    latency=0, jitter=0)
+
+    assert result['phases']['perform']['calls'] == {
+        'Domain.List': 1, 'Record.List': 1, 'Record.Create': 10}
+    assert result['phases']['cleanup']['calls'] == {'Record.Remove': 10}
+
+
+def test_compare():
+    baseline = [{'name': 'a/1', 'calls': {'Record.List': 1}}]
+
+    assert benchmark.compare(
+        [{'name': 'a/1', 'calls': {'Record.List': 1}}], baseline) == []
+    assert benchmark.compare(
+        [{'name': 'a/1', 'calls': {'Record.List': 2, 'Record.Modify': 1}}],
+        baseline) == ['a/1: 2 calls of Record.List, was 1',
+                      'a/1: 1 calls of Record.Modify, was 0']
+    assert benchmark.compare(
+        [{'name': 'b/1', 'calls': {'Record.List': 5}}], baseline) == []
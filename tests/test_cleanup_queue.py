@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+
+import pytest
+
+from certbot_dns_dnspod.cleanup_queue import CleanupQueue
+from certbot_dns_dnspod.dnspod_client import DNSPodClient
+from certbot_dns_dnspod.fake_server import FakeDNSPodServer
+from certbot_dns_dnspod.journal import RecordJournal
+
+
+API_TOKEN = '1234,abcdefg'
+
+
+def make_client(server, **kwargs):
+    return DNSPodClient(API_TOKEN, 600, 'admin@example.com',
+                        base_url=server.base_url, max_concurrency=4,
+                        **kwargs)
+
+
+@pytest.fixture
+def server():
+    with FakeDNSPodServer(zones=['example.com', 'example.org']) as server:
+        yield server
+
+
+def test_flush_coalesces_cleanups(server, tmpdir):
+    journal = RecordJournal(str(tmpdir.join('journal.json')))
+    client = make_client(server, journal=journal)
+    other = make_client(server)
+    client.add_txt_records([('_acme-challenge.a.example.com', 'v1'),
+                            ('_acme-challenge.b.example.com', 'v2')])
+    other.add_txt_records([('_acme-challenge.example.org', 'v3'),
+                           ('_acme-challenge.www.example.org', 'v4')])
+    server.calls.clear()
+
+    queue = CleanupQueue(flush_delay=60)
+    queue.put(client, [('_acme-challenge.a.example.com', 'v1')])
+    queue.put(other, [('_acme-challenge.example.org', 'v3')])
+    queue.put(client, [('_acme-challenge.b.example.com', 'v2')])
+    queue.put(other, [('_acme-challenge.www.example.org', 'v4')])
+    assert len(queue) == 4
+    # queued records are still journaled
+    assert len(journal) == 2
+
+    queue.flush()
+
+    assert len(queue) == 0
+    assert len(journal) == 0
+    assert server.records('example.com') == []
+    assert server.records('example.org') == []
+    # journaled records are removed by id, the others with one listing
+    assert server.calls == {'Record.List': 1, 'Record.Remove': 4}
+
+    queue.flush()
+    assert server.calls['Record.Remove'] == 4
+
+
+def test_flush_in_background(server):
+    client = make_client(server)
+    client.add_txt_record('_acme-challenge.example.com', 'v1')
+
+    flushed = threading.Event()
+    queue = CleanupQueue(flush_delay=0.01)
+    flush = queue.flush
+
+    def flush_and_notify():
+        flush()
+        flushed.set()
+
+    queue.flush = flush_and_notify
+    queue.put(client, [('_acme-challenge.example.com', 'v1')])
+
+    assert flushed.wait(5)
+    assert server.records('example.com') == []
+
+
+def test_failures_are_logged(server, caplog):
+    client = make_client(server, max_retries=0)
+    client.add_txt_record('_acme-challenge.example.com', 'v1')
+    server.error_rate = 1
+
+    queue = CleanupQueue(flush_delay=60)
+    queue.put(client, [('_acme-challenge.example.com', 'v1')])
+    queue.flush()
+
+    assert 'Deferred cleanup of DNSPod records failed' in caplog.text
+
+
+def test_interrupted_flush_is_requeued(server, monkeypatch):
+    client = make_client(server)
+    client.add_txt_record('_acme-challenge.example.com', 'v1')
+    del_txt_records = client.del_txt_records
+
+    def interrupted(records):
+        raise RuntimeError('cannot schedule new futures after shutdown')
+
+    queue = CleanupQueue(flush_delay=60)
+    queue.put(client, [('_acme-challenge.example.com', 'v1')])
+    monkeypatch.setattr(client, 'del_txt_records', interrupted)
+    queue.flush()
+
+    # left to the atexit flush
+    assert len(queue) == 1
+    monkeypatch.setattr(client, 'del_txt_records', del_txt_records)
+    queue.flush(at_exit=True)
+
+    assert len(queue) == 0
+    assert server.records('example.com') == []
+
+
+def test_process_queue_flushed_at_exit(server):
+    client = make_client(server)
+    client.add_txt_records([('_acme-challenge.a.example.com', 'v1'),
+                            ('_acme-challenge.b.example.com', 'v2')])
+
+    # the interpreter exits long before the flush delay
+    script = textwrap.dedent("""
+        from certbot_dns_dnspod.cleanup_queue import get_cleanup_queue
+        from certbot_dns_dnspod.dnspod_client import DNSPodClient
+
+        client = DNSPodClient({0!r}, 600, 'admin@example.com',
+                              base_url={1!r}, max_concurrency=4)
+        get_cleanup_queue().put(client, [
+            ('_acme-challenge.a.example.com', 'v1'),
+            ('_acme-challenge.b.example.com', 'v2'),
+        ])
+    """).format(API_TOKEN, server.base_url)
+    process = subprocess.Popen(
+        [sys.executable, '-c', script], stderr=subprocess.PIPE,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    _, stderr = process.communicate()
+
+    assert process.returncode == 0, stderr
+    assert b'Error' not in stderr
+    assert server.records('example.com') == []
+    assert server.calls['Record.Remove'] == 2
+
+
+def test_process_exits_during_background_flush():
+    with FakeDNSPodServer(zones=['example.com'], latency=0.3) as server:
+        client = make_client(server)
+        client.add_txt_records([('_acme-challenge.a.example.com', 'v1'),
+                                ('_acme-challenge.b.example.com', 'v2')])
+
+        # the background flush is still listing records when the
+        # interpreter exits, its thread pools then refuse new work
+        script = textwrap.dedent("""
+            import time
+
+            from certbot_dns_dnspod.cleanup_queue import get_cleanup_queue
+            from certbot_dns_dnspod.dnspod_client import DNSPodClient
+
+            client = DNSPodClient({0!r}, 600, 'admin@example.com',
+                                  base_url={1!r}, max_concurrency=4)
+            queue = get_cleanup_queue()
+            queue.flush_delay = 0.05
+            queue.put(client, [
+                ('_acme-challenge.a.example.com', 'v1'),
+                ('_acme-challenge.b.example.com', 'v2'),
+            ])
+            time.sleep(0.5)
+        """).format(API_TOKEN, server.base_url)
+        process = subprocess.Popen(
+            [sys.executable, '-c', script], stderr=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        _, stderr = process.communicate()
+
+        assert process.returncode == 0, stderr
+        assert b'Error' not in stderr
+        assert server.records('example.com') == []
@@ -1,5 +1,7 @@
 """Tests for certbot_dns_dnspod.dns_dnspod."""
 
+import time
+
 import mock
 
 from certbot.compat import os
@@ -33,7 +35,18 @@ class AuthenticatorTest(
 
         super(AuthenticatorTest, self).setUp()
         self.config = mock.MagicMock(
-            dnspod_credentials=path, dnspod_propagation_seconds=0
+            dnspod_credentials=path, dnspod_propagation_seconds=0,
+            dnspod_max_concurrency=4, dnspod_rate_limit=10,
+            dnspod_batch=False, dnspod_reuse_records=False,
+            dnspod_shared_cache=False, dnspod_deferred_cleanup=False,
+            dnspod_reconcile=False,
+            dnspod_reconcile_dry_run=False,
+            dnspod_propagation_check=False,
+            dnspod_propagation_timeout=0,
+            dnspod_propagation_percentile=0, dnspod_nameservers=None,
+            dnspod_metrics_textfile=None, dnspod_metrics_jsonl=None,
+            dnspod_trace_file=None, dnspod_profile_file=None,
+            work_dir=self.tempdir, config_dir=self.tempdir,
         )  # don't wait during tests
 
         self.auth = Authenticator(self.config, "dnspod")
@@ -47,8 +60,8 @@ class AuthenticatorTest(
         self.auth.perform([self.achall])
 
         expected = [
-            mock.call.add_txt_record(
-                "_acme-challenge." + DOMAIN, mock.ANY
+            mock.call.add_txt_records(
+                [("_acme-challenge." + DOMAIN, mock.ANY)]
             )
         ]
         self.assertEqual(expected, self.mock_client.mock_calls)
@@ -59,8 +72,340 @@ class AuthenticatorTest(
         self.auth.cleanup([self.achall])
 
         expected = [
-            mock.call.del_txt_record(
-                "_acme-challenge." + DOMAIN, mock.ANY
-            )
+            mock.call.del_txt_records(
+                [("_acme-challenge." + DOMAIN, mock.ANY)]
+            ),
+            mock.call.del_journaled_records(older_than=3600),
         ]
         self.assertEqual(expected, self.mock_client.mock_calls)
+
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.get_cleanup_queue")
+    def test_deferred_cleanup(self, mock_get_queue):
+        self.config.dnspod_deferred_cleanup = True
+        # _attempt_cleanup | pylint: disable=protected-access
+        self.auth._attempt_cleanup = True
+        self.auth._dnspod_client = self.mock_client
+        self.auth.cleanup([self.achall])
+
+        mock_get_queue.return_value.put.assert_called_once_with(
+            self.mock_client, [("_acme-challenge." + DOMAIN, mock.ANY)])
+        self.mock_client.del_txt_records.assert_not_called()
+        # the queue closes the client once it is flushed
+        self.mock_client.close.assert_not_called()
+        self.assertIsNone(self.auth._dnspod_client)
+
+    def test_perform_batches_challenges(self):
+        responses = self.auth.perform([self.achall, self.achall])
+
+        self.assertEqual(2, len(responses))
+        self.mock_client.add_txt_records.assert_called_once_with(
+            [("_acme-challenge." + DOMAIN, mock.ANY)] * 2)
+
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.time.sleep")
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.PropagationChecker")
+    def test_perform_propagation_check(self, mock_checker_cls, mock_sleep):
+        self.config.dnspod_propagation_check = True
+        self.config.dnspod_propagation_timeout = 60
+        self.config.dnspod_nameservers = "127.0.0.1:5353"
+        self.mock_client.get_zone.return_value = DOMAIN
+        mock_checker_cls.return_value.visible_at = {DOMAIN: 0}
+
+        self.auth.perform([self.achall])
+
+        mock_checker_cls.assert_called_once_with([("127.0.0.1", 5353)])
+        mock_checker_cls.return_value.wait.assert_called_once_with(
+            [("_acme-challenge." + DOMAIN, mock.ANY, DOMAIN)], 60)
+        mock_sleep.assert_not_called()
+
+        # pylint: disable=protected-access
+        entry = self.auth._get_history().entries()[0]
+        self.assertEqual(DOMAIN, entry['zone'])
+        self.assertEqual(1, entry['counts'][0])
+
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.time.sleep")
+    def test_perform_propagation_percentile(self, mock_sleep):
+        self.config.dnspod_propagation_seconds = 30
+        self.config.dnspod_propagation_percentile = 95
+        self.mock_client.get_zone.return_value = DOMAIN
+
+        # cold start waits propagation-seconds
+        self.auth.perform([self.achall])
+        mock_sleep.assert_called_once_with(30)
+
+        # pylint: disable=protected-access
+        history = self.auth._get_history()
+        for seconds in (2, 3, 4, 4, 7):
+            history.observe(DOMAIN, seconds)
+        mock_sleep.reset_mock()
+        self.auth.perform([self.achall])
+        mock_sleep.assert_called_once_with(8)
+
+        for _ in range(20):
+            history.observe(DOMAIN, 100)
+        mock_sleep.reset_mock()
+        self.auth.perform([self.achall])
+        mock_sleep.assert_called_once_with(30)
+
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.time.sleep")
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.PropagationChecker")
+    def test_perform_propagation_check_with_percentile(self, mock_checker_cls,
+                                                       mock_sleep):
+        self.config.dnspod_propagation_check = True
+        self.config.dnspod_propagation_timeout = 60
+        self.config.dnspod_propagation_percentile = 95
+        self.config.dnspod_propagation_seconds = 30
+        self.mock_client.get_zone.return_value = DOMAIN
+        checker = mock_checker_cls.return_value
+        checker.visible_at = {DOMAIN: time.time() + 9}
+        checker.visible_on_first_round = set()
+
+        # without enough history, polling starts right away
+        self.auth.perform([self.achall])
+        mock_sleep.assert_not_called()
+        checker.wait.assert_called_once_with(mock.ANY, 60)
+
+        # pylint: disable=protected-access
+        history = self.auth._get_history()
+        for seconds in (2, 3, 4, 4):
+            history.observe(DOMAIN, seconds)
+        checker.wait.reset_mock()
+
+        # the learned delay is slept first, and still measured
+        self.auth.perform([self.achall])
+        mock_sleep.assert_called_once_with(10)
+        checker.wait.assert_called_once_with(mock.ANY, 50)
+        entry = self.auth._get_history().entries()[0]
+        self.assertEqual(6, sum(entry['counts']))
+
+        # records visible on the first poll may have been visible before
+        # the head start ended, so they are not measured
+        checker.visible_on_first_round = {DOMAIN}
+        self.auth.perform([self.achall])
+        entry = self.auth._get_history().entries()[0]
+        self.assertEqual(6, sum(entry['counts']))
+
+        # the head start is capped by propagation-seconds
+        mock_sleep.reset_mock()
+        self.config.dnspod_propagation_seconds = 5
+        self.auth.perform([self.achall])
+        mock_sleep.assert_called_once_with(5)
+
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.time.sleep")
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.PropagationChecker")
+    def test_perform_propagation_check_fallback(self, mock_checker_cls,
+                                                mock_sleep):
+        from certbot.errors import PluginError
+
+        self.config.dnspod_propagation_check = True
+        self.config.dnspod_propagation_seconds = 30
+        mock_checker_cls.return_value.wait.side_effect = PluginError(
+            "no nameservers")
+
+        self.auth.perform([self.achall])
+
+        mock_sleep.assert_called_once_with(30)
+
+    def test_metrics_written_after_cleanup(self):
+        import json
+
+        textfile = os.path.join(self.tempdir, "dnspod.prom")
+        jsonl = os.path.join(self.tempdir, "dnspod.jsonl")
+        self.config.dnspod_metrics_textfile = textfile
+        self.config.dnspod_metrics_jsonl = jsonl
+
+        self.auth.perform([self.achall])
+        self.assertFalse(os.path.exists(textfile))
+        self.auth.cleanup([self.achall])
+
+        with open(textfile) as f:
+            content = f.read()
+        for phase in ("perform", "propagation", "cleanup"):
+            self.assertIn(
+                'dnspod_phase_seconds_count{{phase="{0}"}} 1'.format(phase),
+                content)
+        with open(jsonl) as f:
+            phases = [json.loads(line)["phase"] for line in f]
+        self.assertEqual(["perform", "propagation", "cleanup"], phases)
+
+    def test_trace_and_profile_written_after_cleanup(self):
+        import json
+
+        trace_file = os.path.join(self.tempdir, "trace.json")
+        profile_file = os.path.join(self.tempdir, "profile.folded")
+        self.config.dnspod_trace_file = trace_file
+        self.config.dnspod_profile_file = profile_file
+
+        self.auth.perform([self.achall])
+        self.auth._attempt_cleanup = True
+        self.auth.cleanup([self.achall])
+
+        with open(trace_file) as f:
+            events = json.load(f)["traceEvents"]
+        self.assertEqual(["perform", "propagation", "cleanup"],
+                         [event["name"] for event in events])
+        self.assertEqual(1, events[0]["args"]["records"])
+        self.assertTrue(os.path.exists(profile_file))
+
+    def test_cleanup_without_perform(self):
+        self.auth.cleanup([self.achall])
+
+        self.mock_client.del_txt_records.assert_not_called()
+
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.DNSPodClient")
+    def test_client_shared_across_challenges(self, mock_client_cls):
+        # drop the stubbed factory | pylint: disable=protected-access
+        del self.auth._get_dnspod_client
+
+        self.auth.perform([self.achall, self.achall])
+        self.auth._attempt_cleanup = True
+        self.auth.cleanup([self.achall, self.achall])
+
+        mock_client_cls.assert_called_once_with(
+            FAKE_API_TOKEN, str(FAKE_DNS_TTL), FAKE_CONTACT_EMAIL,
+            max_concurrency=4, rate_limit=10, journal=mock.ANY,
+            base_url='https://dnsapi.cn/', metrics=mock.ANY,
+            tracer=mock.ANY, batch=False, pool=None,
+            shared_cache=None)
+        client = mock_client_cls.return_value
+        self.assertEqual(1, client.add_txt_records.call_count)
+        self.assertEqual(1, client.del_txt_records.call_count)
+        client.close.assert_called_once_with()
+        self.assertIsNone(self.auth._dnspod_client)
+
+        journal = mock_client_cls.call_args[1]['journal']
+        self.assertEqual(
+            os.path.join(self.tempdir, 'dns-dnspod', 'journal.json'),
+            journal.path)
+
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.DNSPodClient")
+    def test_api_url_endpoints(self, mock_client_cls):
+        from certbot_dns_dnspod.dns_dnspod import create_client
+
+        path = self.config.dnspod_credentials
+        for api_url in ('"https://a.example.com/, https://b.example.com/"',
+                        'https://a.example.com/, https://b.example.com/'):
+            with open(path, "w") as f:
+                f.write("dnspod_api_token = \"{0}\"\n"
+                        "dnspod_dns_ttl = {1}\n"
+                        "dnspod_contact_email = {2}\n"
+                        "dnspod_api_url = {3}\n".format(
+                            FAKE_API_TOKEN, FAKE_DNS_TTL,
+                            FAKE_CONTACT_EMAIL, api_url))
+            # pylint: disable=protected-access
+            self.auth._setup_credentials()
+
+            create_client(self.auth.credentials)
+
+            self.assertEqual(
+                ["https://a.example.com/", "https://b.example.com/"],
+                mock_client_cls.call_args[1]["base_url"])
+
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.TencentCloudDNSPodClient")
+    def test_tencentcloud_backend(self, mock_client_cls):
+        dns_test_common.write(
+            {
+                "dnspod_backend": "tencentcloud",
+                "dnspod_secret_id": "AKIDexample",
+                "dnspod_secret_key": "secret",
+                "dnspod_dns_ttl": FAKE_DNS_TTL,
+                "dnspod_contact_email": FAKE_CONTACT_EMAIL,
+            },
+            self.config.dnspod_credentials,
+        )
+        # drop the stubbed factory | pylint: disable=protected-access
+        del self.auth._get_dnspod_client
+
+        self.auth.perform([self.achall])
+
+        mock_client_cls.assert_called_once_with(
+            "AKIDexample", "secret", str(FAKE_DNS_TTL), FAKE_CONTACT_EMAIL,
+            region=None, base_url='https://dnspod.tencentcloudapi.com/',
+            max_concurrency=4, rate_limit=10, journal=mock.ANY,
+            metrics=mock.ANY, tracer=mock.ANY, batch=False, pool=None,
+            shared_cache=None)
+
+    def test_tencentcloud_backend_requires_secret(self):
+        from certbot import errors
+
+        dns_test_common.write(
+            {
+                "dnspod_backend": "tencentcloud",
+                "dnspod_dns_ttl": FAKE_DNS_TTL,
+                "dnspod_contact_email": FAKE_CONTACT_EMAIL,
+            },
+            self.config.dnspod_credentials,
+        )
+
+        self.assertRaises(errors.PluginError, self.auth.perform,
+                          [self.achall])
+
+    def test_unknown_backend(self):
+        from certbot import errors
+
+        dns_test_common.write(
+            {
+                "dnspod_backend": "other",
+                "dnspod_api_token": FAKE_API_TOKEN,
+                "dnspod_dns_ttl": FAKE_DNS_TTL,
+                "dnspod_contact_email": FAKE_CONTACT_EMAIL,
+            },
+            self.config.dnspod_credentials,
+        )
+
+        self.assertRaises(errors.PluginError, self.auth.perform,
+                          [self.achall])
+
+    def test_perform_reconcile(self):
+        self.config.dnspod_reconcile = True
+
+        self.auth.perform([self.achall])
+
+        self.mock_client.reconcile.assert_called_once_with(
+            [("_acme-challenge." + DOMAIN, mock.ANY)], dry_run=False)
+        self.mock_client.add_txt_records.assert_not_called()
+
+    @test_util.patch_get_utility()
+    def test_perform_reconcile_dry_run(self, mock_get_utility):
+        from certbot import errors
+
+        self.config.dnspod_reconcile_dry_run = True
+        self.mock_client.reconcile.return_value.format.return_value = 'plan'
+
+        self.assertRaises(errors.PluginError, self.auth.perform,
+                          [self.achall])
+
+        self.mock_client.reconcile.assert_called_once_with(
+            [("_acme-challenge." + DOMAIN, mock.ANY)], dry_run=True)
+        mock_get_utility().notification.assert_called_once_with(
+            'plan', pause=False)
+
+        self.auth.cleanup([self.achall])
+        self.mock_client.del_txt_records.assert_not_called()
+
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.DNSPodClient")
+    def test_reuse_records(self, mock_client_cls):
+        self.config.dnspod_reuse_records = True
+        # drop the stubbed factory | pylint: disable=protected-access
+        del self.auth._get_dnspod_client
+
+        self.auth.perform([self.achall])
+
+        pool = mock_client_cls.call_args[1]['pool']
+        self.assertEqual(
+            os.path.join(self.tempdir, 'dns-dnspod', 'pool.json'), pool.path)
+
+    @mock.patch("certbot_dns_dnspod.dns_dnspod.DNSPodClient")
+    def test_shared_cache(self, mock_client_cls):
+        from certbot_dns_dnspod.shared_cache import account_key
+
+        self.config.dnspod_shared_cache = True
+        # drop the stubbed factory | pylint: disable=protected-access
+        del self.auth._get_dnspod_client
+
+        self.auth.perform([self.achall])
+
+        cache = mock_client_cls.call_args[1]['shared_cache']
+        self.assertEqual(
+            os.path.join(self.tempdir, 'dns-dnspod', 'cache.sqlite'),
+            cache.path)
+        self.assertEqual(account_key(FAKE_API_TOKEN), cache.account)
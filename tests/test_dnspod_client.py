@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import json
+
 import requests
 import responses
 import pytest
+from urllib3.exceptions import MaxRetryError
+from urllib3.exceptions import NewConnectionError
 
 from certbot.errors import PluginError
 
 from certbot_dns_dnspod.dnspod_client import DNSPodClient
+from certbot_dns_dnspod.dnspod_client import Record
+from certbot_dns_dnspod.dnspod_client import parse_api_time
+from certbot_dns_dnspod.journal import RecordJournal
+from certbot_dns_dnspod.metrics import Metrics
 
 if requests.compat.is_py2:
     from urlparse import parse_qsl  # pylint: disable=E0611,E0401
@@ -26,6 +34,9 @@ RECORD_VALUE = 'record_value'
 RECORD_ID = '1234567'
 
 
+pytestmark = pytest.mark.usefixtures('no_retry_sleep')
+
+
 @pytest.fixture
 def dnspod():
     return DNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL)
@@ -50,6 +61,22 @@ def list_record_result(record_id, record_value):
     }
 
 
+def add_domain_list_response(*zones):
+    zones = zones or (BASE_DOMAIN,)
+    responses.add(
+        responses.POST,
+        'https://dnsapi.cn/Domain.List',
+        json={
+            'status': {'code': '1'},
+            'info': {'domain_total': len(zones)},
+            'domains': [
+                {'id': str(i), 'name': zone}
+                for i, zone in enumerate(zones, 1)
+            ]
+        }
+    )
+
+
 def complete_params(data_dict):
     common_params = {
         'login_token': API_TOKEN,
@@ -68,6 +95,7 @@ def parse_resp_data(encoded_str):
 
 @responses.activate
 def test_add_txt_record_create(dnspod):
+    add_domain_list_response()
     responses.add(
         responses.POST,
         'https://dnsapi.cn/Record.Create',
@@ -95,20 +123,23 @@ def test_add_txt_record_create(dnspod):
     expected_list_params = complete_params({
         'domain': BASE_DOMAIN,
         'sub_domain': SUB_DOMAIN,
-        'record_type': 'TXT'
+        'record_type': 'TXT',
+        'offset': '0',
+        'length': '500'
     })
 
-    assert len(responses.calls) == 2
+    assert len(responses.calls) == 3
 
-    list_params = parse_resp_data(responses.calls[0].request.body)
+    list_params = parse_resp_data(responses.calls[1].request.body)
     assert list_params == expected_list_params
 
-    create_params = parse_resp_data(responses.calls[1].request.body)
+    create_params = parse_resp_data(responses.calls[2].request.body)
     assert create_params == expected_create_params
 
 
 @responses.activate
-def test_add_txt_record_modify(dnspod):
+def test_add_txt_record_alongside(dnspod):
+    add_domain_list_response()
     RECORD_VALUE2 = 'record_value2'
 
     responses.add(
@@ -119,7 +150,7 @@ def test_add_txt_record_modify(dnspod):
 
     responses.add(
         responses.POST,
-        'https://dnsapi.cn/Record.Modify',
+        'https://dnsapi.cn/Record.Create',
         json={
             'status': {'code': '1'}
         }
@@ -127,32 +158,53 @@ def test_add_txt_record_modify(dnspod):
 
     dnspod.add_txt_record(FULL_DOMAIN, RECORD_VALUE)
 
-    expected_modify_params = complete_params({
-        'record_id': RECORD_ID,
+    expected_create_params = complete_params({
         'record_type': 'TXT',
         'record_line': '默认',
+        'ttl': str(TTL),
         'domain': BASE_DOMAIN,
         'sub_domain': SUB_DOMAIN,
         'value': RECORD_VALUE
     })
 
-    expected_list_params = complete_params({
+    assert len(responses.calls) == 3
+
+    create_params = parse_resp_data(responses.calls[2].request.body)
+    assert create_params == expected_create_params
+
+
+@responses.activate
+def test_modify_txt_record(dnspod):
+    add_domain_list_response()
+
+    responses.add(
+        responses.POST,
+        'https://dnsapi.cn/Record.Modify',
+        json={
+            'status': {'code': '1'}
+        }
+    )
+
+    dnspod._modify_txt_record(RECORD_ID, FULL_DOMAIN, RECORD_VALUE)
+
+    expected_modify_params = complete_params({
+        'record_id': RECORD_ID,
+        'record_type': 'TXT',
+        'record_line': '默认',
         'domain': BASE_DOMAIN,
         'sub_domain': SUB_DOMAIN,
-        'record_type': 'TXT'
+        'value': RECORD_VALUE
     })
 
     assert len(responses.calls) == 2
 
-    list_params = parse_resp_data(responses.calls[0].request.body)
-    assert list_params == expected_list_params
-
     modify_params = parse_resp_data(responses.calls[1].request.body)
     assert modify_params == expected_modify_params
 
 
 @responses.activate
 def test_add_txt_record_dup_modify(dnspod):
+    add_domain_list_response()
     responses.add(
         responses.POST,
         'https://dnsapi.cn/Record.List',
@@ -164,17 +216,20 @@ def test_add_txt_record_dup_modify(dnspod):
     expected_list_params = complete_params({
         'domain': BASE_DOMAIN,
         'sub_domain': SUB_DOMAIN,
-        'record_type': 'TXT'
+        'record_type': 'TXT',
+        'offset': '0',
+        'length': '500'
     })
 
-    assert len(responses.calls) == 1
+    assert len(responses.calls) == 2
 
-    list_params = parse_resp_data(responses.calls[0].request.body)
+    list_params = parse_resp_data(responses.calls[1].request.body)
     assert list_params == expected_list_params
 
 
 @responses.activate
 def test_del_txt_record(dnspod):
+    add_domain_list_response()
     responses.add(
         responses.POST,
         'https://dnsapi.cn/Record.List',
@@ -197,22 +252,25 @@ def test_del_txt_record(dnspod):
     expected_list_params = complete_params({
         'domain': BASE_DOMAIN,
         'sub_domain': SUB_DOMAIN,
-        'record_type': 'TXT'
+        'record_type': 'TXT',
+        'offset': '0',
+        'length': '500'
     })
 
-    assert len(responses.calls) == 2
-    list_params = parse_resp_data(responses.calls[0].request.body)
+    assert len(responses.calls) == 3
+    list_params = parse_resp_data(responses.calls[1].request.body)
     assert list_params == expected_list_params
 
-    remove_params = parse_resp_data(responses.calls[1].request.body)
+    remove_params = parse_resp_data(responses.calls[2].request.body)
     assert remove_params == expected_remove_params
 
-    assert responses.calls[1].response.json()['status']['code'] == '1'
+    assert responses.calls[2].response.json()['status']['code'] == '1'
 
 
 @responses.activate
 def test_del_txt_record_failed(dnspod):
     '''It won't raise any exception when API returns error'''
+    add_domain_list_response()
     responses.add(
         responses.POST,
         'https://dnsapi.cn/Record.List',
@@ -238,22 +296,25 @@ def test_del_txt_record_failed(dnspod):
     expected_list_params = complete_params({
         'domain': BASE_DOMAIN,
         'sub_domain': SUB_DOMAIN,
-        'record_type': 'TXT'
+        'record_type': 'TXT',
+        'offset': '0',
+        'length': '500'
     })
 
-    assert len(responses.calls) == 2
+    assert len(responses.calls) == 3
 
-    list_params = parse_resp_data(responses.calls[0].request.body)
+    list_params = parse_resp_data(responses.calls[1].request.body)
     assert list_params == expected_list_params
 
-    remove_params = parse_resp_data(responses.calls[1].request.body)
+    remove_params = parse_resp_data(responses.calls[2].request.body)
     assert remove_params == expected_remove_params
 
-    assert responses.calls[1].response.json()['status']['code'] == '21'
+    assert responses.calls[2].response.json()['status']['code'] == '21'
 
 
 @responses.activate
 def test_get_record_info_failed(dnspod):
+    add_domain_list_response()
     ERR_MSG = 'Domain not exists'
     responses.add(
         responses.POST,
@@ -268,13 +329,14 @@ def test_get_record_info_failed(dnspod):
     with pytest.raises(
             PluginError,
             match=r'\[DNSPod\] Get TXT record info failed.*') as exc_info:
-        dnspod._get_txt_record_info_if_exists(FULL_DOMAIN)
+        dnspod._get_txt_record_ids(FULL_DOMAIN)
 
     assert ERR_MSG in str(exc_info)
 
 
 @responses.activate
 def test_http_status_error(dnspod):
+    add_domain_list_response()
     responses.add(
         responses.POST,
         'https://dnsapi.cn/Record.List',
@@ -283,11 +345,12 @@ def test_http_status_error(dnspod):
     )
 
     with pytest.raises(PluginError, match=r'\[DNSPod\] HTTP Error.*'):
-        dnspod._get_txt_record_info_if_exists(FULL_DOMAIN)
+        dnspod._get_txt_record_ids(FULL_DOMAIN)
 
 
 @responses.activate
 def test_http_request_failed(dnspod):
+    add_domain_list_response()
     responses.add(
         responses.POST,
         'https://dnsapi.cn/Record.List',
@@ -295,4 +358,715 @@ def test_http_request_failed(dnspod):
     )
 
     with pytest.raises(requests.exceptions.ConnectionError):
-        dnspod._get_txt_record_info_if_exists(FULL_DOMAIN)
+        dnspod._get_txt_record_ids(FULL_DOMAIN)
+
+
+@responses.activate
+def test_session_reused_with_timeout(dnspod):
+    add_domain_list_response()
+    responses.add(
+        responses.POST,
+        'https://dnsapi.cn/Record.List',
+        json=list_record_result(RECORD_ID, RECORD_VALUE)
+    )
+
+    dnspod._get_txt_record_ids(FULL_DOMAIN)
+    session = dnspod._session
+    # list again instead of reusing the cached result
+    dnspod.reads.invalidate()
+    dnspod._get_txt_record_ids(FULL_DOMAIN)
+
+    assert dnspod._session is session
+    assert len(responses.calls) == 3
+    for call in responses.calls:
+        assert call.request.req_kwargs['timeout'] == dnspod.timeout
+        assert call.request.headers['User-Agent'] == dnspod.user_agent
+
+
+def test_close(dnspod):
+    with dnspod as client:
+        session = client._get_session()
+        adapter = session.get_adapter('https://dnsapi.cn/')
+        assert adapter._pool_maxsize == client.pool_size
+
+    assert dnspod._session is None
+    assert dnspod._get_session() is not session
+
+
+def test_keep_alive_disabled():
+    client = DNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL, keep_alive=False)
+
+    assert client._get_session().headers['Connection'] == 'close'
+
+
+@responses.activate
+def test_split_full_domain_with_zone_index(dnspod):
+    add_domain_list_response('example.com', 'example.com.cn', 'example.co.uk')
+
+    assert dnspod._split_full_domain('_acme-challenge.a.example.com.cn') == \
+        ('_acme-challenge.a', 'example.com.cn')
+    assert dnspod._split_full_domain('_acme-challenge.example.co.uk') == \
+        ('_acme-challenge', 'example.co.uk')
+    assert dnspod._split_full_domain('example.com') == ('@', 'example.com')
+
+    assert len(responses.calls) == 1
+    assert parse_resp_data(responses.calls[0].request.body) == \
+        complete_params({'type': 'all', 'offset': '0', 'length': '500'})
+
+
+@responses.activate
+def test_split_full_domain_unknown_zone(dnspod):
+    add_domain_list_response()
+
+    with pytest.raises(
+            PluginError, match=r'\[DNSPod\] Unable to find a zone.*'):
+        dnspod._split_full_domain('_acme-challenge.example.net')
+
+
+@responses.activate
+def test_list_domains_paginated(dnspod, monkeypatch):
+    monkeypatch.setattr(
+        'certbot_dns_dnspod.dnspod_client.DOMAIN_LIST_PAGE_SIZE', 1)
+    for i, zone in enumerate(['example.com', 'example.net'], 1):
+        responses.add(
+            responses.POST,
+            'https://dnsapi.cn/Domain.List',
+            json={
+                'status': {'code': '1'},
+                'info': {'domain_total': 2},
+                'domains': [{'id': str(i), 'name': zone,
+                             'punycode': zone}]
+            }
+        )
+
+    assert dnspod._list_domains() == {'example.com': '1', 'example.net': '2'}
+    assert [parse_resp_data(c.request.body)['offset']
+            for c in responses.calls] == ['0', '1']
+
+
+@responses.activate
+def test_list_domains_failed(dnspod):
+    responses.add(
+        responses.POST,
+        'https://dnsapi.cn/Domain.List',
+        json={'status': {'code': '-1', 'message': 'Login failed'}}
+    )
+
+    with pytest.raises(PluginError, match=r'\[DNSPod\] List domains failed'):
+        dnspod._split_full_domain(FULL_DOMAIN)
+
+
+@responses.activate
+def test_zone_index_expires(dnspod, monkeypatch):
+    add_domain_list_response()
+    now = [1000.0]
+    monkeypatch.setattr('certbot_dns_dnspod.dnspod_client.time.time',
+                        lambda: now[0])
+
+    dnspod._split_full_domain(FULL_DOMAIN)
+    now[0] += dnspod.zone_cache_ttl - 1
+    dnspod._split_full_domain(FULL_DOMAIN)
+    assert len(responses.calls) == 1
+
+    now[0] += 1
+    dnspod._split_full_domain(FULL_DOMAIN)
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_add_txt_records_one_list_per_zone(dnspod):
+    add_domain_list_response('example.com', 'example.net')
+    responses.add(
+        responses.POST,
+        'https://dnsapi.cn/Record.List',
+        json=list_record_result(RECORD_ID, 'stale_value')
+    )
+    responses.add(
+        responses.POST,
+        'https://dnsapi.cn/Record.List',
+        json={'status': {'code': '10'}}
+    )
+    responses.add(
+        responses.POST,
+        'https://dnsapi.cn/Record.Create',
+        json={'status': {'code': '1'}}
+    )
+
+    dnspod.add_txt_records([
+        ('_acme-challenge.example.com', 'v1'),
+        ('_acme-challenge.example.com', 'v2'),
+        ('_acme-challenge.www.example.com', 'v3'),
+        ('_acme-challenge.example.net', 'v4'),
+        ('_acme-challenge.example.net', 'v4'),
+    ])
+
+    actions = [c.request.url.rsplit('/', 1)[-1] for c in responses.calls]
+    assert actions == [
+        'Domain.List', 'Record.List', 'Record.List', 'Record.Create',
+        'Record.Create', 'Record.Create', 'Record.Create',
+    ]
+
+    zone_list_params = parse_resp_data(responses.calls[1].request.body)
+    assert zone_list_params == complete_params({
+        'domain': 'example.com',
+        'record_type': 'TXT',
+        'keyword': SUB_DOMAIN,
+        'offset': '0',
+        'length': '500'
+    })
+    name_list_params = parse_resp_data(responses.calls[2].request.body)
+    assert name_list_params == complete_params({
+        'domain': 'example.net',
+        'sub_domain': SUB_DOMAIN,
+        'record_type': 'TXT',
+        'offset': '0',
+        'length': '500'
+    })
+
+    assert [parse_resp_data(c.request.body)['value']
+            for c in responses.calls[3:]] == ['v1', 'v2', 'v3', 'v4']
+
+
+@responses.activate
+def test_del_txt_records_one_list_per_zone(dnspod):
+    add_domain_list_response()
+    result = list_record_result(RECORD_ID, 'v1')
+    result['records'].append(dict(result['records'][0], id='2', value='v2'))
+    result['records'].append(dict(result['records'][0], id='3', value='v3'))
+    responses.add(
+        responses.POST,
+        'https://dnsapi.cn/Record.List',
+        json=result
+    )
+    responses.add(
+        responses.POST,
+        'https://dnsapi.cn/Record.Remove',
+        json={'status': {'code': '1'}}
+    )
+
+    dnspod.del_txt_records([(FULL_DOMAIN, 'v1'), (FULL_DOMAIN, 'v2')])
+
+    assert len(responses.calls) == 4
+    assert [parse_resp_data(c.request.body)['record_id']
+            for c in responses.calls[2:]] == [RECORD_ID, '2']
+
+
+@responses.activate
+def test_add_txt_records_concurrent_failure_rollback():
+    dnspod = DNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL, max_concurrency=4)
+    add_domain_list_response()
+
+    created = []
+
+    def create_callback(request):
+        params = parse_resp_data(request.body)
+        if params['value'] == 'bad':
+            return (200, {}, json.dumps({
+                'status': {'code': '22', 'message': 'Invalid sub domain'}}))
+        created.append(params)
+        return (200, {}, json.dumps({
+            'status': {'code': '1'},
+            'record': {'id': params['sub_domain'], 'status': 'enable'}}))
+
+    def list_callback(request):
+        records = [{'id': p['sub_domain'], 'name': p['sub_domain'],
+                    'type': 'TXT', 'value': p['value']} for p in created]
+        return (200, {}, json.dumps({
+            'status': {'code': '1'}, 'records': records}))
+
+    responses.add_callback(
+        responses.POST, 'https://dnsapi.cn/Record.List',
+        callback=list_callback)
+    responses.add_callback(
+        responses.POST, 'https://dnsapi.cn/Record.Create',
+        callback=create_callback)
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Remove',
+        json={'status': {'code': '1'}})
+
+    with pytest.raises(PluginError) as exc_info:
+        dnspod.add_txt_records([
+            ('_acme-challenge.a.example.com', 'good'),
+            ('_acme-challenge.b.example.com', 'bad'),
+            ('_acme-challenge.c.example.com', 'good'),
+        ])
+
+    message = str(exc_info.value)
+    assert 'failed for 1 of 3 records' in message
+    assert '_acme-challenge.b.example.com' in message
+    assert 'Invalid sub domain' in message
+
+    removed = sorted(parse_resp_data(c.request.body)['record_id']
+                     for c in responses.calls
+                     if c.request.url.endswith('Record.Remove'))
+    assert removed == ['_acme-challenge.a', '_acme-challenge.c']
+
+
+@responses.activate
+def test_del_txt_records_concurrent_errors_aggregated():
+    dnspod = DNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL, max_concurrency=4)
+    add_domain_list_response()
+    result = list_record_result(RECORD_ID, 'v1')
+    result['records'].append(dict(result['records'][0], id='2', value='v2'))
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.List', json=result)
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Remove',
+        body=requests.exceptions.ConnectionError('Connection error.'))
+
+    with pytest.raises(PluginError, match=r'failed for 2 of 2 records'):
+        dnspod.del_txt_records([(FULL_DOMAIN, 'v1'), (FULL_DOMAIN, 'v2')])
+
+
+@responses.activate
+def test_journal_skips_list_on_cleanup():
+    journal = RecordJournal()
+    dnspod = DNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL, journal=journal)
+    add_domain_list_response()
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.List',
+        json={'status': {'code': '10'}})
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Create',
+        json={'status': {'code': '1'}, 'record': {'id': RECORD_ID}})
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Remove',
+        json={'status': {'code': '1'}})
+
+    dnspod.add_txt_record(FULL_DOMAIN, RECORD_VALUE)
+    entry = journal.get(FULL_DOMAIN, RECORD_VALUE)
+    assert entry['record_id'] == RECORD_ID
+    assert entry['zone'] == BASE_DOMAIN
+
+    dnspod.del_txt_record(FULL_DOMAIN, RECORD_VALUE)
+
+    actions = [c.request.url.rsplit('/', 1)[-1] for c in responses.calls]
+    assert actions == [
+        'Domain.List', 'Record.List', 'Record.Create', 'Record.Remove']
+    assert parse_resp_data(responses.calls[3].request.body) == \
+        complete_params({'domain': BASE_DOMAIN, 'record_id': RECORD_ID})
+    assert journal.get(FULL_DOMAIN, RECORD_VALUE) is None
+
+
+@responses.activate
+def test_del_journaled_records_after_crash(tmpdir):
+    path = str(tmpdir.join('journal.json'))
+    RecordJournal(path).add(FULL_DOMAIN, RECORD_VALUE, RECORD_ID, BASE_DOMAIN)
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Remove',
+        json={'status': {'code': '1'}})
+
+    dnspod = DNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL,
+                          journal=RecordJournal(path))
+    dnspod.del_journaled_records()
+
+    assert len(responses.calls) == 1
+    assert parse_resp_data(responses.calls[0].request.body) == \
+        complete_params({'domain': BASE_DOMAIN, 'record_id': RECORD_ID})
+    assert len(RecordJournal(path)) == 0
+
+
+@responses.activate
+def test_journal_kept_when_remove_fails():
+    journal = RecordJournal()
+    journal.add(FULL_DOMAIN, RECORD_VALUE, RECORD_ID, BASE_DOMAIN)
+    dnspod = DNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL, journal=journal)
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Remove',
+        json={'status': {'code': '21', 'message': 'Domain is locked.'}})
+
+    dnspod.del_txt_record(FULL_DOMAIN, RECORD_VALUE)
+
+    assert journal.get(FULL_DOMAIN, RECORD_VALUE)['record_id'] == RECORD_ID
+
+
+@responses.activate
+def test_wildcard_and_apex_values_coexist(dnspod):
+    add_domain_list_response()
+    records = []
+
+    def list_callback(request):
+        return (200, {}, json.dumps({
+            'status': {'code': '1'}, 'records': records}))
+
+    def create_callback(request):
+        params = parse_resp_data(request.body)
+        record_id = str(len(records) + 1)
+        records.append({'id': record_id, 'name': params['sub_domain'],
+                        'type': 'TXT', 'value': params['value']})
+        return (200, {}, json.dumps({
+            'status': {'code': '1'}, 'record': {'id': record_id}}))
+
+    responses.add_callback(
+        responses.POST, 'https://dnsapi.cn/Record.List',
+        callback=list_callback)
+    responses.add_callback(
+        responses.POST, 'https://dnsapi.cn/Record.Create',
+        callback=create_callback)
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Remove',
+        json={'status': {'code': '1'}})
+
+    dnspod.add_txt_record(FULL_DOMAIN, 'wildcard')
+    dnspod.add_txt_record(FULL_DOMAIN, 'apex')
+    dnspod.add_txt_record(FULL_DOMAIN, 'apex')
+
+    assert dnspod._get_txt_record_ids(FULL_DOMAIN) == {
+        'wildcard': '1', 'apex': '2'}
+
+    dnspod.del_txt_record(FULL_DOMAIN, 'apex')
+
+    removes = [parse_resp_data(c.request.body) for c in responses.calls
+               if c.request.url.endswith('Record.Remove')]
+    assert [p['record_id'] for p in removes] == ['2']
+
+
+@responses.activate
+def test_retry_transient_http_error(dnspod):
+    add_domain_list_response()
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.List',
+        body='Bad gateway', status=502)
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.List',
+        json={'status': {'code': '-2', 'message': 'API usage exceeded'}})
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.List',
+        json=list_record_result(RECORD_ID, RECORD_VALUE))
+
+    assert dnspod._get_txt_record_ids(FULL_DOMAIN) == {
+        RECORD_VALUE: RECORD_ID}
+    assert len(responses.calls) == 4
+
+
+@responses.activate
+def test_no_retry_of_write_that_may_be_applied(dnspod):
+    add_domain_list_response()
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Create',
+        body='Bad gateway', status=502)
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Create',
+        body=requests.exceptions.ConnectionError('Connection reset.'))
+
+    with pytest.raises(PluginError, match=r'\[DNSPod\] HTTP Error.*502'):
+        dnspod._create_txt_record(FULL_DOMAIN, RECORD_VALUE)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        dnspod._create_txt_record(FULL_DOMAIN, RECORD_VALUE)
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_retry_throttled_write(dnspod):
+    add_domain_list_response()
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Create',
+        body='Too many requests', status=429)
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Create',
+        json={'status': {'code': '1'}, 'record': {'id': RECORD_ID}})
+
+    assert dnspod._create_txt_record(FULL_DOMAIN, RECORD_VALUE) == RECORD_ID
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_retry_write_not_sent(dnspod):
+    add_domain_list_response()
+    refused = NewConnectionError(None, 'Connection refused')
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Create',
+        body=requests.exceptions.ConnectionError(
+            MaxRetryError(None, '/Record.Create', refused)))
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Create',
+        json={'status': {'code': '1'}, 'record': {'id': RECORD_ID}})
+
+    assert dnspod._create_txt_record(FULL_DOMAIN, RECORD_VALUE) == RECORD_ID
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_retry_exhausted():
+    dnspod = DNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL, max_retries=2)
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Domain.List',
+        body='Service unavailable', status=503)
+
+    with pytest.raises(PluginError, match=r'\[DNSPod\] HTTP Error.*503'):
+        dnspod._get_zone_index()
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_no_retry_on_client_error(dnspod):
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Domain.List',
+        body='Forbidden', status=403)
+
+    with pytest.raises(PluginError, match=r'\[DNSPod\] HTTP Error.*403'):
+        dnspod._get_zone_index()
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_no_retry_on_read_timeout(dnspod):
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Domain.List',
+        body=requests.exceptions.ReadTimeout('Read timed out.'))
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        dnspod._get_zone_index()
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_metrics():
+    metrics = Metrics()
+    dnspod = DNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL, metrics=metrics)
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Domain.List',
+        body='Bad gateway', status=502)
+    add_domain_list_response()
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.List',
+        json={'status': {'code': '10', 'message': 'No records'}})
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.Create',
+        json={'status': {'code': '1'}, 'record': {'id': RECORD_ID}})
+
+    dnspod.add_txt_record(FULL_DOMAIN, RECORD_VALUE)
+
+    def counter(name, **labels):
+        return metrics.get_counter(name, **labels)
+
+    assert counter('dnspod_api_requests_total', action='Domain.List',
+                   code='http_502') == 1
+    assert counter('dnspod_api_requests_total', action='Domain.List',
+                   code='1') == 1
+    assert counter('dnspod_api_requests_total', action='Record.List',
+                   code='10') == 1
+    assert counter('dnspod_api_calls_total', action='Domain.List') == 1
+    assert counter('dnspod_api_retries_total', action='Domain.List') == 1
+    assert counter('dnspod_api_retries_total', action='Record.Create') == 0
+    assert counter('dnspod_api_sent_bytes_total', action='Record.Create') \
+        == len(responses.calls[3].request.body)
+    assert counter('dnspod_api_received_bytes_total',
+                   action='Record.Create') \
+        == len(responses.calls[3].response.content)
+    assert metrics.get_histogram('dnspod_api_call_seconds',
+                                 action='Record.Create')['count'] == 1
+
+
+@responses.activate
+def test_metrics_connection_error():
+    metrics = Metrics()
+    dnspod = DNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL, metrics=metrics)
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Domain.List',
+        body=requests.exceptions.ReadTimeout('Read timed out.'))
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        dnspod._get_zone_index()
+
+    assert metrics.get_counter('dnspod_api_requests_total',
+                               action='Domain.List', code='error') == 1
+    assert metrics.get_counter('dnspod_api_calls_total',
+                               action='Domain.List') == 1
+
+
+def record_page(records, total):
+    return {
+        'status': {'code': '1'},
+        'info': {'record_total': str(total), 'records_num': str(len(records))},
+        'records': [
+            {'id': str(i), 'name': name, 'type': 'TXT', 'value': value}
+            for i, name, value in records
+        ]
+    }
+
+
+@responses.activate
+def test_iter_records_pages_lazily(dnspod):
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.List',
+        json=record_page([(1, 'a', 'v1'), (2, 'b', 'v2')], 3))
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.List',
+        json=record_page([(3, 'c', 'v3')], 3))
+
+    records = dnspod.iter_records(BASE_DOMAIN, record_type='TXT',
+                                  keyword='_acme', page_size=2)
+
+    assert next(records) == Record('1', 'a', 'TXT', 'v1')
+    assert len(responses.calls) == 1
+    assert list(records) == [Record('2', 'b', 'TXT', 'v2'),
+                             Record('3', 'c', 'TXT', 'v3')]
+    assert len(responses.calls) == 2
+
+    params = [parse_resp_data(c.request.body) for c in responses.calls]
+    assert [(p['offset'], p['length']) for p in params] == [
+        ('0', '2'), ('2', '2')]
+    assert params[0]['keyword'] == '_acme'
+    assert params[0]['record_type'] == 'TXT'
+    assert 'sub_domain' not in params[0]
+
+
+@responses.activate
+def test_iter_records_without_total(dnspod):
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.List',
+        json={'status': {'code': '1'},
+              'records': [{'id': '1', 'name': 'a', 'type': 'TXT',
+                           'value': 'v1'}]})
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.List',
+        json={'status': {'code': '10', 'message': 'No records'}})
+
+    assert len(list(dnspod.iter_records(BASE_DOMAIN, page_size=1))) == 1
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_iter_records_error(dnspod):
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Record.List',
+        json={'status': {'code': '6', 'message': 'Domain id invalid'}})
+
+    with pytest.raises(PluginError,
+                       match=r'Get DNS record info failed.*err_code: 6'):
+        list(dnspod.iter_records(BASE_DOMAIN))
+
+
+def test_record_is_slotted():
+    record = Record('1', SUB_DOMAIN, 'TXT', RECORD_VALUE)
+
+    assert not hasattr(record, '__dict__')
+    assert record != Record('2', SUB_DOMAIN, 'TXT', RECORD_VALUE)
+    assert repr(record) == (
+        "Record(id='1', name='_acme-challenge', type='TXT', "
+        "value='record_value')")
+
+
+def test_list_txt_records_filters():
+    filters = DNSPodClient._list_txt_records_filters
+
+    assert filters(['_acme-challenge']) == {'sub_domain': '_acme-challenge'}
+    assert filters(['_acme-challenge.a', '_acme-challenge.B']) == {
+        'keyword': '_acme-challenge.'}
+    assert filters(['_acme-challenge', '@']) == {}
+
+
+@responses.activate
+def test_batch_create_txt_records_chunked_and_polled(dnspod, monkeypatch):
+    monkeypatch.setattr('certbot_dns_dnspod.dnspod_client.BATCH_CHUNK_SIZE',
+                        2)
+    add_domain_list_response()
+
+    jobs = {}
+
+    def create_callback(request):
+        params = parse_resp_data(request.body)
+        job_id = str(len(jobs) + 1)
+        jobs[job_id] = json.loads(params['records'])
+        assert params['domain_id'] == '1'
+        return (200, {}, json.dumps({
+            'status': {'code': '1'}, 'job_id': job_id}))
+
+    polls = []
+
+    def detail_callback(request):
+        job_id = parse_resp_data(request.body)['job_id']
+        polls.append(job_id)
+        running = polls.count(job_id) == 1
+        records = [{
+            'record_id': '' if r['value'] == 'bad' else r['sub_domain'],
+            'sub_domain': r['sub_domain'],
+            'value': r['value'],
+            'status': 'running' if running else (
+                'error' if r['value'] == 'bad' else 'ok'),
+            'error': 'Invalid value' if r['value'] == 'bad' else '',
+        } for r in jobs[job_id]]
+        return (200, {}, json.dumps({
+            'status': {'code': '1'},
+            'detail': [{'domain': BASE_DOMAIN, 'records': records}]}))
+
+    responses.add_callback(
+        responses.POST, 'https://dnsapi.cn/Batch.Record.Create',
+        callback=create_callback)
+    responses.add_callback(
+        responses.POST, 'https://dnsapi.cn/Batch.Detail',
+        callback=detail_callback)
+
+    records = [(BASE_DOMAIN, '_acme-challenge.a', 'v1'),
+               (BASE_DOMAIN, '_acme-challenge.b', 'bad'),
+               (BASE_DOMAIN, '_acme-challenge.c', 'v3'),
+               ('unknown.com', '_acme-challenge', 'v4')]
+    created, failures = dnspod.batch_create_txt_records(records)
+
+    assert len(jobs) == 2
+    assert sorted(polls) == ['1', '1', '2', '2']
+    assert created == [(records[0], '_acme-challenge.a'),
+                       (records[2], '_acme-challenge.c')]
+    assert failures == [(records[3], 'zone not found'),
+                        (records[1], 'Invalid value')]
+
+
+@responses.activate
+def test_batch_modify_txt_records_by_value(dnspod):
+    submitted = []
+
+    def modify_callback(request):
+        params = parse_resp_data(request.body)
+        submitted.append(params)
+        return (200, {}, json.dumps({
+            'status': {'code': '1'}, 'job_id': str(len(submitted))}))
+
+    def detail_callback(request):
+        params = submitted[int(parse_resp_data(request.body)['job_id']) - 1]
+        records = [{'record_id': record_id, 'value': params['change_to'],
+                    'status': 'ok'}
+                   for record_id in params['record_id'].split(',')]
+        return (200, {}, json.dumps({
+            'status': {'code': '1'}, 'detail': [{'records': records}]}))
+
+    responses.add_callback(
+        responses.POST, 'https://dnsapi.cn/Batch.Record.Modify',
+        callback=modify_callback)
+    responses.add_callback(
+        responses.POST, 'https://dnsapi.cn/Batch.Detail',
+        callback=detail_callback)
+
+    records = [(BASE_DOMAIN, SUB_DOMAIN, '1', 'v1'),
+               (BASE_DOMAIN, SUB_DOMAIN, '2', 'v2'),
+               (BASE_DOMAIN, SUB_DOMAIN, '3', 'v1')]
+    modified, failures = dnspod.batch_modify_txt_records(records)
+
+    assert [(p['record_id'], p['change'], p['change_to'])
+            for p in submitted] == [('1,3', 'value', 'v1'),
+                                    ('2', 'value', 'v2')]
+    assert sorted(record_id for _, record_id in modified) == ['1', '2', '3']
+    assert failures == []
+
+
+@responses.activate
+def test_batch_submit_error_fails_chunk(dnspod):
+    add_domain_list_response()
+    responses.add(
+        responses.POST, 'https://dnsapi.cn/Batch.Record.Create',
+        json={'status': {'code': '7', 'message': 'Job limit'}})
+
+    records = [(BASE_DOMAIN, '_acme-challenge.a', 'v1'),
+               (BASE_DOMAIN, '_acme-challenge.b', 'v2')]
+    created, failures = dnspod.batch_create_txt_records(records)
+
+    assert created == []
+    assert [record for record, _ in failures] == records
+    assert 'Job limit' in failures[0][1]
+
+
+def test_parse_api_time():
+    # China Standard Time, 8 hours ahead of UTC
+    assert parse_api_time('1970-01-01 08:01:00') == 60
+    assert parse_api_time('') is None
+    assert parse_api_time(None) is None
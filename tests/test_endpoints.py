@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import socket
+import time
+
+import pytest
+
+from certbot_dns_dnspod.dnspod_client import DNSPodClient
+from certbot_dns_dnspod.endpoints import EndpointSelector
+from certbot_dns_dnspod.fake_server import FakeDNSPodServer
+
+A = 'https://a.example.com/'
+B = 'https://b.example.com/'
+C = 'https://c.example.com/'
+
+API_TOKEN = '1234,abcdefg'
+
+
+def make_client(server, **kwargs):
+    kwargs.setdefault('base_url', server.base_url)
+    return DNSPodClient(API_TOKEN, 600, 'admin@example.com', **kwargs)
+
+
+@pytest.fixture
+def now(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('certbot_dns_dnspod.endpoints.time.time',
+                        lambda: clock[0])
+    return clock
+
+
+def test_single_endpoint():
+    selector = EndpointSelector(['https://dnsapi.cn'])
+
+    selector.failure('https://dnsapi.cn/')
+    assert selector.choose() == 'https://dnsapi.cn/'
+
+
+def test_fastest_endpoint(now):
+    selector = EndpointSelector([A, B, C])
+
+    # unmeasured endpoints are tried in order
+    assert selector.choose() == A
+    selector.success(A, 0.3)
+    assert selector.choose() == B
+    selector.success(B, 0.1)
+    selector.success(C, 0.2)
+    assert selector.choose() == B
+
+    # the average follows B slowing down
+    for _ in range(5):
+        selector.success(B, 1)
+    assert selector.choose() == C
+
+    # stale measurements are taken again
+    now[0] += 61
+    selector.success(C, 0.2)
+    assert selector.choose() == A
+
+
+def test_circuit_breaker(now):
+    selector = EndpointSelector([A, B], failure_threshold=2, cooldown=30)
+    selector.success(A, 0.1)
+    selector.success(B, 0.5)
+
+    # a failure moves the retry to the other endpoint
+    selector.failure(A)
+    assert selector.choose() == B
+    assert not selector.is_open(A)
+
+    selector.failure(A)
+    assert selector.is_open(A)
+    selector.failure(B)
+    selector.failure(B)
+    # all open, the one closing first is used
+    assert selector.choose() == A
+
+    now[0] += 31
+    assert not selector.is_open(A)
+    assert selector.choose() == A
+    selector.failure(A)
+    assert selector.is_open(A)
+
+    selector.success(B, 0.5)
+    assert selector.choose() == B
+
+
+def test_half_open_allows_one_trial(now):
+    selector = EndpointSelector([A, B], failure_threshold=1, cooldown=30)
+    selector.success(A, 0.1)
+    selector.success(B, 0.5)
+    selector.failure(A)
+
+    now[0] += 31
+    # the first request tries A again, the others keep using B meanwhile
+    assert selector.choose() == A
+    assert selector.choose() == B
+    assert selector.choose() == B
+
+    selector.success(A, 0.1)
+    assert selector.choose() == A
+    assert selector.choose() == A
+
+    # a trial never heard of is given up after cooldown
+    selector.failure(A)
+    now[0] += 31
+    assert selector.choose() == A
+    assert selector.choose() == B
+    now[0] += 31
+    assert selector.choose() == A
+
+
+def unreachable_url():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    url = 'http://127.0.0.1:{0}/'.format(sock.getsockname()[1])
+    sock.close()
+    return url
+
+
+@pytest.mark.usefixtures('no_retry_sleep')
+def test_failover_between_endpoints():
+    dead_url = unreachable_url()
+
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        client = make_client(server, base_url=[dead_url, server.base_url])
+        records = [('_acme-challenge.a{0}.example.com'.format(i), 'v')
+                   for i in range(5)]
+
+        with client:
+            client.add_txt_records(records)
+            # the dead endpoint failed once, calls went elsewhere since
+            assert client.endpoints.choose() == server.base_url
+            assert not client.endpoints.is_open(dead_url)
+
+            client.del_txt_records(records)
+
+        assert server.records('example.com') == []
+        assert server.calls['Record.Create'] == 5
+        assert server.calls['Record.Remove'] == 5
+
+
+def test_fastest_endpoint_is_preferred():
+    with FakeDNSPodServer(zones=['example.com'], latency=0.2) as slow, \
+            FakeDNSPodServer(zones=['example.com']) as fast:
+        with make_client(slow, base_url=[slow.base_url, fast.base_url],
+                         zone_cache_ttl=0, read_cache_ttl=0) as client:
+            for _ in range(4):
+                client.get_zones()
+
+        assert slow.calls['Domain.List'] == 1
+        assert fast.calls['Domain.List'] == 3
+
+
+def test_endpoint_recovers_after_cooldown():
+    with FakeDNSPodServer(zones=['example.com']) as primary, \
+            FakeDNSPodServer(zones=['example.com']) as backup:
+        with make_client(primary, base_url=[primary.base_url,
+                                            backup.base_url],
+                         read_cache_ttl=0) as client:
+            client.endpoints = EndpointSelector(
+                [primary.base_url, backup.base_url], failure_threshold=1,
+                cooldown=0.1)
+            client.endpoints.failure(primary.base_url)
+            assert client.endpoints.is_open(primary.base_url)
+            list(client.iter_records('example.com'))
+            assert sum(primary.calls.values()) == 0
+
+            time.sleep(0.2)
+            # the first request after cooldown is the trial
+            list(client.iter_records('example.com'))
+            assert primary.calls['Record.List'] == 1
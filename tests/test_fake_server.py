@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import pytest
+
+from certbot.errors import PluginError
+
+from certbot_dns_dnspod.dnspod_client import DNSPodClient
+from certbot_dns_dnspod.fake_server import FakeDNSPodServer
+
+
+API_TOKEN = '1234,abcdefg'
+TTL = 600
+CONTACT_EMAIL = 'admin@example.com'
+
+
+pytestmark = pytest.mark.usefixtures('no_retry_sleep')
+
+
+def make_client(server, **kwargs):
+    return DNSPodClient(API_TOKEN, TTL, CONTACT_EMAIL,
+                        base_url=server.base_url, **kwargs)
+
+
+def test_add_and_del_txt_records():
+    with FakeDNSPodServer(zones=['example.com', 'example.org'],
+                          api_token=API_TOKEN) as server:
+        server.add_record('example.com', '_acme-challenge', 'old')
+
+        with make_client(server, max_concurrency=4) as client:
+            client.add_txt_records([
+                ('_acme-challenge.example.com', 'v1'),
+                ('_acme-challenge.example.com', 'v2'),
+                ('_acme-challenge.www.example.org', 'v3'),
+            ])
+
+            assert sorted(r['value'] for r
+                          in server.records('example.com')) == \
+                ['old', 'v1', 'v2']
+            assert [(r['name'], r['value']) for r
+                    in server.records('example.org')] == \
+                [('_acme-challenge.www', 'v3')]
+
+            client.del_txt_records([
+                ('_acme-challenge.example.com', 'v1'),
+                ('_acme-challenge.example.com', 'v2'),
+                ('_acme-challenge.www.example.org', 'v3'),
+            ])
+
+        assert [r['value'] for r in server.records('example.com')] == ['old']
+        assert server.records('example.org') == []
+        assert server.calls == {
+            'Domain.List': 1, 'Record.List': 4, 'Record.Create': 3,
+            'Record.Remove': 3}
+
+
+def test_modify_txt_record():
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        record_id = server.add_record('example.com', '_acme-challenge', 'old')
+
+        with make_client(server) as client:
+            client._modify_txt_record(record_id,
+                                      '_acme-challenge.example.com', 'new')
+
+        assert [r['value'] for r in server.records('example.com')] == ['new']
+
+
+def test_invalid_token():
+    with FakeDNSPodServer(zones=['example.com'], api_token='other') as server:
+        with make_client(server) as client:
+            with pytest.raises(PluginError, match='err_code: -1'):
+                client.add_txt_record('_acme-challenge.example.com', 'v1')
+
+
+def test_errors_are_retried():
+    with FakeDNSPodServer(zones=['example.com'], error_rate=0.5,
+                          seed=1) as server:
+        server.add_record('example.com', '_acme-challenge', 'v')
+
+        with make_client(server, max_retries=20,
+                         read_cache_ttl=0) as client:
+            for _ in range(10):
+                assert [r.value for r
+                        in client.iter_records('example.com')] == ['v']
+
+        assert server.calls['Record.List'] > 12
+
+
+def test_writes_are_not_retried_after_lost_response():
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        with make_client(server, max_retries=2) as client:
+            client.get_zones()
+            server.lost_response_rate = 1
+            with pytest.raises(PluginError, match='status_code: 502'):
+                client._create_txt_record('_acme-challenge.example.com',
+                                          'v1')
+
+        # the create was applied once, sending it again would duplicate it
+        assert server.calls['Record.Create'] == 1
+        assert [r['value'] for r in server.records('example.com')] == ['v1']
+
+
+def test_error_rate_exhausts_retries():
+    with FakeDNSPodServer(zones=['example.com'], error_rate=1) as server:
+        with make_client(server, max_retries=2) as client:
+            with pytest.raises(PluginError, match='status_code: 502'):
+                client.add_txt_record('_acme-challenge.example.com', 'v1')
+
+        assert server.calls['Domain.List'] == 3
+
+
+def test_rate_limit():
+    with FakeDNSPodServer(zones=['example.com'], rate_limit=2) as server:
+        with make_client(server, max_retries=0, max_concurrency=8) as client:
+            with pytest.raises(PluginError, match='rate limited'):
+                client.add_txt_records([
+                    ('_acme-challenge.a{0}.example.com'.format(i), 'v')
+                    for i in range(8)])
+
+
+def test_latency_overlaps_concurrent_calls():
+    with FakeDNSPodServer(zones=['example.com'], latency=0.1) as server:
+        with make_client(server, max_concurrency=10) as client:
+            client._get_zone_index()
+
+            started_at = time.time()
+            client.add_txt_records([
+                ('_acme-challenge.a{0}.example.com'.format(i), 'v')
+                for i in range(10)])
+            elapsed = time.time() - started_at
+
+        assert server.calls['Record.Create'] == 10
+        # one listing and one round of parallel creates
+        assert elapsed < 0.6
+
+
+def test_large_zone_is_listed_by_pages():
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        for i in range(1200):
+            server.add_record('example.com', 'host{0}'.format(i), 'v')
+        for i in range(3):
+            server.add_record('example.com',
+                              '_acme-challenge.www{0}'.format(i), 'old')
+
+        with make_client(server) as client:
+            assert sum(1 for _ in client.iter_records(
+                'example.com', page_size=500)) == 1203
+            assert server.calls['Record.List'] == 3
+
+            record_ids = client._list_txt_records(
+                'example.com', ['_acme-challenge.www0',
+                                '_acme-challenge.www1'])
+
+        assert sorted(record_ids) == ['_acme-challenge.www0',
+                                      '_acme-challenge.www1']
+        # the keyword narrows the listing to the challenge records
+        assert server.calls['Record.List'] == 4
+
+
+def test_batch_add_txt_records():
+    with FakeDNSPodServer(zones=['example.com', 'example.org'],
+                          api_token=API_TOKEN) as server:
+        with make_client(server, batch=True) as client:
+            client.add_txt_records([
+                ('_acme-challenge.a{0}.example.com'.format(i), 'v')
+                for i in range(5)] + [('_acme-challenge.example.org', 'v')])
+
+        assert len(server.records('example.com')) == 5
+        assert len(server.records('example.org')) == 1
+        assert server.calls['Record.Create'] == 0
+        assert server.calls['Batch.Record.Create'] == 2
+        # running on the first poll, finished on the second
+        assert server.calls['Batch.Detail'] == 4
+
+
+def test_batch_add_txt_records_rolls_back_on_failure():
+    with FakeDNSPodServer(zones=['example.com'],
+                          rejected_values=['bad']) as server:
+        with make_client(server, batch=True) as client:
+            with pytest.raises(PluginError, match='failed for 1 of 3'):
+                client.add_txt_records([
+                    ('_acme-challenge.a.example.com', 'v1'),
+                    ('_acme-challenge.b.example.com', 'bad'),
+                    ('_acme-challenge.c.example.com', 'v3'),
+                ])
+
+        assert server.records('example.com') == []
+
+
+def test_batch_modify_txt_records():
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        ids = [server.add_record('example.com', '_acme-challenge', 'old')
+               for _ in range(3)]
+
+        records = [('example.com', '_acme-challenge', record_id, 'new')
+                   for record_id in ids + ['999']]
+        with make_client(server) as client:
+            modified, failures = client.batch_modify_txt_records(records)
+
+        assert len(modified) == 3
+        assert [error for _, error in failures] == ['Record id invalid']
+        assert [r['value'] for r in server.records('example.com')] == \
+            ['new'] * 3
+        assert server.calls['Batch.Record.Modify'] == 1
+
+
+def test_reconcile():
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        server.add_record('example.com', '_acme-challenge', 'keep')
+        server.add_record('example.com', '_acme-challenge', 'stale1')
+        server.add_record('example.com', '_acme-challenge.www', 'stale2')
+        server.add_record('example.com', '_acme-challenge.www', 'stale3')
+        records = [('_acme-challenge.example.com', 'keep'),
+                   ('_acme-challenge.example.com', 'new1'),
+                   ('_acme-challenge.example.com', 'new2'),
+                   ('_acme-challenge.www.example.com', 'new3')]
+
+        with make_client(server) as client:
+            plan = client.reconcile(records, dry_run=True)
+            assert plan.cost() == {'Record.List': 1, 'Record.Create': 1,
+                                   'Record.Modify': 2, 'Record.Remove': 1}
+            assert server.calls == {'Domain.List': 1, 'Record.List': 1}
+
+            client.reconcile(records)
+
+        assert sorted((r['name'], r['value'])
+                      for r in server.records('example.com')) == [
+            ('_acme-challenge', 'keep'), ('_acme-challenge', 'new1'),
+            ('_acme-challenge', 'new2'), ('_acme-challenge.www', 'new3')]
+        # the listing of the dry run is still cached
+        assert server.calls == {'Domain.List': 1, 'Record.List': 1,
+                                'Record.Create': 1, 'Record.Modify': 2,
+                                'Record.Remove': 1}
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+import pytest
+
+from certbot_dns_dnspod import gc
+from certbot_dns_dnspod.fake_server import FakeDNSPodServer
+from certbot_dns_dnspod.journal import RecordJournal
+from certbot_dns_dnspod.pool import PARKED_VALUE
+from certbot_dns_dnspod.pool import RecordPool
+
+
+pytestmark = pytest.mark.usefixtures('no_retry_sleep')
+
+
+@pytest.fixture
+def server():
+    with FakeDNSPodServer(zones=['example.com', 'example.org'],
+                          api_token='1234,abcdefg') as server:
+        yield server
+
+
+@pytest.fixture
+def credentials(tmpdir, server):
+    path = str(tmpdir.join('dnspod.ini'))
+    with open(path, 'w') as f:
+        f.write('certbot_dns_dnspod:dns_dnspod_api_token = "1234,abcdefg"\n'
+                'certbot_dns_dnspod:dns_dnspod_dns_ttl = 600\n'
+                'certbot_dns_dnspod:dns_dnspod_contact_email = '
+                'admin@example.com\n'
+                'certbot_dns_dnspod:dns_dnspod_api_url = {0}\n'.format(
+                    server.base_url))
+    os.chmod(path, 0o600)
+    return path
+
+
+@pytest.fixture
+def work_dir(tmpdir):
+    os.mkdir(str(tmpdir.join('dns-dnspod')))
+    return str(tmpdir)
+
+
+def test_load_credentials(tmpdir, credentials):
+    assert gc.load_credentials(credentials).conf('dns_ttl') == '600'
+
+    path = str(tmpdir.join('tencentcloud.ini'))
+    with open(path, 'w') as f:
+        f.write('dns_dnspod_backend = tencentcloud\n'
+                'dns_dnspod_dns_ttl = 600\n'
+                'dns_dnspod_contact_email = admin@example.com\n')
+    os.chmod(path, 0o600)
+
+    with pytest.raises(gc.errors.PluginError, match='dns_dnspod_secret_id'):
+        gc.load_credentials(path)
+
+
+def test_collect_stale_records(server, credentials, work_dir, capsys):
+    state_dir = os.path.join(work_dir, 'dns-dnspod')
+    journal = RecordJournal(os.path.join(state_dir, 'journal.json'))
+    pool = RecordPool(os.path.join(state_dir, 'pool.json'))
+
+    server.add_record('example.com', 'www', 'not a challenge')
+    orphan = server.add_record('example.com', '_acme-challenge', 'orphan',
+                               updated_on=time.time() - 7200)
+    # unjournaled but recent, e.g. a validation of another host
+    server.add_record('example.org', '_acme-challenge.api', 'other host')
+    in_flight = server.add_record('example.com', '_acme-challenge.www',
+                                  'in-flight')
+    journal.add('_acme-challenge.www.example.com', 'in-flight', in_flight,
+                'example.com')
+    parked = server.add_record('example.org', '_acme-challenge',
+                               PARKED_VALUE)
+    pool.park('_acme-challenge.example.org', parked, 'example.org')
+
+    assert gc.main(['--credentials', credentials, '--work-dir', work_dir,
+                    '--dry-run']) == 0
+    assert len(server.records('example.com')) == 3
+    assert server.calls['Record.Remove'] == 0
+
+    out = capsys.readouterr().out
+    assert '_acme-challenge.example.com "orphan" (record {0}, ' \
+        'unjournaled)'.format(orphan) in out
+    assert 'DNSPod GC: 2 zones scanned, 1 stale records found ' \
+        '(1 unjournaled), 0 removed, 0 failed' in out
+
+    assert gc.main(['--credentials', credentials, '--work-dir', work_dir,
+                    '--older-than', '-1']) == 0
+    assert [r['value'] for r in server.records('example.com')] == \
+        ['not a challenge']
+    assert [r['value'] for r in server.records('example.org')] == \
+        [PARKED_VALUE]
+    assert len(RecordJournal(journal.path)) == 0
+    assert 'DNSPod GC: 2 zones scanned, 3 stale records found ' \
+        '(1 expired, 2 unjournaled), 3 removed, 0 failed' in \
+        capsys.readouterr().out
+
+
+def test_recent_records_kept_without_journal(server, credentials, tmpdir,
+                                             capsys):
+    # no state dir, so nothing is journaled
+    server.add_record('example.com', '_acme-challenge', 'in flight')
+    old = server.add_record('example.com', '_acme-challenge', 'orphan',
+                            updated_on=time.time() - 7200)
+
+    assert gc.main(['--credentials', credentials,
+                    '--work-dir', str(tmpdir)]) == 0
+    assert [r['value'] for r in server.records('example.com')] == \
+        ['in flight']
+    assert 'record {0}, unjournaled'.format(old) in capsys.readouterr().out
+
+
+def test_failures_exit_with_1(server, credentials, work_dir, capsys):
+    server.add_record('example.com', '_acme-challenge', 'orphan')
+    server.error_rate = 1
+
+    assert gc.main(['--credentials', credentials, '--work-dir', work_dir,
+                    '--max-concurrency', '1']) == 1
+    assert 'status_code: 502' in capsys.readouterr().err
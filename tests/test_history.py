@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from certbot_dns_dnspod import history
+from certbot_dns_dnspod.history import PropagationHistory
+
+
+@pytest.fixture
+def history_path(tmpdir):
+    return str(tmpdir.join('propagation.json'))
+
+
+def test_percentile(history_path):
+    store = PropagationHistory(history_path)
+
+    for seconds in (0.5, 4, 4, 9, 25):
+        store.observe('Example.com.', seconds)
+    store.observe('example.org', 1)
+
+    store = PropagationHistory(history_path)
+    assert store.percentile('example.com', 50) == 5
+    assert store.percentile('example.com', 95) == 30
+    assert store.percentile('example.com', 10) == 1
+    # too few observations to trust
+    assert store.percentile('example.org', 95) is None
+    assert store.percentile('example.net', 95) is None
+
+
+def test_percentile_slower_than_buckets(history_path):
+    store = PropagationHistory(history_path)
+
+    for _ in range(history.MIN_SAMPLES):
+        store.observe('example.com', 3600)
+
+    assert store.percentile('example.com', 50) is None
+
+
+def test_old_observations_fade(history_path):
+    store = PropagationHistory(history_path)
+
+    for _ in range(history.MAX_SAMPLES):
+        store.observe('example.com', 60)
+    for _ in range(history.MAX_SAMPLES):
+        store.observe('example.com', 2)
+
+    assert store.percentile('example.com', 50) == 2
+    assert sum(store.entries()[0]['counts']) <= history.MAX_SAMPLES
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import pytest
+
+from certbot_dns_dnspod.dnspod_client import DNSPodClient
+from certbot_dns_dnspod.fake_server import FakeDNSPodServer
+from certbot_dns_dnspod.journal import RecordJournal
+
+
+API_TOKEN = '1234,abcdefg'
+
+
+def make_client(server, **kwargs):
+    return DNSPodClient(API_TOKEN, 600, 'admin@example.com',
+                        base_url=server.base_url, **kwargs)
+
+
+@pytest.fixture
+def journal_path(tmpdir):
+    return str(tmpdir.join('journal.json'))
+
+
+def test_add_get_remove(journal_path):
+    journal = RecordJournal(journal_path)
+
+    journal.add('_acme-challenge.example.com', 'v1', '123', 'example.com')
+    entry = journal.get('_acme-challenge.Example.com.', 'v1')
+    assert entry['record_id'] == '123'
+    assert entry['zone'] == 'example.com'
+    assert journal.get('_acme-challenge.example.com', 'v2') is None
+    assert len(journal) == 1
+
+    journal.remove('_acme-challenge.example.com', 'v1')
+    assert journal.get('_acme-challenge.example.com', 'v1') is None
+    assert len(journal) == 0
+
+    with open(journal_path) as f:
+        assert json.load(f) == []
+
+
+def test_persisted_across_instances(journal_path):
+    RecordJournal(journal_path).add(
+        '_acme-challenge.example.com', 'v1', '123', 'example.com')
+    other = RecordJournal(journal_path)
+    other.add('_acme-challenge.example.net', 'v2', '456', 'example.net')
+
+    journal = RecordJournal(journal_path)
+    assert len(journal) == 2
+    assert journal.get('_acme-challenge.example.com', 'v1')['record_id'] \
+        == '123'
+
+
+def test_entries_older_than(journal_path, monkeypatch):
+    journal = RecordJournal(journal_path)
+    monkeypatch.setattr('certbot_dns_dnspod.journal.time.time',
+                        lambda: 1000.0)
+    journal.add('_acme-challenge.example.com', 'v1', '1', 'example.com')
+    monkeypatch.setattr('certbot_dns_dnspod.journal.time.time',
+                        lambda: 2000.0)
+    journal.add('_acme-challenge.example.com', 'v2', '2', 'example.com')
+
+    assert len(journal.entries()) == 2
+    assert [e['record_id'] for e in journal.entries(older_than=500)] == ['1']
+
+
+def test_in_memory_journal():
+    journal = RecordJournal()
+    journal.add('_acme-challenge.example.com', 'v1', '1', 'example.com')
+
+    assert journal.get('_acme-challenge.example.com', 'v1')['record_id'] \
+        == '1'
+
+
+def test_corrupted_journal_ignored(journal_path):
+    with open(journal_path, 'w') as f:
+        f.write('{not json')
+
+    journal = RecordJournal(journal_path)
+    assert len(journal) == 0
+
+    journal.add('_acme-challenge.example.com', 'v1', '1', 'example.com')
+    assert os.path.exists(journal_path)
+    assert len(RecordJournal(journal_path)) == 1
+
+
+def test_journaled_record_removed_by_hand_is_forgotten(tmpdir):
+    journal = RecordJournal(str(tmpdir.join('journal.json')))
+    journal.add('_acme-challenge.example.com', 'v1', '999', 'example.com')
+
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        with make_client(server, journal=journal) as client:
+            client.del_journaled_records()
+            client.del_journaled_records()
+
+        assert len(journal) == 0
+        assert server.calls == {'Record.Remove': 1}
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from certbot_dns_dnspod.metrics import JSONLinesSink
+from certbot_dns_dnspod.metrics import Metrics
+from certbot_dns_dnspod.metrics import MetricsSink
+from certbot_dns_dnspod.metrics import PrometheusTextfileSink
+
+
+def test_counters_and_histograms():
+    metrics = Metrics(buckets=(0.1, 1))
+
+    metrics.inc('requests', {'action': 'Record.List', 'code': '1'})
+    metrics.inc('requests', {'code': '1', 'action': 'Record.List'}, 2)
+    metrics.observe('seconds', {'action': 'Record.List'}, 0.05)
+    metrics.observe('seconds', {'action': 'Record.List'}, 0.5)
+    metrics.observe('seconds', {'action': 'Record.List'}, 5)
+
+    assert metrics.get_counter('requests', action='Record.List',
+                               code='1') == 3
+    assert metrics.get_counter('requests', action='Record.Create') == 0
+    assert metrics.get_histogram('seconds', action='Record.List') == {
+        'buckets': [1, 2], 'sum': 5.55, 'count': 3}
+    assert metrics.get_histogram('seconds', action='Record.Create') is None
+
+
+def test_render_prometheus():
+    metrics = Metrics(buckets=(0.5, 1))
+
+    metrics.observe_request('Record.List', '1', 100, 2000)
+    metrics.observe_call('Record.List', 0.25, 2)
+
+    lines = metrics.render_prometheus().splitlines()
+
+    assert '# TYPE dnspod_api_requests_total counter' in lines
+    assert 'dnspod_api_requests_total{action="Record.List",code="1"} 1' \
+        in lines
+    assert 'dnspod_api_sent_bytes_total{action="Record.List"} 100' in lines
+    assert 'dnspod_api_received_bytes_total{action="Record.List"} 2000' \
+        in lines
+    assert 'dnspod_api_retries_total{action="Record.List"} 1' in lines
+    assert '# TYPE dnspod_api_call_seconds histogram' in lines
+    assert 'dnspod_api_call_seconds_bucket{action="Record.List",le="0.5"} 1' \
+        in lines
+    assert 'dnspod_api_call_seconds_bucket{action="Record.List",le="+Inf"} 1' \
+        in lines
+    assert 'dnspod_api_call_seconds_sum{action="Record.List"} 0.25' in lines
+    assert 'dnspod_api_call_seconds_count{action="Record.List"} 1' in lines
+
+
+def test_label_values_escaped():
+    metrics = Metrics()
+
+    metrics.inc('dnspod_api_requests_total', {'code': 'a"b\\c\nd'})
+
+    assert 'dnspod_api_requests_total{code="a\\"b\\\\c\\nd"} 1' in \
+        metrics.render_prometheus().splitlines()
+
+
+def test_prometheus_textfile_sink(tmpdir):
+    path = str(tmpdir.join('dnspod.prom'))
+    metrics = Metrics([PrometheusTextfileSink(path)])
+
+    with metrics.phase('perform'):
+        pass
+    metrics.flush()
+
+    with open(path) as f:
+        assert 'dnspod_phase_seconds_count{phase="perform"} 1\n' in f.read()
+    assert not tmpdir.join('dnspod.prom.tmp').exists()
+
+
+def test_json_lines_sink(tmpdir):
+    path = str(tmpdir.join('dnspod.jsonl'))
+    metrics = Metrics([JSONLinesSink(path)])
+
+    metrics.observe_request('Record.Create', '-2', 10, 20)
+    metrics.observe_call('Record.Create', 1.5, 3)
+    metrics.flush()
+    metrics.observe_phase('cleanup', 0.5)
+    metrics.flush()
+
+    with open(path) as f:
+        events = [json.loads(line) for line in f]
+
+    assert [event['type'] for event in events] == ['request', 'call',
+                                                   'phase']
+    assert events[0]['code'] == '-2'
+    assert events[1]['retries'] == 2
+    assert events[2]['phase'] == 'cleanup'
+    assert all('time' in event for event in events)
+
+
+def test_sink_errors_are_not_raised(tmpdir):
+    class FailingSink(MetricsSink):
+        def flush(self, metrics):
+            raise IOError('disk full')
+
+    path = str(tmpdir.join('dnspod.prom'))
+    metrics = Metrics([FailingSink(), PrometheusTextfileSink(path)])
+
+    metrics.flush()
+
+    assert tmpdir.join('dnspod.prom').exists()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from certbot_dns_dnspod.dnspod_client import DNSPodClient
+from certbot_dns_dnspod.fake_server import FakeDNSPodServer
+from certbot_dns_dnspod.journal import RecordJournal
+from certbot_dns_dnspod.pool import PARKED_VALUE
+from certbot_dns_dnspod.pool import RecordPool
+
+
+API_TOKEN = '1234,abcdefg'
+
+
+def make_client(server, **kwargs):
+    return DNSPodClient(API_TOKEN, 600, 'admin@example.com',
+                        base_url=server.base_url, **kwargs)
+
+
+@pytest.fixture
+def pool_path(tmpdir):
+    return str(tmpdir.join('pool.json'))
+
+
+def test_park_and_take(pool_path):
+    pool = RecordPool(pool_path)
+
+    pool.park('_acme-challenge.Example.com.', '1', 'example.com')
+    pool.park('_acme-challenge.example.com', '2', 'example.com')
+    pool.park('_acme-challenge.www.example.com', '3', 'example.com')
+    assert len(pool) == 3
+
+    entry = pool.take('_acme-challenge.example.com')
+    assert entry['record_id'] == '1'
+    assert entry['zone'] == 'example.com'
+    assert entry['value'] == PARKED_VALUE
+    assert pool.take('_acme-challenge.example.com')['record_id'] == '2'
+    assert pool.take('_acme-challenge.example.com') is None
+    assert len(pool) == 1
+
+
+def test_persisted_across_instances(pool_path):
+    RecordPool(pool_path).park('_acme-challenge.example.com', '1',
+                               'example.com')
+    RecordPool(pool_path).park('_acme-challenge.example.net', '2',
+                               'example.net')
+
+    pool = RecordPool(pool_path)
+    assert sorted(e['record_id'] for e in pool.entries()) == ['1', '2']
+
+    pool.discard('1')
+    assert [e['record_id'] for e in RecordPool(pool_path).entries()] == \
+        ['2']
+
+
+def test_parked_records_are_reused(tmpdir):
+    records = [('_acme-challenge.example.com', 'v1'),
+               ('_acme-challenge.example.com', 'v2')]
+
+    def make_pooled_client(server):
+        return make_client(
+            server, journal=RecordJournal(str(tmpdir.join('journal.json'))),
+            pool=RecordPool(str(tmpdir.join('pool.json'))))
+
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        with make_pooled_client(server) as client:
+            client.add_txt_records(records)
+            client.del_txt_records(records)
+            client.del_journaled_records()
+
+        assert [r['value'] for r in server.records('example.com')] == \
+            [PARKED_VALUE, PARKED_VALUE]
+        server.calls.clear()
+
+        # the next run takes the parked records without listing
+        renewed = [('_acme-challenge.example.com', 'v3'),
+                   ('_acme-challenge.example.com', 'v4')]
+        with make_pooled_client(server) as client:
+            client.add_txt_records(renewed)
+
+        assert server.calls == {'Record.Modify': 2}
+        assert sorted(r['value'] for r in server.records('example.com')) == \
+            ['v3', 'v4']
+
+
+def test_missing_parked_record_is_created(tmpdir):
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        pool = RecordPool(str(tmpdir.join('pool.json')))
+        pool.park('_acme-challenge.example.com', '999', 'example.com')
+
+        with make_client(server, pool=pool) as client:
+            client.add_txt_records([('_acme-challenge.example.com', 'v1')])
+
+        assert [r['value'] for r in server.records('example.com')] == ['v1']
+        assert len(pool) == 0
+
+
+def test_record_removed_by_hand_is_not_parked(tmpdir):
+    journal = RecordJournal(str(tmpdir.join('journal.json')))
+    journal.add('_acme-challenge.example.com', 'v1', '999', 'example.com')
+    pool = RecordPool(str(tmpdir.join('pool.json')))
+
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        with make_client(server, journal=journal, pool=pool) as client:
+            client.del_journaled_records()
+
+        assert len(journal) == 0
+        assert len(pool) == 0
+        assert server.calls == {'Record.Modify': 1}
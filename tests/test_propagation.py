@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import socket
+import threading
+import time
+
+import dns.message
+import dns.rdatatype
+import dns.rrset
+import pytest
+
+from certbot.errors import PluginError
+
+from certbot_dns_dnspod.propagation import PropagationChecker
+from certbot_dns_dnspod.propagation import parse_nameservers
+
+
+NAME = '_acme-challenge.example.com'
+
+
+class FakeNameserver(object):
+    """UDP DNS server answering TXT queries from a dict"""
+
+    def __init__(self):
+        self.records = {}
+        self.queries = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.1)
+        self.address = self.sock.getsockname()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _serve(self):
+        while not self._stopped:
+            try:
+                data, peer = self.sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            self.queries += 1
+            query = dns.message.from_wire(data)
+            response = dns.message.make_response(query)
+            name = query.question[0].name.to_text().rstrip('.')
+            values = self.records.get(name)
+            if values:
+                response.answer.append(dns.rrset.from_text_list(
+                    name + '.', 60, 'IN', 'TXT',
+                    ['"{0}"'.format(v) for v in values]))
+            self.sock.sendto(response.to_wire(), peer)
+
+    def stop(self):
+        self._stopped = True
+        self._thread.join()
+        self.sock.close()
+
+
+@pytest.fixture
+def nameserver():
+    server = FakeNameserver()
+    yield server
+    server.stop()
+
+
+def test_parse_nameservers():
+    assert parse_nameservers('1.2.3.4, 127.0.0.1:5353,[::1]:53,') == [
+        ('1.2.3.4', 53), ('127.0.0.1', 5353), ('::1', 53)]
+
+    with pytest.raises(PluginError):
+        parse_nameservers('127.0.0.1:port')
+
+
+def test_wait_visible(nameserver):
+    nameserver.records[NAME] = ['v1', 'v2']
+    checker = PropagationChecker([nameserver.address], query_timeout=1)
+
+    assert checker.wait([(NAME, 'v1', 'example.com'),
+                         (NAME + '.', 'v2', 'example.com')], 5)
+    assert nameserver.queries == 1
+
+
+def test_wait_until_visible(nameserver):
+    checker = PropagationChecker([nameserver.address], query_timeout=1,
+                                 min_interval=0.05, max_interval=0.1)
+
+    def publish():
+        time.sleep(0.2)
+        nameserver.records[NAME] = ['v1']
+
+    thread = threading.Thread(target=publish)
+    thread.start()
+    start = time.time()
+    assert checker.wait([(NAME, 'v1', 'example.com')], 5)
+    thread.join()
+
+    assert time.time() - start < 2
+    assert nameserver.queries > 1
+
+
+def test_wait_deadline(nameserver):
+    nameserver.records[NAME] = ['other']
+    checker = PropagationChecker([nameserver.address], query_timeout=1,
+                                 min_interval=0.05, max_interval=0.05)
+
+    start = time.time()
+    assert not checker.wait([(NAME, 'v1', 'example.com')], 0.3)
+    assert time.time() - start < 2
+
+
+def test_nameserver_not_found(monkeypatch):
+    import dns.resolver
+
+    def resolve(name, rdtype):
+        raise dns.resolver.NXDOMAIN()
+
+    monkeypatch.setattr('certbot_dns_dnspod.propagation._resolve', resolve)
+    checker = PropagationChecker()
+
+    with pytest.raises(PluginError, match='Unable to find nameservers'):
+        checker.wait([(NAME, 'v1', 'example.com')], 1)
+
+
+def test_wait_records_visible_at(nameserver):
+    nameserver.records[NAME] = ['v1']
+    checker = PropagationChecker([nameserver.address], query_timeout=1,
+                                 min_interval=0.05, max_interval=0.05)
+
+    start = time.time()
+    assert not checker.wait([(NAME, 'v1', 'example.com'),
+                             ('_acme-challenge.example.org', 'v2',
+                              'example.org')], 0.2)
+    assert list(checker.visible_at) == ['example.com']
+    assert start <= checker.visible_at['example.com'] <= time.time()
+    assert checker.visible_on_first_round == {'example.com'}
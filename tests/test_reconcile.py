@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+from certbot_dns_dnspod.reconcile import ReconcilePlan
+
+
+def names(*entries):
+    return OrderedDict(
+        (sub_domain, (sub_domain + '.example.com', list(values)))
+        for sub_domain, values in entries)
+
+
+def test_plan_reuses_stale_records():
+    plan = ReconcilePlan()
+    plan.add_zone(
+        names(('_acme-challenge', ['keep', 'new1', 'new2']),
+              ('_acme-challenge.www', ['new3']),
+              ('_acme-challenge.api', ['new4'])),
+        {'_acme-challenge': {'keep': '1', 'stale': '2'},
+         '_acme-challenge.www': {'stale1': '3', 'stale2': '4'},
+         '_acme-challenge.other': {'stale': '5'}})
+
+    assert plan.noops == [('_acme-challenge.example.com', 'keep', '1')]
+    assert plan.modifies == [
+        ('_acme-challenge.example.com', 'new1', '2', 'stale'),
+        ('_acme-challenge.www.example.com', 'new3', '3', 'stale1')]
+    assert plan.creates == [
+        ('_acme-challenge.example.com', 'new2'),
+        ('_acme-challenge.api.example.com', 'new4')]
+    # names not desired are left alone
+    assert plan.removes == [
+        ('_acme-challenge.www.example.com', 'stale2', '4')]
+    assert plan.changes == 5
+
+
+def test_plan_without_changes():
+    plan = ReconcilePlan()
+    plan.add_zone(names(('_acme-challenge', ['v'])),
+                  {'_acme-challenge': {'v': '1'}})
+    plan.lists += 1
+
+    assert plan.changes == 0
+    assert plan.cost() == OrderedDict([
+        ('Record.List', 1), ('Record.Create', 0), ('Record.Modify', 0),
+        ('Record.Remove', 0)])
+
+
+def test_format():
+    plan = ReconcilePlan()
+    plan.add_zone(names(('_acme-challenge', ['a', 'b'])),
+                  {'_acme-challenge': {'old': '7', 'a': '8'}})
+    plan.lists += 1
+
+    assert plan.format().split('\n') == [
+        'DNSPod plan: 0 to create, 1 to modify, 0 to remove, 1 unchanged',
+        '  modify _acme-challenge.example.com "old" -> "b" (record 7)',
+        '  keep   _acme-challenge.example.com "a" (record 8)',
+        'API calls: Record.List=1, Record.Create=0, Record.Modify=1, '
+        'Record.Remove=0, 2 in total',
+    ]
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from certbot.errors import PluginError
+
+from certbot_dns_dnspod.scheduler import RequestScheduler
+from certbot_dns_dnspod.scheduler import RetryableError
+from certbot_dns_dnspod.scheduler import TokenBucket
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr('certbot_dns_dnspod.scheduler.time', clock)
+    return clock
+
+
+def flaky(failures, error=RetryableError('transient')):
+    calls = []
+
+    def send():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error
+        return 'ok'
+
+    send.calls = calls
+    return send
+
+
+def test_token_bucket_limits_rate(clock):
+    bucket = TokenBucket(rate=2)
+
+    for _ in range(6):
+        bucket.acquire()
+
+    # 2 tokens of burst, then one token every 0.5 second
+    assert clock.now == pytest.approx(1002.0)
+
+
+def test_retry_until_success(clock):
+    scheduler = RequestScheduler(max_retries=3)
+    send = flaky(2)
+
+    assert scheduler.run(send) == 'ok'
+    assert len(send.calls) == 3
+    assert len(clock.sleeps) == 2
+    assert clock.sleeps[0] <= scheduler.base_delay
+    assert clock.sleeps[1] <= scheduler.base_delay * 2
+
+
+def test_retries_exhausted(clock):
+    scheduler = RequestScheduler(max_retries=2)
+    send = flaky(5)
+
+    with pytest.raises(RetryableError):
+        scheduler.run(send)
+    assert len(send.calls) == 3
+
+
+def test_time_budget(clock, monkeypatch):
+    monkeypatch.setattr('certbot_dns_dnspod.scheduler.random.uniform',
+                        lambda low, high: high)
+    scheduler = RequestScheduler(max_retries=10, time_budget=3,
+                                 base_delay=1)
+    send = flaky(10)
+
+    with pytest.raises(RetryableError):
+        scheduler.run(send)
+    # waits 1 + 2 seconds, the next 4 seconds backoff exceeds the budget
+    assert clock.sleeps == [1, 2]
+    assert len(send.calls) == 3
+
+
+def test_not_retryable(clock):
+    scheduler = RequestScheduler()
+    send = flaky(1, PluginError('fatal'))
+
+    with pytest.raises(PluginError, match='fatal'):
+        scheduler.run(send)
+    assert len(send.calls) == 1
+
+
+def test_rate_limited_run(clock):
+    scheduler = RequestScheduler(rate_limit=1)
+
+    for _ in range(3):
+        scheduler.run(lambda: None)
+
+    assert clock.now == pytest.approx(1002.0)
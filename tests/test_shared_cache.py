@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import pytest
+
+from certbot_dns_dnspod.dnspod_client import DNSPodClient
+from certbot_dns_dnspod.fake_server import FakeDNSPodServer
+from certbot_dns_dnspod.shared_cache import SharedCache
+from certbot_dns_dnspod.shared_cache import account_key
+
+
+API_TOKEN = '1234,abcdefg'
+
+
+def make_client(server, **kwargs):
+    return DNSPodClient(API_TOKEN, 600, 'admin@example.com',
+                        base_url=server.base_url, **kwargs)
+
+
+@pytest.fixture
+def cache_path(tmpdir):
+    return str(tmpdir.join('cache.sqlite'))
+
+
+def test_account_key():
+    assert account_key('1234,abcdefg') == account_key('1234,abcdefg')
+    assert account_key('1234,abcdefg') != account_key('1234,other')
+    assert 'abcdefg' not in account_key('1234,abcdefg')
+
+
+def test_zones_shared_between_instances(cache_path, monkeypatch):
+    cache = SharedCache(cache_path, 'account')
+    assert cache.get_zones() is None
+
+    cache.set_zones({'example.com': '1', 'example.org': '2'}, ttl=60)
+    assert SharedCache(cache_path, 'account').get_zones() == \
+        {'example.com': '1', 'example.org': '2'}
+    assert SharedCache(cache_path, 'other').get_zones() is None
+
+    now = time.time()
+    monkeypatch.setattr('certbot_dns_dnspod.shared_cache.time.time',
+                        lambda: now + 61)
+    assert cache.get_zones() is None
+
+
+def test_records(cache_path):
+    cache = SharedCache(cache_path, 'account')
+
+    cache.add_record('_acme-challenge.Example.com.', 'v1', '10',
+                     'example.com')
+    assert SharedCache(cache_path, 'account').get_record(
+        '_acme-challenge.example.com', 'v1') == \
+        {'record_id': '10', 'zone': 'example.com'}
+    assert cache.get_record('_acme-challenge.example.com', 'v2') is None
+    assert SharedCache(cache_path, 'other').get_record(
+        '_acme-challenge.example.com', 'v1') is None
+
+    cache.remove_record('_acme-challenge.example.com', 'v1')
+    assert cache.get_record('_acme-challenge.example.com', 'v1') is None
+
+
+def test_token_bucket_shared_between_instances(cache_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('certbot_dns_dnspod.shared_cache.time.time',
+                        lambda: now[0])
+
+    first = SharedCache(cache_path, 'account').token_bucket(2)
+    second = SharedCache(cache_path, 'account').token_bucket(2)
+    other = SharedCache(cache_path, 'other').token_bucket(2)
+
+    assert first.reserve() == 0
+    assert second.reserve() == 0
+    # the budget of the account is spent, whichever process asks
+    assert first.reserve() == pytest.approx(0.5)
+    assert second.reserve() == pytest.approx(1)
+    assert other.reserve() == 0
+
+    now[0] += 2
+    assert second.reserve() == 0
+
+
+def test_shared_cache_between_clients(tmpdir):
+    cache_path = str(tmpdir.join('cache.sqlite'))
+    records = [('_acme-challenge.example.com', 'v1'),
+               ('_acme-challenge.www.example.com', 'v2')]
+
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        with make_client(server, shared_cache=SharedCache(
+                cache_path, 'account')) as client:
+            client.add_txt_records(records)
+        server.calls.clear()
+
+        # another process finds the zones and the records' ids cached
+        with make_client(server, shared_cache=SharedCache(
+                cache_path, 'account')) as client:
+            client.del_txt_records(records)
+
+        assert server.records('example.com') == []
+        assert server.calls == {'Record.Remove': 2}
+        assert SharedCache(cache_path, 'account').get_record(
+            '_acme-challenge.example.com', 'v1') is None
+
+
+def test_shared_cache_holds_rate_limit_tokens(tmpdir):
+    cache_path = str(tmpdir.join('cache.sqlite'))
+
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        clients = [make_client(server, rate_limit=2,
+                               shared_cache=SharedCache(cache_path, 'a'))
+                   for _ in range(2)]
+
+        waits = [client.scheduler.reserve()
+                 for client in clients + clients]
+
+    assert waits[:2] == [0, 0]
+    assert waits[2] > 0 and waits[3] > waits[2]
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+from certbot_dns_dnspod.dnspod_client import DNSPodClient
+from certbot_dns_dnspod.fake_server import FakeDNSPodServer
+from certbot_dns_dnspod.singleflight import SingleFlight
+
+
+API_TOKEN = '1234,abcdefg'
+
+
+def make_client(server, **kwargs):
+    return DNSPodClient(API_TOKEN, 600, 'admin@example.com',
+                        base_url=server.base_url, **kwargs)
+
+
+@pytest.fixture
+def now(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('certbot_dns_dnspod.singleflight.time.time',
+                        lambda: clock[0])
+    return clock
+
+
+def run_concurrently(flight, func, count=5):
+    results = []
+    errors = []
+
+    def call():
+        try:
+            results.append(flight.do('key', 'example.com', func))
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results, errors
+
+
+def blocking(result=None, error=None):
+    release = threading.Event()
+    calls = []
+
+    def func():
+        calls.append(1)
+        release.wait(5)
+        if error is not None:
+            raise error
+        return result
+
+    # let every thread reach the call in flight before it returns
+    threading.Timer(0.2, release.set).start()
+
+    return func, calls
+
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight(ttl=0)
+    func, calls = blocking(result=['record'])
+
+    results, errors = run_concurrently(flight, func)
+
+    assert calls == [1]
+    assert results == [['record']] * 5
+    assert not errors
+
+
+def test_error_is_shared():
+    flight = SingleFlight(ttl=10)
+    error = ValueError('failed')
+    func, calls = blocking(error=error)
+
+    results, errors = run_concurrently(flight, func)
+
+    assert calls == [1]
+    assert not results
+    assert errors == [error] * 5
+
+    # errors are not cached
+    assert flight.do('key', 'example.com', lambda: 'ok') == 'ok'
+
+
+def test_result_is_cached(now):
+    flight = SingleFlight(ttl=2)
+
+    assert flight.do('key', 'example.com', lambda: 1) == 1
+    now[0] += 1
+    assert flight.do('key', 'example.com', lambda: 2) == 1
+    now[0] += 1
+    assert flight.do('key', 'example.com', lambda: 3) == 3
+
+
+def test_no_cache():
+    flight = SingleFlight(ttl=0)
+
+    assert flight.do('key', 'example.com', lambda: 1) == 1
+    assert flight.do('key', 'example.com', lambda: 2) == 2
+
+
+def test_invalidate(now):
+    flight = SingleFlight(ttl=10)
+    flight.do('com', 'example.com', lambda: 1)
+    flight.do('org', 'example.org', lambda: 1)
+
+    flight.invalidate('example.com')
+    assert flight.do('com', 'example.com', lambda: 2) == 2
+    assert flight.do('org', 'example.org', lambda: 2) == 1
+
+    flight.invalidate()
+    assert flight.do('com', 'example.com', lambda: 3) == 3
+    assert flight.do('org', 'example.org', lambda: 3) == 3
+
+
+def test_read_overlapping_invalidation_is_not_cached(now):
+    flight = SingleFlight(ttl=10)
+
+    def read():
+        flight.invalidate('example.com')
+        return 1
+
+    assert flight.do('key', 'example.com', read) == 1
+    assert flight.do('key', 'example.com', lambda: 2) == 2
+
+    flight.invalidate()
+
+    # invalidating every zone counts too
+    def read_all():
+        flight.invalidate()
+        return 3
+
+    assert flight.do('key', 'example.com', read_all) == 3
+    assert flight.do('key', 'example.com', lambda: 4) == 4
+
+
+def test_concurrent_identical_reads_are_coalesced():
+    with FakeDNSPodServer(zones=['example.com'], latency=0.2) as server:
+        with make_client(server, read_cache_ttl=0) as client:
+            threads = [threading.Thread(
+                target=lambda: list(client.iter_records('example.com')))
+                for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert server.calls['Record.List'] == 1
+
+
+def test_cached_reads_are_invalidated_by_changes():
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        with make_client(server) as client:
+            assert list(client.iter_records('example.com')) == []
+            assert list(client.iter_records('example.com')) == []
+            assert server.calls['Record.List'] == 1
+
+            client.add_txt_record('_acme-challenge.example.com', 'v1')
+            assert [record.value for record
+                    in client.iter_records('example.com')] == ['v1']
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from certbot.errors import PluginError
+
+from certbot_dns_dnspod import tencentcloud_client
+from certbot_dns_dnspod.fake_server import FakeDNSPodServer
+from certbot_dns_dnspod.journal import RecordJournal
+from certbot_dns_dnspod.tencentcloud_client import TC3Signer
+from certbot_dns_dnspod.tencentcloud_client import TencentCloudDNSPodClient
+
+
+SECRET_ID = 'AKIDexample'
+SECRET_KEY = 'secret'
+TTL = '600'
+CONTACT_EMAIL = 'admin@example.com'
+
+
+pytestmark = pytest.mark.usefixtures('no_retry_sleep')
+
+
+def make_server(**kwargs):
+    return FakeDNSPodServer(secret_id=SECRET_ID, secret_key=SECRET_KEY,
+                            **kwargs)
+
+
+def make_client(server, secret_key=SECRET_KEY, **kwargs):
+    return TencentCloudDNSPodClient(SECRET_ID, secret_key, TTL,
+                                    CONTACT_EMAIL, base_url=server.base_url,
+                                    **kwargs)
+
+
+def test_signing_key_derived_once_per_day(monkeypatch):
+    derived = []
+    hmac_sha256 = tencentcloud_client._hmac_sha256
+
+    def counting_hmac_sha256(key, msg):
+        derived.append(msg)
+        return hmac_sha256(key, msg)
+
+    monkeypatch.setattr(tencentcloud_client, '_hmac_sha256',
+                        counting_hmac_sha256)
+    signer = TC3Signer(SECRET_ID, SECRET_KEY)
+
+    first = signer.sign('dnspod.tencentcloudapi.com', b'{}', 1616457600)
+    second = signer.sign('dnspod.tencentcloudapi.com', b'{}', 1616457601)
+    assert derived == ['2021-03-23', 'dnspod', 'tc3_request']
+    assert first != second
+    assert first.startswith(
+        'TC3-HMAC-SHA256 Credential=AKIDexample/2021-03-23/dnspod/'
+        'tc3_request, SignedHeaders=content-type;host, Signature=')
+
+    signer.sign('dnspod.tencentcloudapi.com', b'{}', 1616457600 + 86400)
+    assert derived[3:] == ['2021-03-24', 'dnspod', 'tc3_request']
+
+
+def test_add_and_del_txt_records():
+    with make_server(zones=['example.com', 'example.org']) as server:
+        server.add_record('example.com', '_acme-challenge', 'old')
+
+        with make_client(server, max_concurrency=4) as client:
+            client.add_txt_records([
+                ('_acme-challenge.example.com', 'v1'),
+                ('_acme-challenge.www.example.org', 'v2'),
+            ])
+
+            assert sorted(r['value'] for r
+                          in server.records('example.com')) == ['old', 'v1']
+            assert [(r['name'], r['value']) for r
+                    in server.records('example.org')] == \
+                [('_acme-challenge.www', 'v2')]
+
+            client.del_txt_records([
+                ('_acme-challenge.example.com', 'v1'),
+                ('_acme-challenge.www.example.org', 'v2'),
+            ])
+
+        assert [r['value'] for r in server.records('example.com')] == ['old']
+        assert server.records('example.org') == []
+        assert server.calls == {
+            'DescribeDomainList': 1, 'DescribeRecordList': 4,
+            'CreateRecord': 2, 'DeleteRecord': 2}
+
+
+def test_modify_txt_record():
+    with make_server(zones=['example.com']) as server:
+        record_id = server.add_record('example.com', '_acme-challenge', 'old')
+
+        with make_client(server) as client:
+            client._modify_txt_record(record_id,
+                                      '_acme-challenge.example.com', 'new')
+
+        assert [r['value'] for r in server.records('example.com')] == ['new']
+
+
+def test_journaled_record_removed_by_hand_is_forgotten():
+    journal = RecordJournal()
+    journal.add('_acme-challenge.example.com', 'v1', '999', 'example.com')
+
+    with make_server(zones=['example.com']) as server:
+        with make_client(server, journal=journal) as client:
+            client.del_journaled_records()
+
+        assert len(journal) == 0
+        assert server.calls['DeleteRecord'] == 1
+
+
+def test_invalid_signature():
+    with make_server(zones=['example.com']) as server:
+        with make_client(server, secret_key='other') as client:
+            with pytest.raises(PluginError,
+                               match='AuthFailure.SignatureFailure'):
+                client.add_txt_record('_acme-challenge.example.com', 'v1')
+
+
+def test_rate_limit_is_retried():
+    with make_server(zones=['example.com'], rate_limit=1) as server:
+        with make_client(server, max_retries=2) as client:
+            with pytest.raises(PluginError, match='RequestLimitExceeded'):
+                client.add_txt_record('_acme-challenge.example.com', 'v1')
+
+        # the zone listing took the only token
+        assert server.calls['DescribeRecordList'] == 3
+
+
+def test_batch_add_and_del_txt_records():
+    with make_server(zones=['example.com']) as server:
+        records = [('_acme-challenge.a{0}.example.com'.format(i), 'v')
+                   for i in range(5)]
+
+        with make_client(server, batch=True) as client:
+            client.add_txt_records(records)
+            assert len(server.records('example.com')) == 5
+
+            client.del_txt_records(records)
+
+        assert server.records('example.com') == []
+        assert server.calls['CreateRecordBatch'] == 1
+        assert server.calls['DeleteRecordBatch'] == 1
+        assert server.calls['CreateRecord'] == 0
+        assert server.calls['DeleteRecord'] == 0
+
+
+def test_batch_add_txt_records_rolls_back_on_failure():
+    with make_server(zones=['example.com'],
+                     rejected_values=['bad']) as server:
+        with make_client(server, batch=True) as client:
+            with pytest.raises(PluginError, match='failed for 1 of 3'):
+                client.add_txt_records([
+                    ('_acme-challenge.a.example.com', 'v1'),
+                    ('_acme-challenge.b.example.com', 'bad'),
+                    ('_acme-challenge.c.example.com', 'v3'),
+                ])
+
+        assert server.records('example.com') == []
+        assert server.calls['DeleteRecordBatch'] == 1
+
+
+def test_batch_modify_txt_records():
+    with make_server(zones=['example.com']) as server:
+        ids = [server.add_record('example.com', '_acme-challenge', 'old')
+               for _ in range(2)]
+
+        with make_client(server) as client:
+            modified, failures = client.batch_modify_txt_records(
+                [('example.com', '_acme-challenge', record_id, 'new')
+                 for record_id in ids])
+
+        assert sorted(record_id for _, record_id in modified) == ids
+        assert failures == []
+        assert [r['value'] for r in server.records('example.com')] == \
+            ['new', 'new']
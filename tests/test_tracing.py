@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import time
+
+import pytest
+
+from certbot_dns_dnspod.dnspod_client import DNSPodClient
+from certbot_dns_dnspod.fake_server import FakeDNSPodServer
+from certbot_dns_dnspod.tracing import SamplingProfiler
+from certbot_dns_dnspod.tracing import Tracer
+
+
+def by_name(tracer):
+    return dict((span['name'], span) for span in tracer.spans)
+
+
+def test_nested_spans():
+    tracer = Tracer()
+
+    with tracer.span('perform', records=2) as root:
+        with tracer.span('list', zone='example.com') as child:
+            assert tracer.current_id() == child['id']
+        assert tracer.current_id() == root['id']
+    assert tracer.current_id() is None
+
+    spans = by_name(tracer)
+    assert spans['perform']['parent_id'] is None
+    assert spans['list']['parent_id'] == spans['perform']['id']
+    assert spans['list']['attrs'] == {'zone': 'example.com'}
+    assert spans['perform']['start'] <= spans['list']['start'] \
+        <= spans['list']['end'] <= spans['perform']['end']
+
+
+def test_span_records_error():
+    tracer = Tracer()
+
+    with pytest.raises(ValueError):
+        with tracer.span('create'):
+            raise ValueError('boom')
+
+    assert tracer.spans[0]['attrs']['error'] == 'ValueError: boom'
+
+
+def test_bind_keeps_parent_across_threads():
+    tracer = Tracer()
+
+    def work():
+        with tracer.span('create'):
+            pass
+
+    with tracer.span('perform'):
+        thread = threading.Thread(target=tracer.bind(work))
+        thread.start()
+        thread.join()
+        unbound = threading.Thread(target=work)
+        unbound.start()
+        unbound.join()
+
+    perform, bound_span, unbound_span = sorted(
+        tracer.spans, key=lambda span: span['id'])
+    assert bound_span['parent_id'] == perform['id']
+    assert unbound_span['parent_id'] is None
+    assert bound_span['thread_id'] != perform['thread_id']
+
+
+def test_spans_follow_asyncio_tasks():
+    asyncio = pytest.importorskip('asyncio')
+    tracer = Tracer()
+
+    async def child(name):
+        with tracer.span(name):
+            await asyncio.sleep(0)
+
+    async def root():
+        with tracer.span('perform'):
+            await asyncio.gather(child('a'), child('b'))
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(root())
+    finally:
+        loop.close()
+
+    spans = by_name(tracer)
+    assert spans['a']['parent_id'] == spans['perform']['id']
+    assert spans['b']['parent_id'] == spans['perform']['id']
+
+
+def test_trace_file(tmpdir):
+    path = str(tmpdir.join('trace.json'))
+    tracer = Tracer(path)
+
+    with tracer.span('perform'):
+        with tracer.span('list', zone='example.com'):
+            pass
+    tracer.flush()
+
+    with open(path) as f:
+        trace = json.load(f)
+
+    perform, listing = trace['traceEvents']
+    assert perform['name'] == 'perform'
+    assert perform['ph'] == 'X'
+    assert perform['dur'] >= listing['dur'] >= 0
+    assert listing['args'] == {'zone': 'example.com',
+                               'span_id': listing['args']['span_id'],
+                               'parent_id': perform['args']['span_id']}
+
+
+def test_client_spans():
+    tracer = Tracer()
+
+    with FakeDNSPodServer(zones=['example.com']) as server:
+        client = DNSPodClient('token', 600, 'admin@example.com',
+                              base_url=server.base_url, max_concurrency=4,
+                              tracer=tracer)
+        with client, tracer.span('perform'):
+            client.add_txt_records([
+                ('_acme-challenge.a.example.com', 'v1'),
+                ('_acme-challenge.b.example.com', 'v2'),
+            ])
+
+    spans = dict((span['id'], span) for span in tracer.spans)
+    names = sorted(span['name'] for span in spans.values())
+    assert names == ['Domain.List', 'Record.Create', 'Record.Create',
+                     'Record.List', 'create', 'create', 'list', 'perform',
+                     'zone_resolution']
+
+    def parent_name(span):
+        return spans[span['parent_id']]['name']
+
+    for span in spans.values():
+        if span['name'] in ('zone_resolution', 'list', 'create'):
+            assert parent_name(span) == 'perform'
+        elif span['name'] == 'Record.Create':
+            assert parent_name(span) == 'create'
+            assert span['attrs']['attempts'] == 1
+        elif span['name'] == 'Domain.List':
+            assert parent_name(span) == 'zone_resolution'
+
+
+def test_sampling_profiler(tmpdir):
+    path = str(tmpdir.join('profile.folded'))
+    profiler = SamplingProfiler(path, interval=0.001)
+
+    def busy_wait():
+        time.sleep(0.05)
+
+    with profiler.phase('perform'):
+        busy_wait()
+    profiler.flush()
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    assert lines
+    assert all(line.startswith('perform;') for line in lines)
+    assert any('test_tracing.busy_wait' in line for line in lines)
+    assert not any('dnspod-profiler' in line for line in lines)
+    assert sum(int(line.rsplit(' ', 1)[1]) for line in lines) \
+        == sum(profiler.stacks.values())
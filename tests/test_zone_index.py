@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+from certbot_dns_dnspod.zone_index import ZoneIndex
+
+
+def test_split_longest_suffix():
+    index = ZoneIndex({
+        'example.com': '1',
+        'dev.example.com': '2',
+        'example.com.cn': '3',
+        'example.co.uk': '4',
+    })
+
+    assert len(index) == 4
+    assert index.split('_acme-challenge.example.com') == \
+        ('_acme-challenge', 'example.com')
+    assert index.split('_acme-challenge.a.dev.example.com') == \
+        ('_acme-challenge.a', 'dev.example.com')
+    assert index.split('_acme-challenge.example.com.cn') == \
+        ('_acme-challenge', 'example.com.cn')
+    assert index.split('_acme-challenge.www.example.co.uk') == \
+        ('_acme-challenge.www', 'example.co.uk')
+
+
+def test_split_apex_and_case():
+    index = ZoneIndex({'Example.COM': '1'})
+
+    assert index.split('example.com.') == ('@', 'example.com')
+    assert index.split('_ACME-challenge.EXAMPLE.com') == \
+        ('_ACME-challenge', 'example.com')
+    assert index.zone_ids == {'example.com': '1'}
+
+
+def test_split_unknown_zone():
+    index = ZoneIndex({'example.com': '1'})
+
+    assert index.split('example.net') is None
+    assert index.split('com') is None
+    assert index.split('badexample.com') is None